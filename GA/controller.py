@@ -0,0 +1,253 @@
+# Receding-horizon GA controller
+# This module wraps the GeneticAlgorithm fitness function in a controller that is called once per control step.
+# Each step is warm-started from the elite of the previous step and stops early once the best fitness plateaus.
+# With a horizon, solutions are scored by rolling their feedback law forward over several control steps
+# with the real model parameters (GeneticAlgorithm.fitness_func_horizon).
+# If a Profile (Simulation.profiling) is attached, the GA time, generations and fitness calls of every step
+# and the time of the GA operators are recorded into it.
+# With a PolicyCache (GA.policy_cache), steps whose quantized state has been solved before reuse (or refine)
+# the cached genes instead of running the full GA.
+
+# Imports
+import time
+
+import numpy as np
+import pygad
+
+from GA.fitness_function import GeneticAlgorithm
+from GA.policy_cache import PolicyCache
+
+# GA settings used in the main notebook
+DEFAULT_GA_SETTINGS = dict(num_generations=30,
+                           num_parents_mating=10,
+                           sol_per_pop=100,
+                           num_genes=8,
+                           keep_parents=-1,
+                           save_solutions=False,
+                           init_range_low=0.0,
+                           init_range_high=1.0,
+                           gene_space=[(-10.0, 10.0)]*8,
+                           mutation_num_genes=2)
+
+
+def feedback_law(solution, x, y, z):
+    """
+    Linear state-feedback law of the GA genes.
+    s_1 = genes1 . [x, y, z] + genes1[3] and s_2 = genes2 . [x, y, z] + genes2[3], restricted to be non-negative.
+    """
+    genes1 = solution[0:4]
+    genes2 = solution[4:8]
+
+    s_1 = genes1[0]*x + genes1[1]*y + genes1[2]*z + genes1[3]
+    s_2 = genes2[0]*x + genes2[1]*y + genes2[2]*z + genes2[3]
+
+    # Restrict negative input
+    return max(0, s_1), max(0, s_2)
+
+
+class RecedingHorizonGA:
+    """
+    Receding-horizon controller around GeneticAlgorithm.
+    Parameters:
+    tolerance (float): smallest improvement of the best fitness that counts as progress.
+    patience (int): number of generations without progress before the step is stopped
+                    (None runs all generations of every step).
+    elite_fraction (float): fraction of the previous step's population (best first) used to seed the next step.
+    fitness_func: pygad fitness function (the batch function is used by default,
+                  the horizon function if horizon is given).
+    horizon (int or dict): number of control steps, or settings (see HORIZON_SETTINGS), of the horizon fitness.
+                           The environment passed to step must then contain 'params' and 'dt'.
+    cache (PolicyCache or dict): policy cache consulted before every step, or the keyword arguments of a new one
+                                 (with 'path', the cache file shared e.g. by the runs of a sweep).
+    ga_settings: keyword arguments passed to pygad.GA, overriding DEFAULT_GA_SETTINGS.
+    """
+    def __init__(self, tolerance=1e-6, patience=5, elite_fraction=0.1,
+                 fitness_func=None, random_seed=None, horizon=None, cache=None, **ga_settings):
+        self.tolerance = tolerance
+        self.patience = patience
+        self.elite_fraction = elite_fraction
+        self.rng = np.random.default_rng(random_seed)
+        self.cache = PolicyCache(**cache) if isinstance(cache, dict) else cache
+
+        if isinstance(horizon, int):
+            horizon = {'steps': horizon}
+        if fitness_func is None:
+            fitness_func = (GeneticAlgorithm.fitness_func_batch if horizon is None
+                            else GeneticAlgorithm.fitness_func_horizon)
+
+        settings = dict(DEFAULT_GA_SETTINGS, **ga_settings)
+        if fitness_func in (GeneticAlgorithm.fitness_func_batch, GeneticAlgorithm.fitness_func_horizon):
+            settings.setdefault('fitness_batch_size', settings['sol_per_pop'])
+        self.settings = settings
+
+        self.ga_instance = pygad.GA(fitness_func=self._timed_fitness(fitness_func),
+                                    on_start=GeneticAlgorithm.on_start,
+                                    on_fitness=GeneticAlgorithm.on_fitness,
+                                    on_parents=GeneticAlgorithm.on_parents,
+                                    on_crossover=GeneticAlgorithm.on_crossover,
+                                    on_mutation=GeneticAlgorithm.on_mutation,
+                                    on_generation=self._on_generation,
+                                    on_stop=GeneticAlgorithm.on_stop,
+                                    random_seed=random_seed,
+                                    **settings)
+        self.ga_instance.horizon = horizon
+
+        # Simulation.profiling.Profile receiving the GA timings (None to disable)
+        self.profile = None
+
+        # Generations used at each control step
+        self.generations_history = []
+
+        self._best_fitness = None
+        self._stale_generations = 0
+        self._generations = 0
+
+    def _timed_fitness(self, fitness_func):
+        """
+        Wrap the fitness function to count and time its calls when profiling.
+        """
+        def fitness(ga_instance, solutions, solutions_idx):
+            profile = self.profile
+            if profile is None:
+                return fitness_func(ga_instance, solutions, solutions_idx)
+
+            start = time.perf_counter()
+            result = fitness_func(ga_instance, solutions, solutions_idx)
+            profile.add_time('fitness', time.perf_counter() - start)
+            profile.count('fitness_calls')
+            profile.count('fitness_evaluations', len(solutions) if np.ndim(solutions) == 2 else 1)
+            return result
+        return fitness
+
+    def _on_generation(self, ga_instance):
+        """
+        Stop the run once the best fitness has not improved by more than tolerance for patience generations.
+        """
+        self._generations += 1
+        current_fitness = np.max(ga_instance.last_generation_fitness)
+
+        if self._best_fitness is None or current_fitness > self._best_fitness + self.tolerance:
+            self._best_fitness = current_fitness
+            self._stale_generations = 0
+        else:
+            self._stale_generations += 1
+
+        if self.patience is not None and self._stale_generations >= self.patience:
+            return "stop"
+
+    def _seed_population(self):
+        """
+        Build the initial population of the next step from the elite of the last population.
+        The rest of the population is drawn from the gene space, as pygad draws the first population.
+        """
+        ga = self.ga_instance
+        population = np.array(ga.population, dtype=float)
+
+        # Sort the last population by its fitness (best first) and keep the elite
+        order = np.argsort(ga.last_generation_fitness)[::-1]
+        num_elite = max(1, int(round(self.elite_fraction * len(population))))
+        elite = population[order[:num_elite]]
+
+        fresh = self._sample_genes(len(population) - num_elite, population.shape[1])
+        return np.vstack((elite, fresh))
+
+    def _sample_genes(self, num_solutions, num_genes):
+        """
+        Random solutions drawn like pygad's initial population: a value of the gene's list/tuple/range,
+        uniform between 'low' and 'high' for a dict, and uniform in the initial range without a gene space.
+        """
+        low, high = self.settings['init_range_low'], self.settings['init_range_high']
+        gene_space = self.settings.get('gene_space')
+        if gene_space is None:
+            return self.rng.uniform(low, high, size=(num_solutions, num_genes))
+        if all(np.isscalar(space) for space in gene_space):
+            # One list of values for all genes
+            gene_space = [gene_space] * num_genes
+
+        genes = np.empty((num_solutions, num_genes))
+        for gene, space in enumerate(gene_space):
+            if space is None:
+                genes[:, gene] = self.rng.uniform(low, high, size=num_solutions)
+            elif isinstance(space, dict):
+                genes[:, gene] = self.rng.uniform(space['low'], space['high'], size=num_solutions)
+            elif np.isscalar(space):
+                genes[:, gene] = space
+            else:
+                genes[:, gene] = self.rng.choice(np.asarray(list(space), dtype=float), size=num_solutions)
+        return genes
+
+    def _fitness(self, solution):
+        """
+        Fitness of a single solution in the current environment.
+        """
+        ga = self.ga_instance
+        if ga.fitness_batch_size not in (None, 1):
+            return float(np.ravel(ga.fitness_func(ga, np.asarray(solution)[None], [0]))[0])
+        return float(ga.fitness_func(ga, solution, 0))
+
+    def _cache_key(self, environment):
+        # The horizon fitness also depends on the model parameters and the step length
+        context = None
+        if self.ga_instance.horizon is not None:
+            context = tuple(environment['params']) + (environment['dt'],)
+        return self.cache.key([environment['x'], environment['y'], environment['z']], context)
+
+    def step(self, environment):
+        """
+        Run the GA for one control step.
+        environment: dict with the current 't', 'x', 'y', 'z' used by the fitness function
+                     (and 'params', 'dt' for the horizon fitness)
+        Returns the best solution, its fitness and the number of generations used.
+        """
+        ga = self.ga_instance
+
+        # Cached fitness values of the previous step belong to another environment
+        ga.last_generation_parents = None
+        ga.last_generation_elitism = None
+        ga.environment = environment
+        ga.profile = self.profile
+
+        cached = None
+        if self.cache is not None:
+            key = self._cache_key(environment)
+            cached = self.cache.get(key)
+            if self.profile is not None:
+                self.profile.count('cache_hits' if cached is not None else 'cache_misses')
+            if cached is not None and self.cache.mode == 'reuse':
+                # The cached genes were found at another state of the bin, so their fitness is evaluated here
+                genes = cached[0].copy()
+                self.generations_history.append(0)
+                return genes, self._fitness(genes), 0
+
+        if ga.last_generation_fitness is not None:
+            ga.population = self._seed_population()
+        if cached is not None:
+            # Refine the cached genes with a short run
+            population = np.array(ga.population, dtype=float)
+            population[0] = cached[0]
+            ga.population = population
+            num_generations, ga.num_generations = ga.num_generations, self.cache.refine_generations
+
+        self._best_fitness = None
+        self._stale_generations = 0
+        self._generations = 0
+
+        start = time.perf_counter()
+        try:
+            ga.run()
+        finally:
+            if cached is not None:
+                ga.num_generations = num_generations
+        if self.profile is not None:
+            elapsed = time.perf_counter() - start
+            self.profile.add_time('ga_step', elapsed)
+            self.profile.count('generations', self._generations)
+            self.profile.record('ga_time', elapsed)
+            self.profile.record('generations', self._generations)
+
+        best_solution, best_solution_fitness, _ = ga.best_solution(pop_fitness=ga.last_generation_fitness)
+        self.generations_history.append(self._generations)
+        if self.cache is not None:
+            self.cache.put(key, best_solution, best_solution_fitness)
+
+        return best_solution, best_solution_fitness, self._generations
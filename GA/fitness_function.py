@@ -1,12 +1,150 @@
 # Genetic Algorithm module
 # This version made to work with non-dimensional variables x, y, z
+# The horizon fitness function rolls every solution's feedback law forward over several control steps
+# with the real non-dimensional model parameters, for the whole population at once.
 
 import numpy as np
-import sys
-import os
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from Model.KP_model import dx_dt, dy_dt, dz_dt
+from Model.backends import get_backend
+
+# Default settings of the horizon fitness (ga_instance.horizon overrides them)
+HORIZON_SETTINGS = dict(steps=10,  # number of control steps in the horizon
+                        method='dopri',  # 'dopri' (adaptive step per solution) or 'rk4' (fixed steps)
+                        substeps=4,  # RK4 steps per control step
+                        rtol=1e-6, atol=1e-9,  # tolerances of the adaptive method
+                        discount=1.0,  # weight of step k is discount**k
+                        backend=None)  # integration backend (None for the fastest available)
+
+
+def stage_fitness(x_pred, y_pred, z_pred, s_1, s_2):
+    """
+    Objective of one control step (same weights as fitness_func), element-wise over arrays of solutions.
+    """
+    a1, a2 = 0.1, 0.1 # weights for immunotherapy components
+    b1, b2, b3, b4 = 0.1, 0.1, 0.1, 0.1  # weights for toxicity components
+
+    immunotherapy = a1*(x_pred) - a2*(y_pred)  # Reward high effector cells and low tumor cells
+    toxicity = b1*s_2 + b2*s_1 + b3*(x_pred*s_2) + b4*(z_pred)**2  # Penalty for IL-2 overdose
+
+    c1, c2 = 1.0, 3.0
+
+    return c1*immunotherapy - c2*toxicity
+
+def advance_population(backend, states, params, t0, t1, alive, method='dopri', substeps=4, rtol=1e-6, atol=1e-9,
+                       max_steps=10000):
+    """
+    Advance a batch of states (one row per solution) from t0 to t1 with the backend ensemble kernels.
+    method: 'dopri' (adaptive step per row) or 'rk4' (substeps fixed steps)
+    alive: boolean mask of the rows still integrated, updated in place; rows with non-finite states or doses
+           and rows whose adaptive step collapsed or that need more than max_steps steps (huge doses make
+           the model very stiff or diverge) are dropped.
+    Returns the new states (rows that are not alive keep their last value).
+    """
+    def advance(rows):
+        if method == 'rk4':
+            return backend.rk4(states[rows], params[rows], t0, t1, int(substeps))
+        return backend.dopri(states[rows], params[rows], t0, t1, rtol, atol, np.inf, max_steps)
+
+    alive &= np.all(np.isfinite(states), axis=1) & np.all(np.isfinite(params), axis=1)
+    rows = np.flatnonzero(alive)
+    if len(rows) == 0:
+        return states
+
+    states = states.copy()
+    try:
+        states[rows] = advance(rows)
+    except RuntimeError:
+        # A diverging or very stiff row stopped the batch, integrate the rows one by one
+        for i in rows:
+            try:
+                states[i] = advance([i])[0]
+            except RuntimeError:
+                alive[i] = False
+    return states
+
+
+def predicted_fitness(solutions, t, x, y, z):
+    """
+    Objective of fitness_func for an array of solutions (..., 8), with NumPy array operations.
+    t, x, y, z: current time and state, scalars or arrays broadcasting against solutions[..., 0]
+    (e.g. (S, 1) states of S scenarios for (S, P, 8) populations)
+    """
+    # Extract gene columns from the solutions of the GA
+    genes1 = solutions[..., 0:4]
+    genes2 = solutions[..., 4:8]
+
+    # Calculate s_1 and s_2 for every solution based on genes and current state
+    s_1 = genes1[..., 0]*x + genes1[..., 1]*y + genes1[..., 2]*z + genes1[..., 3]
+    s_2 = genes2[..., 0]*x + genes2[..., 1]*y + genes2[..., 2]*z + genes2[..., 3]
+
+    # Restrict negative input
+    s_1 = np.maximum(0, s_1)
+    s_2 = np.maximum(0, s_2)
+
+    E_input = s_1  # Effector cell input from GA
+    IL_input = s_2  # IL-2 input from GA
+
+    t_step = 1  # time step for prediction
+
+    # The model equations are element-wise, so they predict every solution at once
+    x_pred = x + dx_dt(t=t,x=x, y=y, z=z,
+                       c=0.02, mu_2=0.03, p_1=0.1245, g_1=2e4, s_1=E_input) * t_step
+
+    y_pred = y + dy_dt(t=t, y=y, x=x, z=z,
+                      r_2=0.18, b=1e-5, alpha=0.002, g_2=1e5) * t_step
+
+    z_pred = z + dz_dt(t=t, z=z, x=x, y=y,
+                      p_2=5e-7, g_3=1e4, mu_3=10, s_2=IL_input) * t_step
+
+    return stage_fitness(x_pred, y_pred, z_pred, s_1, s_2) # final fitness
+
+def horizon_fitness(solutions, states, params, dt, settings=None):
+    """
+    Objective of fitness_func_horizon for one row per solution, each with its own start state and parameters.
+    solutions: (N, 8) genes
+    states: (N, 3) states [x, y, z] at the start of the horizon
+    params: (N, 13) non-dimensional model parameters (kp_coupled order), the doses are overwritten
+    dt: length of a control step
+    settings: horizon settings overriding HORIZON_SETTINGS
+    """
+    settings = dict(HORIZON_SETTINGS, **(settings or {}))
+    backend = get_backend(settings['backend'])
+
+    num_solutions = solutions.shape[0]
+    states = np.array(states, dtype=float)
+    params = np.array(params, dtype=float)
+
+    # Extract gene columns from the solutions of the GA
+    genes1 = solutions[:, 0:4]
+    genes2 = solutions[:, 4:8]
+
+    total = np.zeros(num_solutions)
+    weight = 0.0
+    alive = np.ones(num_solutions, dtype=bool)
+    for k in range(int(settings['steps'])):
+        # Feedback law of every solution at its predicted state, restricted to non-negative input
+        s_1 = np.maximum(0, np.sum(genes1[:, :3]*states, axis=1) + genes1[:, 3])
+        s_2 = np.maximum(0, np.sum(genes2[:, :3]*states, axis=1) + genes2[:, 3])
+        params[:, 4] = s_1
+        params[:, 12] = s_2
+
+        # Rollouts that blew up (e.g. from huge doses) are dropped and scored as the worst solutions
+        states = advance_population(backend, states, params, k*dt, (k + 1)*dt, alive, settings['method'],
+                                    settings['substeps'], settings['rtol'], settings['atol'])
+        if not alive.any():
+            break
+
+        w = settings['discount']**k
+        with np.errstate(over='ignore', invalid='ignore'):
+            total += w*stage_fitness(states[:, 0], states[:, 1], states[:, 2], s_1, s_2)
+        weight += w
+
+    fitness = total / weight
+    fitness[~alive | ~np.isfinite(fitness)] = -np.inf
+
+    return fitness
+
 
 class GeneticAlgorithm:
     """
@@ -71,20 +209,70 @@ class GeneticAlgorithm:
 
         return fitness
 
-    def on_start(self, ga_instance):
-        print("on_start()")
+    def fitness_func_batch(ga_instance, solutions, solutions_idx):
+        """
+        Batch fitness function scoring a whole population matrix at once.
+        Same objective as fitness_func, computed with NumPy array operations on the (pop, 8) solutions.
+        Use with pygad's batch interface, e.g. fitness_batch_size=sol_per_pop.
+        """
+        environment = ga_instance.environment
+        solutions = np.asarray(solutions, dtype=float).reshape(-1, 8)
+        return predicted_fitness(solutions, environment['t'], environment['x'], environment['y'], environment['z'])
+
+    def fitness_func_horizon(ga_instance, solutions, solutions_idx):
+        """
+        Receding-horizon (model-predictive) batch fitness function.
+        Every solution's feedback law is rolled forward from the current state over horizon['steps'] control
+        steps of length environment['dt'], with the non-dimensional model parameters environment['params']
+        (kp_coupled order). At each step the dose is computed from the predicted state and held constant,
+        as in the closed-loop simulation, and the whole population is advanced together by the backend kernels.
+        The adaptive method is the default since the model becomes very stiff when y is small (dz/dy grows
+        like 1/(g_3 + y)^2), where fixed RK4 steps blow up.
+        The fitness is the discounted mean of stage_fitness over the horizon.
+        Settings are taken from ga_instance.horizon (see HORIZON_SETTINGS).
+        """
+        environment = ga_instance.environment
+        if 'params' not in environment or 'dt' not in environment:
+            raise ValueError("The horizon fitness needs 'params' and 'dt' in the GA environment.")
+        settings = dict(HORIZON_SETTINGS, **(getattr(ga_instance, 'horizon', None) or {}))
+
+        solutions = np.asarray(solutions, dtype=float).reshape(-1, 8)
+        num_solutions = solutions.shape[0]
 
-    def on_fitness(self, population_fitness):
-        print("on_fitness()")
+        # One row of states and parameters per solution
+        states = np.tile([environment['x'], environment['y'], environment['z']], (num_solutions, 1)).astype(float)
+        params = np.tile(np.asarray(environment['params'], dtype=float), (num_solutions, 1))
 
-    def on_parents(self, selected_parents):
-        print("on_parents()")
+        return horizon_fitness(solutions, states, params, float(environment['dt']), settings)
 
-    def on_crossover(self, ga_instance, offspring_crossover):
-        print("on_crossover()")
+    # Hooks of the GA run, they record the GA phases into ga_instance.profile (Simulation.profiling) if it is set.
+    # pygad calls them in the order on_start, then per generation on_fitness, on_parents, on_crossover,
+    # on_mutation (the new population is evaluated after on_mutation), and on_stop at the end of the run.
 
-    def on_mutation(self, ga_instance, offspring_mutation):
-        print("on_mutation()")
+    def on_start(ga_instance):
+        profile = getattr(ga_instance, 'profile', None)
+        if profile is not None:
+            profile.count('ga_runs')
+
+    def on_fitness(ga_instance, population_fitness):
+        profile = getattr(ga_instance, 'profile', None)
+        if profile is not None:
+            profile.mark('ga')
+
+    def on_parents(ga_instance, selected_parents):
+        profile = getattr(ga_instance, 'profile', None)
+        if profile is not None:
+            profile.lap('ga', 'ga_selection')
+
+    def on_crossover(ga_instance, offspring_crossover):
+        profile = getattr(ga_instance, 'profile', None)
+        if profile is not None:
+            profile.lap('ga', 'ga_crossover')
+
+    def on_mutation(ga_instance, offspring_mutation):
+        profile = getattr(ga_instance, 'profile', None)
+        if profile is not None:
+            profile.lap('ga', 'ga_mutation')
 
     def on_generation(ga_instance):
 
@@ -95,8 +283,11 @@ class GeneticAlgorithm:
         #print(f"Generation {ga_instance.generations_completed}: Best Fitness = {current_fitness}")
 
         ga_instance.last_fitness = current_fitness
-    def on_stop(self, ga_instance, last_population_fitness):
-        print("on_stop()")
+
+    def on_stop(ga_instance, last_population_fitness):
+        profile = getattr(ga_instance, 'profile', None)
+        if profile is not None:
+            profile.count('ga_runs_completed')
 
     def run(self, environment):
         self.ga_instance.environment = environment
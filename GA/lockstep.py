@@ -0,0 +1,205 @@
+# Lockstep GA
+# This module runs the per-step GA of many closed-loop scenarios at once on a stacked (S, P, G) gene tensor
+# (S scenarios, P solutions, G genes), as used by the lockstep simulation (Simulation.lockstep).
+# It follows the pygad configuration of the receding-horizon controller (GA.controller): steady-state parent
+# selection, single-point crossover, random mutation from the gene space, one elite solution, warm start
+# from the elite of the previous step, and early stopping once the best fitness of a scenario plateaus.
+# Selection, crossover, mutation and fitness are NumPy operations over all scenarios that are still running.
+
+# Imports
+import time
+
+import numpy as np
+
+from GA.controller import DEFAULT_GA_SETTINGS
+from GA.fitness_function import horizon_fitness, predicted_fitness
+
+# GA settings the lockstep GA implements (the pygad-only settings of DEFAULT_GA_SETTINGS have no effect)
+SETTINGS = ('num_generations', 'num_parents_mating', 'sol_per_pop', 'num_genes', 'init_range_low', 'init_range_high',
+            'gene_space', 'mutation_num_genes', 'keep_elitism', 'random_mutation_min_val', 'random_mutation_max_val')
+
+class LockstepGA:
+    """
+    GA of S scenarios advanced together, one step per control step.
+    Parameters as in GA.controller.RecedingHorizonGA:
+    tolerance (float): smallest improvement of the best fitness that counts as progress.
+    patience (int): number of generations without progress before a scenario stops (None runs all generations).
+    elite_fraction (float): fraction of the previous step's population (best first) used to seed the next step.
+    horizon (int or dict): number of control steps, or settings (see HORIZON_SETTINGS), of the horizon fitness
+                           (None for the one-step fitness of fitness_func_batch).
+    ga_settings: GA settings overriding DEFAULT_GA_SETTINGS (num_generations, num_parents_mating, sol_per_pop,
+                 num_genes, init_range_low, init_range_high, gene_space, mutation_num_genes, keep_elitism,
+                 random_mutation_min_val, random_mutation_max_val); other settings (e.g. cache, fitness_func or
+                 other pygad settings) raise a ValueError.
+    """
+    def __init__(self, num_scenarios, tolerance=1e-6, patience=5, elite_fraction=0.1, random_seed=None,
+                 horizon=None, **ga_settings):
+        unknown = set(ga_settings) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"Unsupported lockstep GA settings {sorted(unknown)}. Choose from {list(SETTINGS)}.")
+        if isinstance(horizon, int):
+            horizon = {'steps': horizon}
+        settings = dict(DEFAULT_GA_SETTINGS, **ga_settings)
+
+        self.num_scenarios = num_scenarios
+        self.tolerance = tolerance
+        self.patience = patience
+        self.elite_fraction = elite_fraction
+        self.horizon = horizon
+        self.settings = settings
+        self.rng = np.random.default_rng(random_seed)
+
+        self.num_generations = int(settings['num_generations'])
+        self.num_solutions = int(settings['sol_per_pop'])
+        self.num_genes = int(settings['num_genes'])
+        self.num_parents = int(settings['num_parents_mating'])
+        self.num_elite = int(settings.get('keep_elitism', 1))
+        self.mutation_num_genes = int(settings['mutation_num_genes'])
+        self._gene_space(settings.get('gene_space'))
+
+        # Simulation.profiling.Profile receiving the GA timings (None to disable)
+        self.profile = None
+
+        self.population = self._initial_population()
+        self.fitness = None
+
+    def _gene_space(self, gene_space):
+        """
+        Split the gene space into discrete values and continuous ranges per gene.
+        A gene space entry is a list/tuple/range of values or a dict with 'low' and 'high' (as in pygad).
+        """
+        self._values = [None] * self.num_genes
+        self._low = np.full(self.num_genes, np.nan)
+        self._high = np.full(self.num_genes, np.nan)
+        if gene_space is None:
+            self._additive = True
+            return
+        self._additive = False
+        for gene, space in enumerate(gene_space):
+            if isinstance(space, dict):
+                self._low[gene], self._high[gene] = space['low'], space['high']
+            else:
+                self._values[gene] = np.asarray(list(space), dtype=float)
+
+    def _sample_genes(self, shape):
+        """
+        Random genes of shape (..., G) drawn from the gene space.
+        """
+        u = self.rng.random(shape + (self.num_genes,))
+        genes = self._low + u*(self._high - self._low)
+        for gene, values in enumerate(self._values):
+            if values is not None:
+                genes[..., gene] = values[np.minimum((u[..., gene]*len(values)).astype(int), len(values) - 1)]
+        return genes
+
+    def _initial_population(self, num_solutions=None):
+        shape = (self.num_scenarios, self.num_solutions if num_solutions is None else num_solutions)
+        if self._additive:
+            return self.rng.uniform(self.settings['init_range_low'], self.settings['init_range_high'],
+                                    size=shape + (self.num_genes,))
+        return self._sample_genes(shape)
+
+    def _seed_population(self):
+        """
+        Initial population of the next step: the elite of the last population of every scenario,
+        the rest drawn as the first population (from the gene space).
+        """
+        order = np.argsort(-self.fitness, axis=1, kind='stable')
+        num_elite = max(1, int(round(self.elite_fraction * self.num_solutions)))
+        elite = np.take_along_axis(self.population, order[:, :num_elite, None], axis=1)
+        fresh = self._initial_population(self.num_solutions - num_elite)
+        return np.concatenate((elite, fresh), axis=1)
+
+    def _evaluate(self, population, rows, environment):
+        """
+        Fitness (R, P) of the populations of the scenarios rows.
+        """
+        states = environment['states'][rows]
+        if self.horizon is None:
+            x, y, z = (states[:, i, None] for i in range(3))
+            fitness = predicted_fitness(population, environment['t'], x, y, z)
+        else:
+            num_rows, num_solutions = population.shape[:2]
+            fitness = horizon_fitness(population.reshape(-1, self.num_genes),
+                                      np.repeat(states, num_solutions, axis=0),
+                                      np.repeat(environment['params'][rows], num_solutions, axis=0),
+                                      float(environment['dt']), self.horizon).reshape(num_rows, num_solutions)
+        # nan fitness (e.g. overflow) counts as the worst
+        return np.where(np.isnan(fitness), -np.inf, fitness)
+
+    def _next_generation(self, population, fitness):
+        """
+        Steady-state selection of the parents, single-point crossover, random mutation and elitism,
+        for the populations (R, P, G) of the running scenarios.
+        """
+        num_rows = population.shape[0]
+        order = np.argsort(-fitness, axis=1, kind='stable')
+        parents = np.take_along_axis(population, order[:, :self.num_parents, None], axis=1)
+        elite = np.take_along_axis(population, order[:, :self.num_elite, None], axis=1)
+
+        # Offspring k mates parents k and k + 1 (cyclic), cut at a random gene
+        num_offspring = self.num_solutions - self.num_elite
+        k = np.arange(num_offspring)
+        first = parents[:, k % self.num_parents]
+        second = parents[:, (k + 1) % self.num_parents]
+        points = self.rng.integers(0, self.num_genes, size=(num_rows, num_offspring))
+        offspring = np.where(np.arange(self.num_genes) < points[..., None], first, second)
+
+        # Mutate mutation_num_genes distinct genes of every offspring
+        ranks = np.argsort(self.rng.random((num_rows, num_offspring, self.num_genes)), axis=2)
+        mutate = np.zeros(offspring.shape, dtype=bool)
+        np.put_along_axis(mutate, ranks[..., :self.mutation_num_genes], True, axis=2)
+        if self._additive:
+            noise = self.rng.uniform(self.settings.get('random_mutation_min_val', -1.0),
+                                     self.settings.get('random_mutation_max_val', 1.0), size=offspring.shape)
+            offspring = np.where(mutate, offspring + noise, offspring)
+        else:
+            offspring = np.where(mutate, self._sample_genes((num_rows, num_offspring)), offspring)
+
+        return np.concatenate((elite, offspring), axis=1)
+
+    def step(self, environment):
+        """
+        Run the GA of every scenario for one control step.
+        environment: dict with 't', 'states' (S, 3) of [x, y, z], and 'params' (S, 13) and 'dt' for the horizon fitness
+        Returns the best solutions (S, G), their fitness (S,) and the generations used (S,).
+        """
+        start = time.perf_counter()
+        if self.fitness is not None:
+            self.population = self._seed_population()
+
+        population = self.population
+        fitness = self._evaluate(population, np.arange(self.num_scenarios), environment)
+
+        best = np.full(self.num_scenarios, -np.inf)
+        stale = np.zeros(self.num_scenarios, dtype=int)
+        generations = np.zeros(self.num_scenarios, dtype=int)
+        running = np.ones(self.num_scenarios, dtype=bool)
+
+        for _ in range(self.num_generations):
+            rows = np.flatnonzero(running)
+            if len(rows) == 0:
+                break
+            population[rows] = self._next_generation(population[rows], fitness[rows])
+            fitness[rows] = self._evaluate(population[rows], rows, environment)
+            generations[rows] += 1
+
+            # Early stopping per scenario, as RecedingHorizonGA._on_generation
+            current = fitness[rows].max(axis=1)
+            progress = (generations[rows] == 1) | (current > best[rows] + self.tolerance)
+            best[rows] = np.where(progress, current, best[rows])
+            stale[rows] = np.where(progress, 0, stale[rows] + 1)
+            if self.patience is not None:
+                running[rows] = stale[rows] < self.patience
+
+        self.population = population
+        self.fitness = fitness
+
+        winner = np.argmax(fitness, axis=1)
+        solutions = population[np.arange(self.num_scenarios), winner]
+        if self.profile is not None:
+            elapsed = time.perf_counter() - start
+            self.profile.add_time('ga_step', elapsed)
+            self.profile.count('generations', int(generations.sum()))
+            self.profile.record('ga_time', elapsed)
+        return solutions, fitness[np.arange(self.num_scenarios), winner], generations
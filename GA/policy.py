@@ -0,0 +1,284 @@
+# Offline policy optimization
+# This module optimizes the linear feedback law of the GA genes once for a whole trajectory, instead of
+# re-running the GA at every control step. A policy is a short schedule of gene vectors, each used from its
+# switch day on, scored by the mean stage fitness of closed-loop rollouts over one or more parameter sets.
+# Rollouts of a whole CMA-ES population are integrated together with the backend ensemble kernels
+# and split over a process pool.
+# Optimized policies are saved as JSON and applied to new parameters with Simulation.simulation.run_policy.
+
+# Imports
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from GA.controller import feedback_law
+
+# Continuous box of the policy genes searched by CMA-ES. The per-step GA (GA.controller) has a different,
+# discrete gene space: pygad reads its gene_space entries (-10.0, 10.0) as the two values -10 and 10.
+POLICY_BOUNDS = (-10.0, 10.0)
+
+
+class Policy:
+    """
+    Schedule of gene vectors of the linear feedback law.
+    genes: (K, 8) array, row k is used from switch_days[k-1] on (row 0 from the start)
+    switch_days: K-1 increasing times (days)
+    metadata: dict describing how the policy was obtained (objective, training parameters, ...)
+    """
+    def __init__(self, genes, switch_days=(), metadata=None):
+        self.genes = np.atleast_2d(np.asarray(genes, dtype=float))
+        self.switch_days = np.asarray(switch_days, dtype=float).reshape(-1)
+        self.metadata = dict(metadata or {})
+
+        if self.genes.shape[1] != 8:
+            raise ValueError(f"Policy genes must have 8 columns, got {self.genes.shape[1]}.")
+        if len(self.switch_days) != len(self.genes) - 1:
+            raise ValueError(f"A policy with {len(self.genes)} gene vectors needs {len(self.genes) - 1} switch days.")
+
+    def genes_at(self, day):
+        """
+        Gene vector used at time day (days).
+        """
+        return self.genes[np.searchsorted(self.switch_days, day, side='right')]
+
+    def dose(self, day, x, y, z):
+        """
+        Non-dimensional s_1 and s_2 at time day (days) and state x, y, z.
+        """
+        return feedback_law(self.genes_at(day), x, y, z)
+
+    def to_dict(self):
+        return {'genes': self.genes.tolist(), 'switch_days': self.switch_days.tolist(), 'metadata': self.metadata}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['genes'], data.get('switch_days', ()), data.get('metadata'))
+
+    def save(self, path):
+        """
+        Save the policy as JSON.
+        """
+        from Simulation.output import atomic_write
+        from Simulation.trajectory_store import json_safe
+        atomic_write(path, lambda file: json.dump(json_safe(self.to_dict()), file, indent=2))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            return cls.from_dict(json.load(file))
+
+
+# Batched rollouts
+
+def _rollout_chunk(task):
+    """
+    Mean stage fitness of the closed-loop rollouts of a chunk of policies (executed in a worker process).
+    """
+    genes, switch_days, params, t, tau, backend, rtol, atol = task
+
+    from GA.fitness_function import advance_population, stage_fitness
+    from Model.backends import get_backend
+
+    backend = get_backend(backend)
+    n = len(genes)
+    num_steps = len(tau)
+
+    # Schedule index of every step (the dose of step k is chosen at t[k-1])
+    schedule = np.searchsorted(switch_days, t[:-1], side='right')
+
+    # Initial non-dimensional x, y, z values are 1.0
+    states = np.ones((n, 3))
+    params = np.tile(np.asarray(params, dtype=float), (n, 1))
+    alive = np.ones(n, dtype=bool)
+    total = np.zeros(n)
+
+    for step in range(1, num_steps):
+        g = genes[:, schedule[step-1]]
+        s_1 = np.maximum(0, np.sum(g[:, 0:3]*states, axis=1) + g[:, 3])
+        s_2 = np.maximum(0, np.sum(g[:, 4:7]*states, axis=1) + g[:, 7])
+        params[:, 4] = s_1
+        params[:, 12] = s_2
+
+        states = advance_population(backend, states, params, tau[step-1], tau[step], alive, rtol=rtol, atol=atol)
+        if not alive.any():
+            break
+        with np.errstate(over='ignore', invalid='ignore'):
+            total += stage_fitness(states[:, 0], states[:, 1], states[:, 2], s_1, s_2)
+
+    objective = total / (num_steps - 1)
+    objective[~alive | ~np.isfinite(objective)] = -np.inf
+    return objective
+
+
+def evaluate_policies(genes, switch_days, scenarios=None, settings=None, executor=None, chunk_size=64,
+                      backend=None, rtol=1e-6, atol=1e-9):
+    """
+    Whole-trajectory objective of a batch of policies.
+    genes: (N, K, 8) array of gene schedules
+    switch_days: K-1 switch times (days) shared by all policies
+    scenarios: list of dicts of dimensional parameters overriding DEFAULT_PARAMETERS (default: one default set)
+    settings: dict of simulation settings overriding DEFAULT_SETTINGS
+    executor: concurrent.futures executor for the rollouts (None runs them in this process)
+    Returns the (N,) mean stage fitness over all steps and scenarios (-inf for diverging rollouts).
+    """
+    from Model.backends import get_backend
+    from Simulation.parameters import DEFAULT_PARAMETERS, DEFAULT_SETTINGS, scaled_parameters, time_grid
+
+    genes = np.asarray(genes, dtype=float)
+    switch_days = np.asarray(switch_days, dtype=float).reshape(-1)
+    scenarios = scenarios or [{}]
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    backend = backend or get_backend().name
+
+    tasks = []
+    for scenario in scenarios:
+        p = dict(DEFAULT_PARAMETERS, **scenario)
+        params, _ = scaled_parameters(p)
+        t, tau = time_grid(p, settings)
+        tasks += [(genes[start:start + chunk_size], switch_days, params, t, tau, backend, rtol, atol)
+                  for start in range(0, len(genes), chunk_size)]
+
+    if executor is None:
+        results = [_rollout_chunk(task) for task in tasks]
+    else:
+        results = list(executor.map(_rollout_chunk, tasks))
+
+    return np.concatenate(results).reshape(len(scenarios), len(genes)).mean(axis=0)
+
+
+# CMA-ES
+
+def _mirror(x, low, high):
+    # Reflect samples into the box [low, high]
+    width = high - low
+    x = np.mod(x - low, 2*width)
+    return low + np.where(x > width, 2*width - x, x)
+
+
+def cma_es(objective, x0, sigma0, bounds=POLICY_BOUNDS, popsize=None, max_generations=100, tol=1e-6, seed=None,
+           callback=None):
+    """
+    Maximize objective with the covariance matrix adaptation evolution strategy (Hansen's tutorial version,
+    with rank-one and rank-mu updates and cumulative step-size adaptation).
+    objective: function of a (popsize, d) array of candidates returning a (popsize,) array
+    bounds: (low, high) box of every coordinate, samples outside are reflected into it
+    tol: stop once sigma times the largest axis of the search distribution is below tol
+    callback: function called as callback(generation, best_x, best_f, sigma) after every generation
+    Returns the best candidate, its objective value and the number of generations.
+    """
+    rng = np.random.default_rng(seed)
+    mean = np.asarray(x0, dtype=float).copy()
+    n = len(mean)
+    low, high = bounds
+    sigma = float(sigma0)
+
+    # Strategy parameters
+    lam = popsize or 4 + int(3*np.log(n))
+    mu = lam // 2
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= weights.sum()
+    mueff = 1/np.sum(weights**2)
+    cc = (4 + mueff/n)/(n + 4 + 2*mueff/n)
+    cs = (mueff + 2)/(n + mueff + 5)
+    c1 = 2/((n + 1.3)**2 + mueff)
+    cmu = min(1 - c1, 2*(mueff - 2 + 1/mueff)/((n + 2)**2 + mueff))
+    damps = 1 + 2*max(0, np.sqrt((mueff - 1)/(n + 1)) - 1) + cs
+    chi_n = np.sqrt(n)*(1 - 1/(4*n) + 1/(21*n**2))
+
+    pc, ps = np.zeros(n), np.zeros(n)
+    B, D, C = np.eye(n), np.ones(n), np.eye(n)
+    best_x, best_f = mean.copy(), -np.inf
+
+    generation = 0
+    while generation < max_generations:
+        generation += 1
+
+        # Sample the population, reflected into the bounds
+        x = _mirror(mean + sigma*(rng.standard_normal((lam, n))*D) @ B.T, low, high)
+        y = (x - mean)/sigma
+        f = np.asarray(objective(x), dtype=float)
+        f[np.isnan(f)] = -np.inf
+
+        order = np.argsort(-f)
+        if f[order[0]] > best_f:
+            best_x, best_f = x[order[0]].copy(), f[order[0]]
+
+        # Recombination
+        y_sel = y[order[:mu]]
+        y_w = weights @ y_sel
+        mean = mean + sigma*y_w
+
+        # Evolution paths
+        inv_sqrt_c = B @ np.diag(1/D) @ B.T
+        ps = (1 - cs)*ps + np.sqrt(cs*(2 - cs)*mueff)*(inv_sqrt_c @ y_w)
+        hsig = np.linalg.norm(ps)/np.sqrt(1 - (1 - cs)**(2*generation))/chi_n < 1.4 + 2/(n + 1)
+        pc = (1 - cc)*pc + hsig*np.sqrt(cc*(2 - cc)*mueff)*y_w
+
+        # Covariance matrix and step size
+        C = ((1 - c1 - cmu)*C + c1*(np.outer(pc, pc) + (1 - hsig)*cc*(2 - cc)*C)
+             + cmu*(y_sel.T*weights) @ y_sel)
+        sigma *= np.exp((cs/damps)*(np.linalg.norm(ps)/chi_n - 1))
+
+        C = (C + C.T)/2
+        eigenvalues, B = np.linalg.eigh(C)
+        D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+        if callback is not None:
+            callback(generation, best_x, best_f, sigma)
+        if sigma*D.max() < tol:
+            break
+
+    return best_x, best_f, generation
+
+
+def optimize_policy(parameters=None, settings=None, num_schedule=1, x0=None, sigma0=2.0, popsize=None,
+                    max_generations=100, seed=None, workers=None, backend=None, rtol=1e-6, atol=1e-9, path=None,
+                    verbose=True):
+    """
+    Optimize a fixed policy (or a schedule of num_schedule gene vectors) against the whole trajectory.
+    parameters: dict, or list of dicts, of dimensional parameters overriding DEFAULT_PARAMETERS;
+                the objective is averaged over all of them (e.g. several c values for a policy that generalizes)
+    settings: dict of simulation settings overriding DEFAULT_SETTINGS
+    num_schedule: number of gene vectors, switching at equally spaced days of the simulation
+    x0: initial gene vector(s), (8,) or (num_schedule, 8) (default no treatment, all genes 0)
+    workers: number of worker processes (default os.cpu_count())
+    path: save the policy as JSON to path
+    Returns the optimized Policy.
+    """
+    from Simulation.parameters import time_grid
+
+    scenarios = parameters if isinstance(parameters, (list, tuple)) else [parameters or {}]
+    scenarios = [dict(scenario) for scenario in scenarios]
+
+    t, _ = time_grid(scenarios[0], settings)
+    switch_days = np.linspace(0, t[-1], num_schedule + 1)[1:-1]
+
+    x0 = np.zeros((num_schedule, 8)) if x0 is None else np.broadcast_to(np.asarray(x0, dtype=float),
+                                                                        (num_schedule, 8))
+
+    def log(generation, best_x, best_f, sigma):
+        if verbose:
+            print(f"Generation {generation}: best objective {best_f:.6g}, sigma {sigma:.3g}")
+
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        def objective(candidates):
+            return evaluate_policies(candidates.reshape(-1, num_schedule, 8), switch_days, scenarios, settings,
+                                     executor=executor, chunk_size=max(1, -(-len(candidates) // workers)),
+                                     backend=backend, rtol=rtol, atol=atol)
+
+        best_x, best_f, generations = cma_es(objective, x0.reshape(-1), sigma0, popsize=popsize,
+                                             max_generations=max_generations, seed=seed, callback=log)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    policy = Policy(best_x.reshape(num_schedule, 8), switch_days,
+                    {'objective': best_f, 'generations': generations, 'parameters': scenarios,
+                     'settings': settings, 'seed': seed, 'sigma0': sigma0, 'popsize': popsize})
+    if path is not None:
+        policy.save(path)
+    return policy
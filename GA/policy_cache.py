@@ -0,0 +1,131 @@
+# Policy cache
+# This module memoizes the per-step GA of the receding-horizon controller (GA.controller).
+# The GA problem of a control step only depends on the current state (and, for the horizon fitness, on the model
+# parameters and the step length), and oscillating trajectories keep revisiting the same region of state space.
+# The cache maps a quantized log-state to the best genes found there. On a hit the controller reuses the genes,
+# or seeds a short refinement run with them. Entries are evicted least recently used first.
+# A cache can be shared by the runs of a sweep (one object, or one file that every run loads and merges into).
+
+# Imports
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+MODES = ('reuse', 'refine')
+
+
+class PolicyCache:
+    """
+    LRU cache of GA solutions keyed on the quantized log10 of the state.
+    resolution: bin width of the log10 state in decades (0.05 puts values within about 12 % in the same bin)
+    floor: values below floor (including 0 and small negative values) share the bin of floor
+    max_size: largest number of entries, the least recently used entry is dropped beyond it
+    mode: 'reuse' returns the cached genes on a hit, 'refine' seeds a run of refine_generations generations with them
+    refine_generations: generations of the refinement run of mode 'refine'
+    path: optional file the cache is loaded from (if it exists) and saved to by save()
+    """
+    def __init__(self, resolution=0.05, floor=1e-12, max_size=10000, mode='reuse', refine_generations=3,
+                 path=None):
+        if mode not in MODES:
+            raise ValueError(f"Invalid cache mode '{mode}'. Choose from {list(MODES)}.")
+        self.resolution = resolution
+        self.floor = floor
+        self.max_size = max_size
+        self.mode = mode
+        self.refine_generations = refine_generations
+        self.path = path
+
+        self.entries = OrderedDict()  # key -> (genes, fitness), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path is not None and os.path.exists(path):
+            self.merge(PolicyCache.load(path))
+
+    def to_dict(self):
+        return {'resolution': self.resolution, 'floor': self.floor, 'max_size': self.max_size, 'mode': self.mode,
+                'refine_generations': self.refine_generations, 'path': self.path}
+
+    def key(self, state, context=None):
+        """
+        Cache key of a state [x, y, z]: the bin indices of log10(max(state, floor)).
+        context: optional tuple of other values the GA problem depends on (e.g. parameters), compared exactly
+        """
+        logs = np.log10(np.maximum(np.asarray(state, dtype=float), self.floor))
+        bins = tuple(int(b) for b in np.floor(logs / self.resolution))
+        return bins if context is None else bins + tuple(float(value) for value in context)
+
+    def get(self, key):
+        """
+        Cached (genes, fitness) of key, or None. Counts the hit or miss.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, genes, fitness):
+        self.entries[key] = (np.array(genes, dtype=float), float(fitness))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def merge(self, other):
+        """
+        Add the entries of another cache that are not in this one (as least recently used).
+        """
+        if (other.resolution, other.floor) != (self.resolution, self.floor):
+            raise ValueError("Policy caches with different resolution or floor have incompatible keys.")
+        new = [(key, entry) for key, entry in other.entries.items() if key not in self.entries]
+        self.entries = OrderedDict(new + list(self.entries.items()))
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self.entries), 'evictions': self.evictions}
+
+    def report(self):
+        stats = self.stats()
+        return (f"Policy cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({100*stats['hit_rate']:.1f} % hit rate), {stats['size']} entries, {stats['evictions']} evictions")
+
+    def clear_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def save(self, path=None):
+        """
+        Save the cache as JSON (to self.path by default).
+        Entries saved to the file in the meantime (e.g. by other runs of a sweep) are merged in first.
+        """
+        from Simulation.output import atomic_write
+
+        path = path or self.path
+        if path is None:
+            raise ValueError("The policy cache has no path to save to.")
+        if os.path.exists(path):
+            self.merge(PolicyCache.load(path))
+
+        data = dict(self.to_dict(), path=None,
+                    entries=[{'key': list(key), 'genes': genes.tolist(), 'fitness': fitness}
+                             for key, (genes, fitness) in self.entries.items()])
+        atomic_write(path, lambda file: json.dump(data, file))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            data = json.load(file)
+        cache = cls(**{name: data[name] for name in ('resolution', 'floor', 'max_size', 'mode', 'refine_generations')})
+        for entry in data['entries']:
+            key = tuple(int(v) for v in entry['key'][:3]) + tuple(float(v) for v in entry['key'][3:])
+            cache.entries[key] = (np.array(entry['genes'], dtype=float), float(entry['fitness']))
+        return cache
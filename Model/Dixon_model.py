@@ -1,10 +1,11 @@
 # Dixon model
 # This is another immunotherapy model involving IL-2, CD4+, CD8+ and NK cells.
-# the Dixon model is unused but the project could be expanded to include it later.
+# the Dixon model is unused by the simulations but can be integrated through DixonModel (Model.models),
+# e.g. kp_integrate(model='dixon').
 
 import numpy as np
-import pandas as pd
-import pygad
+
+from Model.models import ODEModel
 
 # Dixon eqs. 1-4
 def dixon_dI_dt(beta, C1, I, mu_0, s):
@@ -55,4 +56,76 @@ def dixon_dT_dt(T, alpha, C2, sigma, K):
 
     """   
     dT_dt = sigma*T*(1 - T/K) - alpha*C2*T
-    return dT_dt
\ No newline at end of file
+    return dT_dt
+
+def dixon_coupled_batch(t, states, params):
+    """
+    Batched Dixon model functions.
+    states: array (N, 4) of [I, C1, C2, T]
+    params: array (N, 12) of [beta, mu_0, s, k_1, mu_1, k_2, mu_2, sigma, g, alpha, r, K]
+    (r is the tumor growth rate, called sigma in dixon_dT_dt)
+    Returns an array (N, 4) of the derivatives.
+    """
+    I, C1, C2, T = states.T
+    beta, mu_0, s, k_1, mu_1, k_2, mu_2, sigma, g, alpha, r, K = params.T
+
+    derivs = np.empty_like(states)
+    derivs[:, 0] = dixon_dI_dt(beta, C1, I, mu_0, s)
+    derivs[:, 1] = dixon_dC1_dt(k_1, C1, T, mu_1)
+    derivs[:, 2] = dixon_dC2_dt(k_2, C2, T, mu_2, sigma, I, g)
+    derivs[:, 3] = dixon_dT_dt(T, alpha, C2, r, K)
+    return derivs
+
+def dixon_jacobian_batch(t, states, params):
+    """
+    Batched closed-form Jacobian of dixon_coupled_batch, an array (N, 4, 4).
+    """
+    I, C1, C2, T = states.T
+    beta, mu_0, s, k_1, mu_1, k_2, mu_2, sigma, g, alpha, r, K = params.T
+
+    jac = np.zeros((states.shape[0], 4, 4))
+    jac[:, 0, 0] = -mu_0
+    jac[:, 0, 1] = beta
+    jac[:, 1, 1] = k_1*T - mu_1
+    jac[:, 1, 3] = k_1*C1
+    jac[:, 2, 0] = (sigma*C2*g)/(g + I)**2
+    jac[:, 2, 2] = k_2*T + (sigma*I)/(g + I) - mu_2
+    jac[:, 2, 3] = k_2*C2
+    jac[:, 3, 2] = -alpha*T
+    jac[:, 3, 3] = r*(1 - 2*T/K) - alpha*C2
+    return jac
+
+def dixon_kernel(t, y, p, out):
+    """
+    Dixon right-hand side of a single trajectory written into out, in plain loops for the compiled backend.
+    """
+    I, C1, C2, T = y[0], y[1], y[2], y[3]
+    out[0] = p[0]*C1 - p[1]*I + p[2]
+    out[1] = p[3]*C1*T - p[4]*C1
+    out[2] = p[5]*C2*T + (p[7]*C2*I)/(p[8] + I) - p[6]*C2
+    out[3] = p[10]*T*(1 - T/p[11]) - p[9]*C2*T
+
+class DixonModel(ODEModel):
+    """
+    Dixon model: IL-2 I, CD4+ cells C1, CD8+ and NK cells C2 and tumor cells T, with the IL-2 source s as dose.
+    The model keeps its form under scaling, so nondim returns parameters of the same model.
+    """
+    name = 'dixon'
+    state_names = ('I', 'C1', 'C2', 'T')
+    param_names = ('beta', 'mu_0', 's', 'k_1', 'mu_1', 'k_2', 'mu_2', 'sigma', 'g', 'alpha', 'r', 'K')
+    dose_names = ('s',)
+    positive_states = ('C1', 'C2', 'T')
+
+    # Units as (time exponent, exponents of the [I, C1, C2, T] scales)
+    units = {
+        'beta': (-1, [-1, 1, 0, 0]), 'mu_0': (-1, [0, 0, 0, 0]), 's': (-1, [-1, 0, 0, 0]),
+        'k_1': (-1, [0, 0, 0, 1]), 'mu_1': (-1, [0, 0, 0, 0]), 'k_2': (-1, [0, 0, 0, 1]),
+        'mu_2': (-1, [0, 0, 0, 0]), 'sigma': (-1, [0, 0, 0, 0]), 'g': (0, [-1, 0, 0, 0]),
+        'alpha': (-1, [0, 0, 1, 0]), 'r': (-1, [0, 0, 0, 0]), 'K': (0, [0, 0, 0, -1]),
+    }
+
+    rhs = staticmethod(dixon_coupled_batch)
+    jacobian = staticmethod(dixon_jacobian_batch)
+    kernel = staticmethod(dixon_kernel)
+
+MODEL = DixonModel()
@@ -3,6 +3,13 @@
 # effector cells (x), tumor cells (y), and IL-2 concentration (z).
 # There is then a coupled function for integration that uses these equations.
 # It also includes a non-dimensionalization function for the model parameters and a growth function (r_2, unused).
+# A batched version of the coupled function evaluates many trajectories at once for ensemble integration.
+# The closed-form Jacobian of the coupled function is used by the implicit (stiff) solvers.
+# KPModel puts the equations on the model layer of Model.models (MODEL is the instance used by the integrators).
+
+import numpy as np
+
+from Model.models import ODEModel
 
 # Non-dimensionalization function
 def nondim(E0=None, T0=None, IL0=None, t_s=None, c_in=None, 
@@ -90,3 +97,116 @@ def kp_coupled(t, state,
     dzdt = dz_dt(t, z, x, y, p_2, g_3, mu_3, s_2)
 
     return [dxdt, dydt, dzdt]
+
+def kp_jacobian(t, state,
+                c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2):
+    """
+    Closed-form Jacobian of kp_coupled with respect to [x, y, z].
+    Takes the same arguments as kp_coupled and returns a 3x3 array.
+    """
+    x, y, z = state # Unpack state variables
+
+    jac = np.zeros((3, 3))
+
+    # d(dxdt)/d[x, y, z]
+    jac[0, 0] = -mu_2 + (p_1*z)/(g_1 + z)
+    jac[0, 1] = c
+    jac[0, 2] = (p_1*x*g_1)/(g_1 + z)**2
+
+    # d(dydt)/d[x, y, z]
+    jac[1, 0] = -(alpha*y)/(g_2 + y)
+    jac[1, 1] = r_2*(1 - 2*b*y) - (alpha*x*g_2)/(g_2 + y)**2
+
+    # d(dzdt)/d[x, y, z]
+    jac[2, 0] = (p_2*y)/(g_3 + y)
+    jac[2, 1] = (p_2*x*g_3)/(g_3 + y)**2
+    jac[2, 2] = -mu_3
+
+    return jac
+
+def kp_coupled_batch(t, states, params):
+    """
+    Batched coupled KP model functions for ensemble integration.
+    Variables:
+    t: time (scalar or array of length N)
+    states: array (N, 3) of [x, y, z] for each trajectory
+    params: array (N, 13) of [c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2]
+    Returns an array (N, 3) of [dxdt, dydt, dzdt].
+    """
+    x, y, z = states.T # Unpack state columns
+    c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2 = params.T # Unpack parameter columns
+
+    # The scalar equations are plain arithmetic, so they act element-wise on the columns
+    derivs = np.empty_like(states)
+    derivs[:, 0] = dx_dt(t, x, y, z, c, mu_2, p_1, g_1, s_1)
+    derivs[:, 1] = dy_dt(t, y, x, z, r_2, b, alpha, g_2)
+    derivs[:, 2] = dz_dt(t, z, x, y, p_2, g_3, mu_3, s_2)
+
+    return derivs
+
+def kp_jacobian_batch(t, states, params):
+    """
+    Batched closed-form Jacobian of kp_coupled.
+    states: array (N, 3), params: array (N, 13) in kp_coupled order
+    Returns an array (N, 3, 3).
+    """
+    x, y, z = states.T
+    c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2 = params.T
+
+    jac = np.zeros((states.shape[0], 3, 3))
+    jac[:, 0, 0] = -mu_2 + (p_1*z)/(g_1 + z)
+    jac[:, 0, 1] = c
+    jac[:, 0, 2] = (p_1*x*g_1)/(g_1 + z)**2
+    jac[:, 1, 0] = -(alpha*y)/(g_2 + y)
+    jac[:, 1, 1] = r_2*(1 - 2*b*y) - (alpha*x*g_2)/(g_2 + y)**2
+    jac[:, 2, 0] = (p_2*y)/(g_3 + y)
+    jac[:, 2, 1] = (p_2*x*g_3)/(g_3 + y)**2
+    jac[:, 2, 2] = -mu_3
+
+    return jac
+
+def kp_kernel(t, y, p, out):
+    """
+    KP right-hand side of a single trajectory written into out, in plain loops for the compiled backend.
+    p = [c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2]
+    """
+    x, yy, z = y[0], y[1], y[2]
+    out[0] = p[0]*yy - p[1]*x + (p[2]*x*z)/(p[3] + z) + p[4]
+    out[1] = p[5]*yy*(1 - p[6]*yy) - (p[7]*x*yy)/(p[8] + yy)
+    out[2] = (p[9]*x*yy)/(p[10] + yy) - p[11]*z + p[12]
+
+class KPModel(ODEModel):
+    """
+    Non-dimensional KP model: effector cells x, tumor cells y and IL-2 z.
+    The dimensional model (Model.KP_model_dim) has the same equations, so the units also rescale this model.
+    """
+    name = 'kp'
+    state_names = ('x', 'y', 'z')
+    param_names = ('c', 'mu_2', 'p_1', 'g_1', 's_1', 'r_2', 'b', 'alpha', 'g_2', 'p_2', 'g_3', 'mu_3', 's_2')
+    dose_names = ('s_1', 's_2')
+    positive_states = ('x', 'y')  # effector and tumor cells (x only for c >= 0 and s_1 >= 0, see check_positive)
+
+    # Units as (time exponent, exponents of the [effector, tumor, IL-2] scales), same scaling as nondim
+    units = {
+        'c': (-1, [-1, 1, 0]), 'mu_2': (-1, [0, 0, 0]), 'p_1': (-1, [0, 0, 0]), 'g_1': (0, [0, 0, -1]),
+        's_1': (-1, [-1, 0, 0]), 'r_2': (-1, [0, 0, 0]), 'b': (0, [0, 1, 0]), 'alpha': (-1, [1, -1, 0]),
+        'g_2': (0, [0, -1, 0]), 'p_2': (-1, [1, 0, -1]), 'g_3': (0, [0, -1, 0]), 'mu_3': (-1, [0, 0, 0]),
+        's_2': (-1, [0, 0, -1]),
+    }
+
+    def check_positive(self, names, params):
+        # x stays positive only without negative antigenicity c or effector source s_1 (dx/dt = c*y + s_1 at x = 0)
+        params = np.asarray(params, dtype=float)
+        for name in ('c', 's_1'):
+            if self.state_names[0] in names and np.any(params[..., self.param_names.index(name)] < 0):
+                raise ValueError(f"{self.state_names[0]} can cross 0 with {name} < 0, so it cannot be integrated "
+                                 f"in log coordinates. Integrate it linearly, e.g. "
+                                 f"log_states={tuple(self.positive_states[1:])}.")
+
+    rhs = staticmethod(kp_coupled_batch)
+    jacobian = staticmethod(kp_jacobian_batch)
+    coupled = staticmethod(kp_coupled)
+    jacobian_single = staticmethod(kp_jacobian)
+    kernel = staticmethod(kp_kernel)
+
+MODEL = KPModel()
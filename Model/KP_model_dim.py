@@ -1,12 +1,11 @@
 # Dimensional Kirschner-Panetta model equations
-# (unused)
+# The scalar equations are kept for reference; KPDimModel integrates the dimensional model on the model layer
+# (Model.models) and converts it to the non-dimensional KP model with nondim.
 
 # Imports
 import numpy as np
-import pandas as pd
-import pygad
 
-from Model.KP_model import r_2
+from Model.KP_model import KPModel, MODEL as KP_MODEL, r_2
 
 # Kirschner-Panetta eqs. 1-3
 def kp_dE_dt(t, E, T, I_L, s_1, c, mu_2, p_1, g_1):
@@ -19,15 +18,38 @@ def kp_dE_dt(t, E, T, I_L, s_1, c, mu_2, p_1, g_1):
 def kp_dT_dt(t, T, E, alpha, g_2, growth_function=1, eta=1, W=1, x=0, y=0):
     """
     Equation for tumor cells.
+    W: carrying capacity of the tumor (used by the logistic growth function)
     """
     carry_cap = W
-    growth = r_2(growth_function=growth_function, eta=eta, W=carry_cap, x=T, y=y)
+    growth = r_2(growth_function, x=E, y=T, z=0, b=1/carry_cap)
     dT_dt = growth*T - (alpha*E*T)/(g_2 + T)
     return dT_dt
 
 def kp_dIL_dt(t, IL, E, T, IL_input, s_2, p_2, mu_3, g_3):
     """
     Equation for IL-2 in the single tumor site being modelled.
-    """ 
+    """
     dIL_dt = (p_2*E*T)/(g_3 + T) - mu_3*IL + s_2 + IL_input
     return dIL_dt
+
+class KPDimModel(KPModel):
+    """
+    Dimensional KP model: effector cells E, tumor cells T and IL-2 IL, with rates in days^-1.
+    The parameters are in the same order as the non-dimensional model (Model.KP_model.KPModel).
+    """
+    name = 'kp_dim'
+    state_names = ('E', 'T', 'IL')
+    positive_states = ('E', 'T')
+    scaled = KP_MODEL
+
+    def nondim(self, params, state_scales, t_s=None):
+        """
+        Parameters of the non-dimensional KP model for the scales [E0, T0, IL0] and the time scale t_s
+        (default r_2, as in Simulation.parameters).
+        """
+        if t_s is None:
+            t_s = np.asarray(params, dtype=float)[..., self.param_names.index('r_2')]
+            t_s = t_s[..., None] if np.ndim(t_s) else t_s
+        return super().nondim(params, state_scales, t_s)
+
+MODEL = KPDimModel()
@@ -0,0 +1,316 @@
+# Integration backends
+# This module holds a registry of right-hand side and integration kernels for the KP model.
+# A backend provides a batched RHS, a fixed-step RK4 loop and an adaptive Dormand-Prince loop that
+# each run a whole control interval without returning to Python.
+# The "numba" backend JIT-compiles the kernels when numba is installed; the "numpy" backend is the
+# pure NumPy fallback built on kp_coupled_batch and the vectorized integrator of Model.integration.
+# The same kernels are built for the other models of Model.models from their batched rhs and scalar kernel.
+# numba is only imported when a backend is first requested, since importing it takes longer than the
+# rest of the simulation imports.
+
+# Imports
+import numpy as np
+
+# Registered backends of the KP model by name
+_BACKENDS = {}
+# Backends of the other models by (backend name, model name), built on first use
+_MODEL_BACKENDS = {}
+_numba_loaded = False
+
+
+class Backend:
+    """
+    Set of batched model kernels.
+    rhs(t, states, params) -> (N, n) derivatives
+    rk4(states, params, t0, t1, n_steps) -> (N, n) states at t1 after n_steps fixed RK4 steps
+    dopri(states, params, t0, t1, rtol, atol, max_step, max_steps=0) -> (N, n) states at t1 (adaptive RK45,
+        RuntimeError if a trajectory needs more than max_steps steps, 0 for no limit)
+    states are (N, n) arrays and params are (N, P) arrays in the order of the model
+    (for the KP model [x, y, z] and the kp_coupled order).
+    """
+    def __init__(self, name, rhs, rk4, dopri, model='kp'):
+        self.name = name
+        self.rhs = rhs
+        self.rk4 = rk4
+        self.dopri = dopri
+        self.model = model
+
+    def __repr__(self):
+        return f"Backend('{self.name}')" if self.model == 'kp' else f"Backend('{self.name}', model='{self.model}')"
+
+
+def register_backend(name, rhs, rk4, dopri):
+    """
+    Register a KP backend under name (replaces an existing backend with the same name).
+    """
+    _BACKENDS[name] = Backend(name, rhs, rk4, dopri)
+    return _BACKENDS[name]
+
+
+def available_backends():
+    """
+    Names of the registered backends.
+    """
+    _load_numba()
+    return list(_BACKENDS)
+
+
+def get_backend(name=None, model=None):
+    """
+    Return a registered backend.
+    name: backend name, or None for the fastest available one (numba if installed, else numpy)
+    model: model name or ODEModel (Model.models), None for the KP model. Other models have the numpy backend
+           and, if they define a kernel, the numba backend.
+    """
+    if isinstance(name, Backend):
+        return name
+    if name != "numpy":
+        _load_numba()
+    if name is None:
+        name = "numba" if "numba" in _BACKENDS else "numpy"
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. Available backends: {available_backends()}")
+
+    if model is None or model == 'kp':
+        return _BACKENDS[name]
+    return _model_backend(name, model)
+
+
+def _model_backend(name, model):
+    """
+    Backend name of a model other than KP, built from its batched rhs (numpy) or its kernel (numba).
+    Models with the KP equations (e.g. the dimensional KP model) use the KP backends.
+    """
+    from Model.KP_model import MODEL as KP_MODEL
+    from Model.models import get_model
+
+    model = get_model(model)
+    if model.rhs is KP_MODEL.rhs and model.kernel is KP_MODEL.kernel:
+        return _BACKENDS[name]
+    key = (name, model.name)
+    if key not in _MODEL_BACKENDS:
+        if name == "numpy":
+            kernels = _numpy_kernels(model.rhs)
+        elif name == "numba" and model.kernel is not None:
+            import numba
+            kernels = [numba.njit(kernel) for kernel in _loop_kernels(numba.njit(model.kernel))]
+        else:
+            raise ValueError(f"Backend '{name}' is not available for the {model.name} model.")
+        _MODEL_BACKENDS[key] = Backend(name, *kernels, model=model.name)
+    return _MODEL_BACKENDS[key]
+
+
+# NumPy backend
+
+def _numpy_kernels(fun):
+    """
+    rhs, rk4 and dopri kernels of the batched right-hand side fun(t, states, params).
+    """
+    def rk4(states, params, t0, t1, n_steps):
+        """
+        Fixed-step RK4 over [t0, t1] for all trajectories at once.
+        """
+        y = np.array(states, dtype=float)
+        h = (t1 - t0) / n_steps
+        t = t0
+        for _ in range(n_steps):
+            k1 = fun(t, y, params)
+            k2 = fun(t + h/2, y + h/2*k1, params)
+            k3 = fun(t + h/2, y + h/2*k2, params)
+            k4 = fun(t + h, y + h*k3, params)
+            y = y + h/6*(k1 + 2*k2 + 2*k3 + k4)
+            t += h
+        return y
+
+    def dopri(states, params, t0, t1, rtol, atol, max_step, max_steps=0):
+        """
+        Adaptive Dormand-Prince over [t0, t1] with per-trajectory error control.
+        """
+        from Model.integration import dopri_batch
+
+        return dopri_batch(fun, (t0, t1), states, params, rtol=rtol, atol=atol, max_step=max_step,
+                           max_steps=max_steps)
+
+    return fun, rk4, dopri
+
+
+def _numpy_rhs(t, states, params):
+    from Model.KP_model import kp_coupled_batch
+
+    return kp_coupled_batch(t, states, params)
+
+
+register_backend("numpy", *_numpy_kernels(_numpy_rhs))
+
+
+# Compiled backend (plain loops, so numba can compile them without Python objects)
+
+# Dormand-Prince tableau (same as scipy's RK45)
+_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1])
+_A = np.array([
+    [0, 0, 0, 0, 0],
+    [1/5, 0, 0, 0, 0],
+    [3/40, 9/40, 0, 0, 0],
+    [44/45, -56/15, 32/9, 0, 0],
+    [19372/6561, -25360/2187, 64448/6561, -212/729, 0],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+])
+_B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84])
+_E = np.array([-71/57600, 0, 71/16695, -71/1920, 17253/339200, -22/525, 1/40])
+
+
+def _loop_kernels(rhs):
+    """
+    rhs, rk4 and dopri loops over the trajectories for the single-trajectory kernel rhs(t, y, p, out)
+    (e.g. Model.KP_model.kp_kernel), to be compiled by numba together with the kernel.
+    """
+    def loop_rhs(t, states, params):
+        out = np.empty_like(states)
+        for i in range(states.shape[0]):
+            rhs(t, states[i], params[i], out[i])
+        return out
+
+    def loop_rk4(states, params, t0, t1, n_steps):
+        n, m = states.shape
+        out = np.empty_like(states)
+        k1 = np.empty(m)
+        k2 = np.empty(m)
+        k3 = np.empty(m)
+        k4 = np.empty(m)
+        tmp = np.empty(m)
+        h = (t1 - t0) / n_steps
+
+        for i in range(n):
+            y = states[i].copy()
+            p = params[i]
+            t = t0
+            for _ in range(n_steps):
+                rhs(t, y, p, k1)
+                for j in range(m):
+                    tmp[j] = y[j] + h/2*k1[j]
+                rhs(t + h/2, tmp, p, k2)
+                for j in range(m):
+                    tmp[j] = y[j] + h/2*k2[j]
+                rhs(t + h/2, tmp, p, k3)
+                for j in range(m):
+                    tmp[j] = y[j] + h*k3[j]
+                rhs(t + h, tmp, p, k4)
+                for j in range(m):
+                    y[j] += h/6*(k1[j] + 2*k2[j] + 2*k3[j] + k4[j])
+                t += h
+            out[i] = y
+        return out
+
+    def loop_dopri(states, params, t0, t1, rtol, atol, max_step, max_steps=0):
+        n, m = states.shape
+        out = np.empty_like(states)
+        K = np.empty((7, m))
+        tmp = np.empty(m)
+        y_new = np.empty(m)
+
+        for i in range(n):
+            y = states[i].copy()
+            p = params[i]
+            t = t0
+            rhs(t, y, p, K[0])
+
+            # Initial step (same rule as solve_ivp)
+            d0 = 0.0
+            d1 = 0.0
+            for j in range(m):
+                scale = atol + abs(y[j])*rtol
+                d0 += (y[j]/scale)**2
+                d1 += (K[0, j]/scale)**2
+            d0 = np.sqrt(d0/m)
+            d1 = np.sqrt(d1/m)
+            h0 = 1e-6 if (d0 < 1e-5 or d1 < 1e-5) else 0.01*d0/d1
+            h0 = min(h0, t1 - t0)
+            for j in range(m):
+                tmp[j] = y[j] + h0*K[0, j]
+            rhs(t + h0, tmp, p, K[1])
+            d2 = 0.0
+            for j in range(m):
+                scale = atol + abs(y[j])*rtol
+                d2 += ((K[1, j] - K[0, j])/scale)**2
+            d2 = np.sqrt(d2/m)/h0
+            if d1 <= 1e-15 and d2 <= 1e-15:
+                h1 = max(1e-6, h0*1e-3)
+            else:
+                h1 = (0.01/max(d1, d2))**(1/5)
+            h = min(100*h0, h1, t1 - t0, max_step)
+
+            rejected = False
+            num_steps = 0
+            while t < t1:
+                h = min(h, t1 - t)
+                if h < 10*abs(np.nextafter(t, np.inf) - t):
+                    raise RuntimeError("Required step size is less than spacing between numbers.")
+                num_steps += 1
+                if max_steps > 0 and num_steps > max_steps:
+                    raise RuntimeError("Too many steps (the problem is likely stiff or diverging).")
+
+                # Runge-Kutta stages
+                for s in range(1, 6):
+                    for j in range(m):
+                        acc = 0.0
+                        for r in range(s):
+                            acc += _A[s, r]*K[r, j]
+                        tmp[j] = y[j] + h*acc
+                    rhs(t + _C[s]*h, tmp, p, K[s])
+                for j in range(m):
+                    acc = 0.0
+                    for r in range(6):
+                        acc += _B[r]*K[r, j]
+                    y_new[j] = y[j] + h*acc
+                rhs(t + h, y_new, p, K[6])
+
+                # Error norm
+                error_norm = 0.0
+                for j in range(m):
+                    acc = 0.0
+                    for r in range(7):
+                        acc += _E[r]*K[r, j]
+                    scale = atol + max(abs(y[j]), abs(y_new[j]))*rtol
+                    error_norm += (h*acc/scale)**2
+                error_norm = np.sqrt(error_norm/m)
+
+                if error_norm < 1:
+                    factor = 10.0 if error_norm == 0 else min(10.0, 0.9*error_norm**(-1/5))
+                    if rejected:
+                        factor = min(1.0, factor)
+                    t = t1 if t1 - (t + h) <= 1e-12*max(abs(t1), 1.0) else t + h
+                    for j in range(m):
+                        y[j] = y_new[j]
+                        K[0, j] = K[6, j]
+                    rejected = False
+                else:
+                    factor = max(0.2, 0.9*error_norm**(-1/5))
+                    rejected = True
+                h = min(h*factor, max_step)
+
+            out[i] = y
+        return out
+
+    return loop_rhs, loop_rk4, loop_dopri
+
+
+def _load_numba():
+    """
+    Register the compiled KP backend on first use (the kernels are compiled on their first call).
+    """
+    global _numba_loaded
+    if _numba_loaded:
+        return
+    _numba_loaded = True
+
+    try:
+        import numba
+    except ImportError:  # numba is optional
+        return
+
+    from Model.KP_model import kp_kernel
+
+    # No on-disk cache: numba keys it on the source of the loop closures, not on the kernel they capture,
+    # so an edited kernel could keep running stale compiled code
+    kernels = _loop_kernels(numba.njit(kp_kernel))
+    register_backend("numba", *[numba.njit(kernel) for kernel in kernels])
@@ -0,0 +1,535 @@
+# Numerical continuation
+# This module traces the equilibria and limit cycles of the non-dimensional KP model as one parameter
+# (antigenicity c by default) varies, to build bifurcation diagrams without long brute-force simulations.
+# Equilibria are followed by pseudo-arclength continuation, Hopf points are detected from the Jacobian eigenvalues
+# and the limit cycles born there are continued by single shooting with the monodromy matrix.
+# The shooting right-hand side is compiled with numba when it is installed.
+# Branches are followed in log coordinates w = log([x, y, z]), since y spans several orders of magnitude
+# along them; the Jacobian in log coordinates is similar to kp_jacobian at equilibria, so eigenvalues are unchanged.
+# Only the tumor-present equilibria (x, y, z > 0) are followed; the tumor-free equilibrium is always unstable.
+
+# Imports
+import numpy as np
+from scipy.integrate import solve_ivp
+from scipy.optimize import brentq
+
+from Model.KP_model import kp_coupled, kp_jacobian
+
+try:
+    import numba
+except ImportError:  # numba is optional
+    numba = None
+
+# Parameter positions in the kp_coupled parameter list
+PARAMETER_INDEX = {name: i for i, name in enumerate(
+    ['c', 'mu_2', 'p_1', 'g_1', 's_1', 'r_2', 'b', 'alpha', 'g_2', 'p_2', 'g_3', 'mu_3', 's_2'])}
+
+# Branches stop when a state variable leaves [exp(-LOG_LIMIT), exp(LOG_LIMIT)]
+LOG_LIMIT = 100
+
+
+# Model in log coordinates
+
+def _log_rhs(w, params):
+    """
+    dw/dt of w = log([x, y, z]).
+    """
+    u = np.exp(w)
+    return np.asarray(kp_coupled(0, u, *params)) / u
+
+
+def _log_jacobian(w, params):
+    """
+    Jacobian of _log_rhs: diag(1/u) J diag(u) - diag(f/u).
+    """
+    u = np.exp(w)
+    f = np.asarray(kp_coupled(0, u, *params))
+    return kp_jacobian(0, u, *params) * u[None, :] / u[:, None] - np.diag(f / u)
+
+
+def _log_dparam(w, params, index):
+    """
+    Derivative of _log_rhs with respect to the parameter at index (central difference).
+    """
+    params = list(params)
+    value = params[index]
+    delta = 1e-7 * max(1.0, abs(value))
+    params[index] = value + delta
+    upper = _log_rhs(w, params)
+    params[index] = value - delta
+    lower = _log_rhs(w, params)
+    return (upper - lower) / (2*delta)
+
+
+def _with_parameter(params, index, value):
+    params = list(params)
+    params[index] = value
+    return params
+
+
+def _scalar_log_rhs(x, y, z, params):
+    # _log_rhs in scalar arithmetic (params is an array in kp_coupled order)
+    c, mu_2, p_1, g_1, s_1 = params[0], params[1], params[2], params[3], params[4]
+    r_2, b, alpha, g_2 = params[5], params[6], params[7], params[8]
+    p_2, g_3, mu_3, s_2 = params[9], params[10], params[11], params[12]
+    return ((c*y - mu_2*x + (p_1*x*z)/(g_1 + z) + s_1)/x,
+            r_2*(1 - b*y) - (alpha*x)/(g_2 + y),
+            ((p_2*x*y)/(g_3 + y) - mu_3*z + s_2)/z)
+
+
+def _variational_rhs(u, params, upper, lower, delta):
+    """
+    Right-hand side of the shooting integration: u = [w, dw/dw0 (3x3, row-major), dw/dp].
+    upper and lower are the parameter arrays shifted by +-delta for the parameter derivative.
+    Written in plain loops so numba can compile it (see _flow).
+    """
+    x, y, z = np.exp(u[0]), np.exp(u[1]), np.exp(u[2])
+    c, mu_2, p_1, g_1 = params[0], params[1], params[2], params[3]
+    r_2, b, alpha, g_2 = params[5], params[6], params[7], params[8]
+    p_2, g_3, mu_3 = params[9], params[10], params[11]
+
+    g = _scalar_log_rhs(x, y, z, params)
+    g_upper = _scalar_log_rhs(x, y, z, upper)
+    g_lower = _scalar_log_rhs(x, y, z, lower)
+
+    # Jacobian in log coordinates, diag(1/u) J diag(u) - diag(g)
+    jac = np.empty((3, 3))
+    jac[0, 0] = -mu_2 + (p_1*z)/(g_1 + z) - g[0]
+    jac[0, 1] = c*y/x
+    jac[0, 2] = (p_1*x*g_1)/(g_1 + z)**2 * z/x
+    jac[1, 0] = -(alpha*y)/(g_2 + y) * x/y
+    jac[1, 1] = r_2*(1 - 2*b*y) - (alpha*x*g_2)/(g_2 + y)**2 - g[1]
+    jac[1, 2] = 0.0
+    jac[2, 0] = (p_2*y)/(g_3 + y) * x/z
+    jac[2, 1] = (p_2*x*g_3)/(g_3 + y)**2 * y/z
+    jac[2, 2] = -mu_3 - g[2]
+
+    out = np.empty(15)
+    for i in range(3):
+        out[i] = g[i]
+        for j in range(3):
+            out[3 + 3*i + j] = jac[i, 0]*u[3 + j] + jac[i, 1]*u[6 + j] + jac[i, 2]*u[9 + j]
+        out[12 + i] = jac[i, 0]*u[12] + jac[i, 1]*u[13] + jac[i, 2]*u[14] + (g_upper[i] - g_lower[i])/(2*delta)
+    return out
+
+
+def equilibria(params, y_min=1e-12):
+    """
+    All tumor-present equilibria [x, y, z] of the KP model for the parameter list params (kp_coupled order).
+    dy/dt = 0 gives x as a function of y and dz/dt = 0 gives z, so the equilibria are the roots of
+    dx/dt along that curve; they are bracketed on a log grid of y in (y_min, 1/b) and refined with brentq.
+    """
+    c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2 = params
+
+    def state(y):
+        x = r_2*(1 - b*y)*(g_2 + y)/alpha
+        z = ((p_2*x*y)/(g_3 + y) + s_2)/mu_3
+        return x, y, z
+
+    def residual(y):
+        x, y, z = state(y)
+        return c*y - mu_2*x + (p_1*x*z)/(g_1 + z) + s_1
+
+    y_max = 1/b if b > 0 else 1e12
+    ys = np.logspace(np.log10(y_min), np.log10(y_max), 4000)[:-1]
+    values = np.array([residual(y) for y in ys])
+
+    found = []
+    for i in np.nonzero(np.sign(values[:-1]) != np.sign(values[1:]))[0]:
+        x, y, z = state(brentq(residual, ys[i], ys[i+1], xtol=1e-14*ys[i], rtol=1e-14))
+        if x > 0 and z > 0:
+            found.append(np.array([x, y, z]))
+    return found
+
+
+# Pseudo-arclength continuation
+
+class _EquilibriumSystem:
+    """
+    Equilibrium condition of the KP model in v = [w, p].
+    """
+    def __init__(self, params, index):
+        self.params, self.index = list(params), index
+
+    def set_reference(self, v):
+        pass
+
+    def __call__(self, v):
+        params = _with_parameter(self.params, self.index, v[-1])
+        w = v[:-1]
+        jac = np.column_stack((_log_jacobian(w, params), _log_dparam(w, params, self.index)))
+        return _log_rhs(w, params), jac
+
+
+class _CycleSystem:
+    """
+    Periodic orbit condition of the KP model in v = [w0, log(T), p] (single shooting).
+    The residual is [phi(w0, T) - w0, q.(w0 - w_ref)], where the phase condition fixes the orbit point
+    against the previous point w_ref of the branch (q is the vector field there).
+    The period enters as log(T), so the steps stay useful as T grows towards a homoclinic orbit.
+    """
+    def __init__(self, params, index, rtol=1e-9, atol=1e-11):
+        self.params, self.index = list(params), index
+        self.rtol, self.atol = rtol, atol
+        self.phase = None  # (q, w_ref)
+        self._last = None  # (v, flow) of the last evaluated point
+
+    def set_reference(self, v, direction=None):
+        w, params = v[:3], _with_parameter(self.params, self.index, v[-1])
+        q = _log_rhs(w, params) if direction is None else np.asarray(direction, dtype=float)
+        self.phase = (q / np.linalg.norm(q), w.copy())
+
+    def _flow(self, w0, T, params):
+        # Integrate w together with its derivatives with respect to w0 (monodromy) and the parameter
+        index = self.index
+        params = np.asarray(params, dtype=float)
+        delta = 1e-7 * max(1.0, abs(params[index]))
+        upper, lower = params.copy(), params.copy()
+        upper[index] += delta
+        lower[index] -= delta
+
+        def rhs(t, u):
+            return _variational_rhs(u, params, upper, lower, delta)
+
+        # Stop when a state variable leaves the log range (e.g. x reaching 0 in finite time for a bad Newton iterate)
+        def escape(t, u):
+            return LOG_LIMIT - np.max(np.abs(u[:3]))
+        escape.terminal = True
+
+        u0 = np.concatenate((w0, np.eye(3).ravel(), np.zeros(3)))
+        sol = solve_ivp(rhs, (0, T), u0, method='LSODA', rtol=self.rtol, atol=self.atol, events=escape)
+        if sol.status != 0:
+            raise RuntimeError(sol.message if sol.status < 0 else "Trajectory left the log range.")
+        u = sol.y[:, -1]
+        return u[:3], u[3:12].reshape(3, 3), u[12:]
+
+    def __call__(self, v):
+        w0, T, p = v[:3], np.exp(v[3]), v[4]
+        params = _with_parameter(self.params, self.index, p)
+        # The flow of the last point is kept, so re-evaluating it with a new phase reference is free
+        key = v.tobytes()
+        if self._last is None or self._last[0] != key:
+            self._last = (key, self._flow(w0, T, params))
+        w_T, monodromy, dp = self._last[1]
+
+        q, w_ref = self.phase
+        residual = np.append(w_T - w0, q @ (w0 - w_ref))
+        jac = np.zeros((4, 5))
+        jac[:3, :3] = monodromy - np.eye(3)
+        jac[:3, 3] = T*_log_rhs(w_T, params)
+        jac[:3, 4] = dp
+        jac[3, :3] = q
+        return residual, jac
+
+
+def _tangent(jac, previous):
+    """
+    Unit tangent of the branch: null vector of jac, oriented along the previous tangent.
+    """
+    n = jac.shape[1]
+    rhs = np.zeros(n)
+    rhs[-1] = 1
+    tangent = np.linalg.solve(np.vstack((jac, previous)), rhs)
+    tangent /= np.linalg.norm(tangent)
+    return tangent if tangent @ previous >= 0 else -tangent
+
+
+def _correct(system, v_pred, tangent, tol, max_iter):
+    """
+    Newton corrector on the hyperplane orthogonal to the tangent through the predicted point.
+    Returns the corrected point and its Jacobian, or (None, None) if Newton does not converge.
+    """
+    v, dv = v_pred.copy(), None
+    for _ in range(max_iter + 1):
+        try:
+            # Diverging iterates overflow; they are rejected below
+            with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+                residual, jac = system(v)
+        except (RuntimeError, OverflowError, ValueError):
+            return None, None
+        if not (np.all(np.isfinite(residual)) and np.all(np.isfinite(jac))):
+            return None, None
+        if dv is not None and np.linalg.norm(dv) <= tol*(1 + np.linalg.norm(v)):
+            return v, jac
+        try:
+            dv = np.linalg.solve(np.vstack((jac, tangent)), -np.append(residual, tangent @ (v - v_pred)))
+        except np.linalg.LinAlgError:
+            return None, None
+        v = v + dv
+        if not np.all(np.isfinite(v)):
+            return None, None
+    return None, None
+
+
+def _hopf_test(jac):
+    # Bialternate product test: changes sign when a pair of eigenvalues sums to zero
+    eigenvalues = np.linalg.eigvals(jac[:, :-1])
+    i, j = np.triu_indices(len(eigenvalues), 1)
+    return float(np.real(np.prod(eigenvalues[i] + eigenvalues[j])))
+
+
+def _fold_test(jac, tangent):
+    # The parameter component of the tangent changes sign at a fold
+    return tangent[-1]
+
+
+def _continue(system, v0, tangent, step, step_min, step_max, max_points, in_range, tests,
+              tol=1e-9, max_iter=8, max_angle=0.2):
+    """
+    Pseudo-arclength continuation from the point v0 along the tangent.
+    The step grows by 30% after every accepted point and is halved when Newton fails or the tangent turns by
+    more than max_angle, so the branch is refined where it bends (e.g. at folds). Sign changes of the test functions (name -> f(jac, tangent)) are located by secant steps
+    from the previous point, so the special points are resolved to the corrector tolerance.
+    Returns the list of points (v, jac) and the list of special points (name, v, jac).
+    """
+    system.set_reference(v0)
+    residual, jac = system(v0)
+    tangent = _tangent(jac, tangent)
+    points = [(v0, jac)]
+    special = []
+    values = {name: test(jac, tangent) for name, test in tests.items()}
+
+    v = v0
+    while len(points) < max_points and step >= step_min:
+        v_pred = v + step*tangent
+        v_new, jac_new = _correct(system, v_pred, tangent, tol, max_iter)
+        if v_new is not None:
+            tangent_new = _tangent(jac_new, tangent)
+            angle = np.arccos(np.clip(tangent_new @ tangent, -1, 1))
+        if v_new is None or angle > max_angle:
+            step /= 2
+            continue
+
+        new_values = {name: test(jac_new, tangent_new) for name, test in tests.items()}
+        for name in tests:
+            if np.sign(new_values[name]) != np.sign(values[name]) and values[name] != 0:
+                located = _locate(system, v, tangent, step, tests[name], values[name], tol, max_iter)
+                if located is not None:
+                    special.append((name,) + located)
+
+        if not in_range(v_new):
+            break
+
+        points.append((v_new, jac_new))
+        v, values = v_new, new_values
+        # The tangent is taken with the phase condition of the new reference point
+        system.set_reference(v)
+        tangent = _tangent(system(v)[1], tangent_new)
+        step = min(step*1.3, step_max)
+
+    return points, special
+
+
+def _locate(system, v, tangent, step, test, value, tol, max_iter, max_refine=30):
+    """
+    Find the step length from v along the tangent where test changes sign (Illinois secant method).
+    Returns the located point and its Jacobian, or None.
+    """
+    low, high = 0.0, step
+    f_low, f_high = value, None
+    v_high, jac_high = _correct(system, v + high*tangent, tangent, tol, max_iter)
+    if v_high is None:
+        return None
+    f_high = test(jac_high, _tangent(jac_high, tangent))
+
+    v_mid, jac_mid = v_high, jac_high
+    side = 0
+    for _ in range(max_refine):
+        if f_high == f_low:
+            break
+        mid = high - f_high*(high - low)/(f_high - f_low)
+        if not min(low, high) < mid < max(low, high):
+            mid = (low + high)/2
+        v_mid, jac_mid = _correct(system, v + mid*tangent, tangent, tol, max_iter)
+        if v_mid is None:
+            return None
+        f_mid = test(jac_mid, _tangent(jac_mid, tangent))
+        if abs(high - low) < tol*max(1.0, abs(step)) or f_mid == 0:
+            break
+        if np.sign(f_mid) == np.sign(f_high):
+            high, f_high = mid, f_mid
+            if side == -1:
+                f_low /= 2
+            side = -1
+        else:
+            low, f_low = mid, f_mid
+            if side == 1:
+                f_high /= 2
+            side = 1
+
+    return v_mid, jac_mid
+
+
+# Branch continuation
+
+def _within(w, p, p_range):
+    return np.all(np.abs(w) < LOG_LIMIT) and p_range[0] <= p <= p_range[1]
+
+
+def continue_equilibria(params, state, p_range, parameter='c', direction=-1, step=0.01, step_min=1e-8,
+                        step_max=0.2, max_points=2000):
+    """
+    Trace the branch of equilibria through state as the parameter varies within p_range.
+    params: non-dimensional parameter list (kp_coupled order), with the starting parameter value
+    state: equilibrium [x, y, z] at the starting value (see equilibria)
+    direction: +1 or -1, initial direction of the parameter
+    Returns a dict with the parameter values, states, eigenvalues and stability along the branch,
+    and the Hopf points and folds found on it.
+    """
+    index = PARAMETER_INDEX[parameter]
+    system = _EquilibriumSystem(params, index)
+    v0 = np.append(np.log(state), params[index])
+
+    initial = np.zeros(len(v0))
+    initial[-1] = direction
+    tangent = _tangent(system(v0)[1], initial)
+
+    in_range = lambda v: _within(v[:-1], v[-1], p_range)
+    tests = {'hopf': lambda jac, t: _hopf_test(jac), 'fold': _fold_test}
+    points, special = _continue(system, v0, tangent, step, step_min, step_max, max_points, in_range, tests)
+
+    values = np.array([v for v, _ in points])
+    eigenvalues = np.array([np.linalg.eigvals(jac[:, :-1]) for _, jac in points])
+    branch = {
+        'parameter': parameter,
+        'p': values[:, -1],
+        'states': np.exp(values[:, :-1]),
+        'eigenvalues': eigenvalues,
+        'stable': np.all(eigenvalues.real < 0, axis=1),
+        'hopf': [],
+        'folds': [],
+    }
+
+    for name, v, jac in special:
+        eigenvalues = np.linalg.eigvals(jac[:, :-1])
+        if name == 'fold':
+            branch['folds'].append({'p': v[-1], 'state': np.exp(v[:-1])})
+            continue
+        # The bialternate test also vanishes at neutral saddles (real pair summing to zero)
+        pair = np.argsort(np.abs(eigenvalues.real))[:2]
+        omega = abs(eigenvalues[pair[0]].imag)
+        if omega > 1e-8:
+            branch['hopf'].append({'p': v[-1], 'state': np.exp(v[:-1]), 'omega': omega,
+                                   'period': 2*np.pi/omega})
+
+    return branch
+
+
+def _cycle_profile(w0, T, params, num_points=400):
+    """
+    States along one period of the cycle through w0.
+    """
+    sol = solve_ivp(lambda t, w: _log_rhs(w, params), (0, T), w0, method='LSODA',
+                    t_eval=np.linspace(0, T, num_points), rtol=1e-9, atol=1e-11)
+    return np.exp(sol.y.T)
+
+
+def continue_cycle(params, hopf, p_range, parameter='c', amplitude=1e-3, step=0.02, step_min=1e-6,
+                   step_max=0.5, max_points=300, max_period=None):
+    """
+    Trace the branch of limit cycles born at a Hopf point (from continue_equilibria).
+    The first cycle is found at a small distance (amplitude, in log coordinates) from the equilibrium
+    along the critical eigenvector; the branch stops when the period exceeds max_period (approach to a
+    homoclinic orbit, default 20 times the Hopf period), the parameter leaves p_range or the corrector fails
+    with the smallest step (single shooting becomes ill-conditioned close to a homoclinic orbit).
+    Returns a dict with the parameter values, periods, min/max of x, y, z over each cycle, the amplitude
+    of y, the Floquet multipliers and stability of each cycle, and the folds of cycles found.
+    """
+    index = PARAMETER_INDEX[parameter]
+    params = _with_parameter(params, index, hopf['p'])
+    max_period = max_period or 20*hopf['period']
+    w_hopf = np.log(hopf['state'])
+
+    # Critical eigenvector: x(t) ~ Re(v e^{i omega t}), so the cycle starts along Re(v) moving along -Im(v)
+    eigenvalues, vectors = np.linalg.eig(_log_jacobian(w_hopf, params))
+    vector = vectors[:, np.argmin(np.abs(eigenvalues - 1j*hopf['omega']))]
+    vector = vector / np.linalg.norm(vector.real)
+
+    system = _CycleSystem(params, index)
+    v_hopf = np.concatenate((w_hopf, [np.log(hopf['period']), hopf['p']]))
+    tangent = np.concatenate((vector.real, [0, 0]))
+    tangent /= np.linalg.norm(tangent)
+
+    system.phase = (-vector.imag/np.linalg.norm(vector.imag), w_hopf)
+    # The corrector tolerance stays above the error of the shooting integrations
+    tol = 1e-7
+    v0, _ = _correct(system, v_hopf + amplitude*tangent, tangent, tol, 12)
+    if v0 is None:
+        raise RuntimeError("Could not converge to the first limit cycle near the Hopf point.")
+    tangent = _tangent(system(v0)[1], v0 - v_hopf)
+
+    in_range = lambda v: _within(v[:3], v[4], p_range) and np.exp(v[3]) < max_period
+    tests = {'fold': _fold_test}
+    points, special = _continue(system, v0, tangent, step, step_min, step_max, max_points, in_range, tests,
+                                tol=tol)
+
+    p, periods, minima, maxima, multipliers = [], [], [], [], []
+    for v, jac in points:
+        profile = _cycle_profile(v[:3], np.exp(v[3]), _with_parameter(params, index, v[4]))
+        p.append(v[4])
+        periods.append(np.exp(v[3]))
+        minima.append(profile.min(axis=0))
+        maxima.append(profile.max(axis=0))
+        # The monodromy matrix is M - I in the shooting Jacobian
+        multipliers.append(np.linalg.eigvals(jac[:3, :3] + np.eye(3)))
+
+    multipliers = np.array(multipliers)
+    # One multiplier is always 1 (shift along the orbit); the cycle is stable if the others are inside the unit circle
+    trivial = np.argmin(np.abs(multipliers - 1), axis=1)
+    others = np.array([np.delete(np.abs(m), k) for m, k in zip(multipliers, trivial)])
+    minima, maxima = np.array(minima), np.array(maxima)
+
+    return {
+        'parameter': parameter,
+        'p': np.array(p),
+        'period': np.array(periods),
+        'min': minima,
+        'max': maxima,
+        'amplitude': maxima[:, 1] - minima[:, 1],
+        'multipliers': multipliers,
+        'stable': np.all(others < 1, axis=1),
+        'folds': [{'p': v[4], 'period': np.exp(v[3])} for _, v, _ in special],
+    }
+
+
+def bifurcation_diagram(parameters=None, c_range=(-0.005, 0.05), step=0.01, cycles=True):
+    """
+    Bifurcation diagram of the KP model in the dimensional antigenicity c (same range as the notebook sweeps).
+    parameters: dict of dimensional parameters overriding DEFAULT_PARAMETERS of Simulation.parameters
+    The equilibrium branch is traced from the upper end of c_range towards lower c, and a cycle branch is
+    continued from every Hopf point on it.
+    Returns a dict with the equilibrium branch and cycle branches, with c converted back to dimensional units.
+    """
+    from Simulation.parameters import scaled_parameters
+
+    params, _ = scaled_parameters(dict(parameters or {}, c=c_range[1]))
+    scale = params[0] / c_range[1]  # non-dimensional c per dimensional c
+    p_range = (c_range[0]*scale, c_range[1]*scale)
+
+    start = equilibria(params)
+    if not start:
+        raise ValueError(f"No tumor-present equilibrium at c = {c_range[1]}.")
+    # Start from the equilibrium with the smallest tumor population
+    branch = continue_equilibria(params, start[0], p_range, direction=-1, step=step)
+
+    cycle_branches = []
+    if cycles:
+        for hopf in branch['hopf']:
+            cycle_branches.append(continue_cycle(params, hopf, p_range))
+
+    # Back to dimensional c
+    branch['c'] = branch['p'] / scale
+    for point in branch['hopf'] + branch['folds']:
+        point['c'] = point['p'] / scale
+    for cycle in cycle_branches:
+        cycle['c'] = cycle['p'] / scale
+        for point in cycle['folds']:
+            point['c'] = point['p'] / scale
+
+    return {'equilibria': branch, 'cycles': cycle_branches, 'c_scale': scale}
+
+
+# Compiled shooting right-hand side (the shooting integrations call it thousands of times per cycle)
+if numba is not None:
+    _scalar_log_rhs = numba.njit(_scalar_log_rhs)
+    _variational_rhs = numba.njit(_variational_rhs)
@@ -1,36 +1,560 @@
 # Integration module
 # This module integrates the KP model equations dxdt, dydt, and dzdt using solve_ivp Runge-Kutta method.
-# The integration method could be changed later to include other models.
+# Other models of Model.models (dimensional KP, Dixon) are integrated by passing model= to kp_integrate.
+# An ensemble mode advances many trajectories together with a vectorized Dormand-Prince (RK45) integrator.
+# A trajectory mode integrates a whole horizon in one pass with piecewise-constant dosing.
+# The solver method can be switched to the implicit/automatic methods (Radau, BDF, LSODA),
+# which use the closed-form Jacobian of the KP model. compare_methods checks them against RK45.
+# A compiled backend from Model.backends can replace the scipy path for interval and batch integration.
+# With log_states, the positive states are integrated as their logarithm (Model.models.LogStates).
 
 # Imports
+import time
 import scipy
-from scipy.integrate import solve_ivp
+from scipy.integrate import solve_ivp, RK45, Radau, BDF, LSODA
 import numpy as np
 
-# Import equations from KP model
-from Model.KP_model import dx_dt, dy_dt, dz_dt, kp_coupled
+from Model.backends import get_backend
+from Model.models import LogStates, get_model
+
+# Available solver methods
+METHODS = {"RK45": RK45, "Radau": Radau, "BDF": BDF, "LSODA": LSODA}
+JACOBIAN_METHODS = ("Radau", "BDF", "LSODA") # methods that use the analytic Jacobian
+
+# Step size controller constants (same values as scipy's RK45)
+SAFETY = 0.9
+MIN_FACTOR = 0.2
+MAX_FACTOR = 10
 
 # Integration class for KP model
 class kp_integrate:
-    def __init__(self):
-        pass
+    """
+    Integrator of the KP model, or of another model of Model.models.
+    model: model name (e.g. 'kp_dim', 'dixon') or ODEModel, None for the non-dimensional KP model.
+    States and parameters are in the order of the model (state_names, param_names).
+    log_states: states integrated as their logarithm (True for model.positive_states, e.g. x and y of the KP model),
+                which keeps their relative error near rtol at any magnitude (atol only applies to the other states).
+                States and results stay linear. Used by integrate, integrate_batch (NumPy) and integrate_trajectory,
+                not by the backends or integrate_rk4.
+    """
+    def __init__(self, method="RK45", rtol=1e-7, atol=1e-9, max_step=0.1, backend=None, model=None,
+                 log_states=None):
+        if method not in METHODS:
+            raise ValueError(f"Invalid integration method '{method}'. Choose from {list(METHODS)}.")
+        if backend is not None and method != "RK45":
+            raise ValueError("Backends integrate with Dormand-Prince (RK45) only.")
+        if backend is not None and log_states:
+            raise ValueError("Backends integrate in linear coordinates only, log_states needs backend=None.")
+
+        # Solver settings shared by all integration modes
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+        self.max_step = max_step
+        self.model = get_model(model)
+
+        # System the solvers integrate: the model itself or the model in log coordinates
+        self.log_states = LogStates(self.model, log_states) if log_states else None
+        self.system = self.log_states or self.model
+
+        # Backend kernels (None uses scipy for single trajectories and NumPy for batches)
+        self.backend = get_backend(backend, model=self.model) if backend is not None else None
+
+        # Solver statistics of the last integration (nfev, njev, nlu), empty after the backend, batch and RK4
+        # integrations, which do not count them
+        self.stats = {}
+
+    def _solver_options(self, params, system=None):
+        """
+        Keyword arguments for the solver, including the Jacobian for implicit methods.
+        """
+        system = system or self.system
+        options = dict(rtol=self.rtol, atol=self._atol(system), max_step=self.max_step)
+        if self.method in JACOBIAN_METHODS:
+            options['jac'] = lambda t, y: system.jacobian_single(t, y, *params)
+        return options
+
+    def _atol(self, system=None):
+        # Absolute tolerance in the coordinates of system (per coordinate for log states)
+        system = system or self.system
+        return system.tolerances(self.rtol, self.atol) if system is not self.model else self.atol
+
+    def _to_solver(self, states, params):
+        # Log states must start positive and stay positive with params
+        if self.log_states is None:
+            return np.array(states, dtype=float)
+        self.log_states.check(params)
+        return self.log_states.to_solver(states)
+
+    def _from_solver(self, u):
+        return self.log_states.from_solver(u) if self.log_states is not None else u
 
     def integrate(self, state, params, t_span):
         """
-        Runge-Kutta integrator.
+        Runge-Kutta integrator (or the selected implicit method).
         Variables:
         time step
         state [x, y, z]
         params [c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2]
         """
+        if self.backend is not None:
+            # Run the whole interval in the backend kernel
+            self.stats = {}
+            out = self.backend.dopri(np.array([state], dtype=float), np.array([params], dtype=float),
+                                     float(t_span[0]), float(t_span[1]), self.rtol, self.atol, self.max_step)
+            return list(out[0])
 
         # Integrate the coupled KP model equations
-        solution = solve_ivp(fun=kp_coupled, t_span=t_span, y0=state, method="RK45", # uses Runge-Kutta method (RK45)
-                             args=tuple(params), rtol=1e-7, atol=1e-9, max_step=0.1)
+        solution = solve_ivp(fun=lambda t, y: self.system.coupled(t, y, *params), t_span=t_span,
+                             y0=self._to_solver(state, params),
+                             method=self.method, # uses Runge-Kutta method (RK45) by default
+                             **self._solver_options(params))
+        self.stats = {'nfev': int(solution.nfev), 'njev': int(solution.njev), 'nlu': int(solution.nlu)}
 
         # Get the final values of x, y, z
-        x_out, y_out, z_out = solution.y[:,-1]
+        return list(self._from_solver(solution.y[:,-1]))
+
+    def integrate_batch(self, states, params, t_span):
+        """
+        Ensemble Runge-Kutta integrator.
+        All trajectories are advanced together, each with its own step size and error control.
+        Variables:
+        time step
+        states (N, 3) array of [x, y, z]
+        params (N, 13) array of [c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2]
+        Returns an (N, 3) array of the final x, y, z values.
+        """
+        states = np.atleast_2d(np.asarray(states, dtype=float))
+        params = np.broadcast_to(np.asarray(params, dtype=float), (states.shape[0], self.model.num_params))
+        self.stats = {}
+
+        if self.backend is not None:
+            return self.backend.dopri(states, np.ascontiguousarray(params), float(t_span[0]), float(t_span[1]),
+                                      self.rtol, self.atol, self.max_step)
+
+        # Integrate the batched KP model equations with the same tolerances as integrate()
+        return self._from_solver(dopri_batch(self.system.rhs, t_span, self._to_solver(states, params), params,
+                                             rtol=self.rtol, atol=self._atol(), max_step=self.max_step))
+
+    def integrate_rk4(self, states, params, t_span, n_steps=10):
+        """
+        Fixed-step RK4 integrator for one or many trajectories.
+        Variables:
+        states (N, 3) array (or a single [x, y, z])
+        params (N, 13) array (or a single parameter list)
+        t_span (t0, t1)
+        n_steps: number of RK4 steps over t_span
+        Returns an (N, 3) array of the final x, y, z values.
+        """
+        states = np.atleast_2d(np.asarray(states, dtype=float))
+        params = np.ascontiguousarray(np.broadcast_to(np.asarray(params, dtype=float),
+                                                      (states.shape[0], self.model.num_params)))
+        backend = self.backend or get_backend(model=self.model)
+        self.stats = {}
+
+        return backend.rk4(states, params, float(t_span[0]), float(t_span[1]), int(n_steps))
+
+    def integrate_trajectory(self, state, params, tau, s_1=None, s_2=None, dosing=None, on_step=None,
+                             profile=None, termination=None):
+        """
+        Whole-horizon integrator with piecewise-constant dosing.
+        A single solver is used for the whole horizon, so the step size controller
+        keeps its state across control boundaries. The solver only stops at boundaries
+        where the dose changes; all other tau points are sampled through dense output.
+        Variables:
+        state [x, y, z] at tau[0]
+        params [c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2]
+        tau: time grid of the control steps
+        s_1, s_2: dose schedules of length len(tau), the value at index k is applied on (tau[k-1], tau[k])
+                  (defaults to the constant s_1, s_2 in params; for other models the first and second
+                  parameters of model.dose_names, a model with a single dose has s_2 = 0)
+        dosing: optional callback dosing(step, t, state) -> (s_1, s_2) called at the start of each
+                control step with the state at tau[step-1], used instead of the schedules
+                (after a tumor clearance event the callback is no longer called and the doses are zero; the
+                returned schedules keep the dose of the step of the event, which applies until the event)
+        on_step: optional callback on_step(step, t, state) called with every sampled state, in order
+        profile: optional Simulation.profiling.Profile, receives the solver time, function evaluations and
+                 rejected steps (explicit Runge-Kutta methods) of every integrated interval
+        termination: optional Model.termination.Termination, ends the integration early on tumor clearance,
+                     a fixed point or a limit cycle (the reason is in termination.info)
+        Returns the states (len(tau), 3) on the tau grid and the s_1, s_2 doses that were applied
+        (shorter than tau if the termination action is 'stop').
+        """
+        tau = np.asarray(tau, dtype=float)
+        num_steps = len(tau)
+
+        # Positions of the doses in params (None if the model has no such dose)
+        dose_1, dose_2 = (self.model.dose_indices + [None, None])[:2]
+        if dose_1 is None or (dose_2 is None and (s_2 is not None and np.any(np.asarray(s_2) != 0))):
+            raise ValueError(f"The {self.model.name} model has no dose for the given schedules.")
+
+        # Dose schedules (index 0 is unused, as in the notebook arrays)
+        s_1_array = np.full(num_steps, float(params[dose_1])) if s_1 is None else np.array(s_1, dtype=float)
+        s_2_array = (np.full(num_steps, 0.0 if dose_2 is None else float(params[dose_2])) if s_2 is None
+                     else np.array(s_2, dtype=float))
+
+        states = np.zeros((num_steps, self.model.num_states))
+        states[0] = state
+        if on_step is not None:
+            on_step(0, tau[0], states[0])
+        if num_steps < 2:
+            return states, s_1_array, s_2_array
+
+        # The right-hand side reads the current dose from args, which is updated at each boundary
+        # (the doses do not appear in the Jacobian)
+        # The solver runs in the coordinates of system (log coordinates for log_states)
+        args = list(params)
+        system = self.system
+        fun = lambda t, y: system.coupled(t, y, *args)
+        to_states = self._from_solver
+
+        # Doses of the schedules are part of the positivity check of the log states
+        checked = np.array(params, dtype=float)
+        checked[dose_1] = min(checked[dose_1], s_1_array[1:].min())
+        solver = METHODS[self.method](fun, tau[0], self._to_solver(state, checked), tau[-1],
+                                      **self._solver_options(args))
+
+        # Early termination checks (only while the rest of the dose schedule is known and constant)
+        finished = False
+        counts = {'nfev': 0, 'njev': 0, 'nlu': 0}  # evaluations of the replaced solvers and of the clearance tail
+        if termination is not None:
+            termination.start(self.model, num_steps)
+            steady_since = _steady_since(s_1_array, s_2_array) if dosing is None else None
+
+        step = 1
+        while step < num_steps:
+            if dosing is not None:
+                s_1_array[step], s_2_array[step] = dosing(step, tau[step-1], states[step-1].copy())
+
+            dose = (s_1_array[step], s_2_array[step])
+
+            # Extend the segment while the dose stays the same
+            end = step
+            if dosing is None:
+                while end + 1 < num_steps and s_1_array[end+1] == dose[0] and s_2_array[end+1] == dose[1]:
+                    end += 1
+
+            # Apply the new dose and restart the solver at the boundary, keeping its step size
+            if args[dose_1] != dose[0] or (dose_2 is not None and args[dose_2] != dose[1]):
+                args[dose_1] = dose[0]
+                if dose_2 is not None:
+                    args[dose_2] = dose[1]
+                solver.f = solver.fun(solver.t, solver.y)
+            if isinstance(solver, LSODA):
+                # LSODA only takes its critical time (the end point it never steps past) at construction,
+                # so it restarts at every boundary that moves the end point
+                if solver.t_bound != tau[end]:
+                    counts = {key: counts[key] + getattr(solver, key) for key in counts}
+                    solver = LSODA(fun, solver.t, solver.y, tau[end], **self._solver_options(args, system))
+            else:
+                _set_bound(solver, tau[end])
+
+            if profile is not None:
+                first, nfev, num_solver_steps, start = step, solver.nfev, 0, time.perf_counter()
+
+            while solver.status == 'running':
+                t_old = solver.t
+                message = solver.step()
+                if solver.status == 'failed':
+                    raise RuntimeError(f"Integration failed at t = {solver.t}: {message}")
+                if profile is not None:
+                    num_solver_steps += 1
+
+                # Tumor clearance: the samples up to the event come from this step, the rest from _cleared_tail
+                t_event = termination.check_clearance(solver, t_old, to_states) if termination is not None else None
+                reached = solver.t if t_event is None else t_event
+
+                # Sample the tau points reached by this step
+                if step <= end and tau[step] <= reached:
+                    dense = solver.dense_output()
+                    while step <= end and tau[step] <= reached:
+                        states[step] = to_states(solver.y if tau[step] == solver.t else dense(tau[step]))
+                        if on_step is not None:
+                            on_step(step, tau[step], states[step])
+                        if termination is not None and termination.check(
+                                step, tau, states, self.model.coupled(tau[step], states[step], *args), steady_since):
+                            finished = True
+                            break
+                        step += 1
+                if finished:
+                    break
+
+                if t_event is not None:
+                    # The rest of the run (or of the step of the event, for 'stop') is filled without tumor
+                    termination.record_clearance(step, t_event)
+                    y = to_states(solver.dense_output()(t_event) if t_event < solver.t else solver.y.copy())
+                    y[termination.tumor_index] = 0.0
+                    last = step if termination.action == 'stop' else num_steps - 1
+                    doses = np.stack([s_1_array, s_2_array], axis=1)[step:last+1]
+                    if dosing is not None:
+                        # The dosing callback is no longer called, the rest of the run is without dose
+                        doses[:] = 0.0
+                        s_1_array[step+1:] = 0.0
+                        s_2_array[step+1:] = 0.0
+                    states[step:last+1], tail = self._cleared_tail(y, t_event, tau[step:last+1], doses, args,
+                                                                   dose_1, dose_2, termination.tumor_index)
+                    counts = {key: counts[key] + tail[key] for key in counts}
+                    if on_step is not None:
+                        on_step(step, tau[step], states[step])
+                    finished = True
+                    break
+
+            if profile is not None:
+                _profile_interval(profile, solver, first, solver.nfev - nfev, num_solver_steps,
+                                  time.perf_counter() - start)
+            if finished:
+                break
+
+        if finished:
+            if termination.action == 'stop':
+                states, s_1_array, s_2_array = states[:step+1], s_1_array[:step+1], s_2_array[:step+1]
+            else:
+                termination.extrapolate(tau, states, step)
+                if on_step is not None:
+                    for k in range(step + 1, num_steps):
+                        on_step(k, tau[k], states[k])
+            if profile is not None:
+                profile.count('extrapolated_steps', termination.info['extrapolated_steps'])
+
+        self.stats = {key: int(counts[key] + getattr(solver, key)) for key in counts}
+
+        return states, s_1_array, s_2_array
+
+    def _cleared_tail(self, state, t, tau, doses, params, dose_1, dose_2, tumor):
+        """
+        States on tau after a tumor clearance event at t, with the tumor held at zero.
+        The other states relax without tumor, which an explicit method resolves only with steps limited by the
+        fastest decay rate; the tail is therefore integrated with LSODA and without max_step, one solve per
+        stretch of constant dose. The tumor derivative (and its row of the Jacobian) is zeroed, since the full
+        system would grow any round-off of the tumor back from zero.
+        Variables:
+        state: states at t (tumor 0)
+        tau: time points after t
+        doses: (len(tau), 2) s_1, s_2 applied on the intervals ending at tau
+        params, dose_1, dose_2: parameters and positions of the doses as in integrate_trajectory
+        tumor: index of the tumor state
+        Returns the states (len(tau), num_states) and the nfev, njev, nlu of the solves.
+        """
+        args = list(params)
+
+        def fun(t, y):
+            f = np.array(self.model.coupled(t, y, *args), dtype=float)
+            f[tumor] = 0.0
+            return f
+
+        def jac(t, y):
+            jacobian = np.array(self.model.jacobian_single(t, y, *args), dtype=float)
+            jacobian[tumor] = 0.0
+            return jacobian
+
+        states = np.zeros((len(tau), self.model.num_states))
+        counts = {'nfev': 0, 'njev': 0, 'nlu': 0}
+        start = 0
+        while start < len(tau):
+            end = start
+            while end + 1 < len(tau) and np.array_equal(doses[end+1], doses[start]):
+                end += 1
+            args[dose_1] = doses[start, 0]
+            if dose_2 is not None:
+                args[dose_2] = doses[start, 1]
+            if tau[end] > t:
+                solution = solve_ivp(fun, (t, tau[end]), state, method='LSODA', t_eval=tau[start:end+1],
+                                     rtol=self.rtol, atol=self.atol, jac=jac)
+                if solution.status == -1:
+                    raise RuntimeError(f"Integration failed after the clearance at t = {t}: {solution.message}")
+                states[start:end+1] = solution.y.T
+                counts = {key: counts[key] + getattr(solution, key) for key in counts}
+            else:
+                states[start:end+1] = state
+            state, t, start = states[end].copy(), tau[end], end + 1
+        states[:, tumor] = 0.0
+
+        return states, counts
+
+
+def _steady_since(s_1_array, s_2_array):
+    """
+    First step from which the dose schedules stay constant until the end (index 0 is unused).
+    """
+    changes = np.flatnonzero((s_1_array[2:] != s_1_array[1:-1]) | (s_2_array[2:] != s_2_array[1:-1]))
+    return int(changes[-1]) + 2 if len(changes) else 1
+
+
+def _profile_interval(profile, solver, step, nfev, num_solver_steps, elapsed):
+    """
+    Record the solver statistics of the interval starting at control step step.
+    """
+    # Every attempted step of an explicit Runge-Kutta method costs n_stages evaluations
+    n_stages = getattr(solver, 'n_stages', None)
+    rejected = max(0, nfev // n_stages - num_solver_steps) if n_stages else 0
+
+    profile.add_time('integration', elapsed)
+    profile.count('nfev', nfev)
+    profile.count('solver_steps', num_solver_steps)
+    profile.count('rejected_steps', rejected)
+    profile.record('interval_step', step)
+    profile.record('interval_nfev', nfev)
+    profile.record('interval_rejected', rejected)
+
+
+def _set_bound(solver, t_bound):
+    """
+    Move the end point of a running scipy solver so it can continue to the next control boundary.
+    """
+    solver.t_bound = t_bound
+    solver.status = 'running'
+
+
+def compare_methods(state, params, tau, methods=("RK45", "Radau", "BDF", "LSODA"),
+                    rtol=1e-7, atol=1e-9, max_step=np.inf, check_rtol=1e-4, check_atol=1e-6, model=None):
+    """
+    Compare solver methods against the RK45 reference trajectory.
+    Each method integrates the same trajectory on the tau grid. The error is the largest
+    deviation from the reference scaled by check_atol + check_rtol*|reference|, so a method
+    matches the reference when its error is at most 1.
+    Variables:
+    state [x, y, z] at tau[0]
+    params [c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2]
+    tau: time grid
+    model: model of the integrators (see kp_integrate), None for the KP model
+    Returns a list with one result dict per method and the name of the cheapest matching method
+    (fewest nfev + njev).
+    """
+    reference = None
+    results = []
+
+    for method in ("RK45",) + tuple(m for m in methods if m != "RK45"):
+        integrator = kp_integrate(method=method, rtol=rtol, atol=atol, max_step=max_step, model=model)
+
+        start = time.perf_counter()
+        states, _, _ = integrator.integrate_trajectory(state, params, tau)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = states
+        error = np.max(np.abs(states - reference) / (check_atol + check_rtol*np.abs(reference)))
+
+        results.append({'method': method, 'time': elapsed, 'error': float(error), 'matches': bool(error <= 1),
+                        **integrator.stats})
+
+    matching = [r for r in results if r['matches'] and r['method'] in methods]
+    best = min(matching, key=lambda r: r['nfev'] + r['njev'])['method'] if matching else None
+
+    return results, best
+
+
+def _rms_norm(values):
+    """
+    Row-wise RMS norm used by the step size controller.
+    """
+    return np.sqrt(np.mean(values**2, axis=1))
+
+
+def _initial_step(fun, t0, y0, f0, params, interval, rtol, atol):
+    """
+    Vectorized version of the initial step selection used by solve_ivp.
+    """
+    scale = atol + np.abs(y0) * rtol
+    d0 = _rms_norm(y0 / scale)
+    d1 = _rms_norm(f0 / scale)
+
+    h0 = np.where((d0 < 1e-5) | (d1 < 1e-5), 1e-6, 0.01 * d0 / np.maximum(d1, 1e-300))
+    h0 = np.minimum(h0, interval)
+
+    # Explicit Euler step to estimate the second derivative
+    y1 = y0 + h0[:, None] * f0
+    f1 = fun(t0 + h0, y1, params)
+    d2 = _rms_norm((f1 - f0) / scale) / h0
+
+    small = (d1 <= 1e-15) & (d2 <= 1e-15)
+    h1 = np.where(small, np.maximum(1e-6, h0 * 1e-3),
+                  (0.01 / np.maximum(np.maximum(d1, d2), 1e-300)) ** (1 / (RK45.error_estimator_order + 1)))
+
+    return np.minimum(np.minimum(100 * h0, h1), interval)
+
+
+def dopri_batch(fun, t_span, states, params, rtol=1e-7, atol=1e-9, max_step=np.inf, max_steps=0):
+    """
+    Vectorized Dormand-Prince (RK45) integrator with per-trajectory error control.
+    Every row of states is an independent trajectory with its own time and step size.
+    Rows that have reached the end of t_span are frozen while the rest keep stepping.
+    Variables:
+    fun: batched right-hand side fun(t, states, params) -> (N, 3) array
+    t_span: (t0, t1)
+    states: (N, 3) array of initial states
+    params: (N, P) array of parameters for each trajectory
+    max_steps: largest number of steps (accepted or rejected) of a trajectory, 0 for no limit
+    Returns an (N, 3) array of states at t1.
+    """
+    t0, t1 = float(t_span[0]), float(t_span[1])
+    y = np.array(states, dtype=float)
+    n = y.shape[0]
+
+    if t1 < t0:
+        raise ValueError("t_span must be increasing for batched integration.")
+    if t1 == t0:
+        return y
+
+    # Butcher tableau of the Dormand-Prince pair
+    A, B, C, E = RK45.A, RK45.B, RK45.C, RK45.E
+    n_stages = RK45.n_stages
+    exponent = -1 / (RK45.error_estimator_order + 1)
+
+    t = np.full(n, t0)
+    f = fun(t, y, params)
+    h = np.minimum(_initial_step(fun, t, y, f, params, t1 - t0, rtol, atol), max_step)
+    rejected = np.zeros(n, dtype=bool) # True if the current step of a row has been rejected at least once
+
+    active = np.arange(n)
+    num_steps = 0
+    while active.size > 0:
+        ya, fa, ta, pa = y[active], f[active], t[active], params[active]
+
+        # Every active row takes one step per iteration
+        num_steps += 1
+        if 0 < max_steps < num_steps:
+            raise RuntimeError("Too many steps (the problem is likely stiff or diverging).")
+
+        # Do not step past the end of the interval
+        ha = np.minimum(h[active], t1 - ta)
+        if np.any(ha < 10 * np.abs(np.nextafter(ta, np.inf) - ta)):
+            raise RuntimeError("Required step size is less than spacing between numbers.")
+
+        # Runge-Kutta stages
+        K = np.empty((n_stages + 1,) + ya.shape)
+        K[0] = fa
+        for s in range(1, n_stages):
+            dy = np.tensordot(A[s, :s], K[:s], axes=(0, 0)) * ha[:, None]
+            K[s] = fun(ta + C[s] * ha, ya + dy, pa)
+
+        y_new = ya + np.tensordot(B, K[:n_stages], axes=(0, 0)) * ha[:, None]
+        t_new = ta + ha
+        K[-1] = fun(t_new, y_new, pa)
+
+        # Local error estimate and per-row error norm
+        scale = atol + np.maximum(np.abs(ya), np.abs(y_new)) * rtol
+        error = np.tensordot(E, K, axes=(0, 0)) * ha[:, None]
+        error_norm = _rms_norm(error / scale)
+
+        accept = error_norm < 1
+        with np.errstate(divide='ignore'):
+            factor = SAFETY * error_norm**exponent
+        factor = np.where(accept,
+                          np.where(error_norm == 0, MAX_FACTOR, np.minimum(MAX_FACTOR, factor)),
+                          np.maximum(MIN_FACTOR, factor))
+        # After a rejection the step size is not allowed to grow on the next accepted step
+        factor = np.where(accept & rejected[active], np.minimum(1, factor), factor)
+
+        # Update accepted rows (FSAL: last stage is the derivative at the new point)
+        idx = active[accept]
+        y[idx] = y_new[accept]
+        f[idx] = K[-1][accept]
+        t[idx] = t_new[accept]
+        t[idx[t1 - t[idx] <= 1e-12 * max(abs(t1), 1.0)]] = t1
+
+        h[active] = np.minimum(ha * factor, max_step)
+        rejected[active] = ~accept
+
+        active = active[t[active] < t1]
 
-        # output
-        return [x_out, y_out, z_out]
-    
\ No newline at end of file
+    return y
@@ -0,0 +1,229 @@
+# Model layer
+# This module holds the base class of the ODE models that the integrators (Model.integration) and backends
+# (Model.backends) can run: the non-dimensional KP model (Model.KP_model), the dimensional KP model
+# (Model.KP_model_dim) and the Dixon model (Model.Dixon_model).
+# A model declares its state and parameter layout, a batched right-hand side and Jacobian on (N, n) arrays,
+# the units of its parameters for non-dimensionalization, and optionally a scalar kernel for the compiled backend.
+# LogStates integrates the positive states of a model as their logarithm, for populations that span many decades.
+# The model modules are imported when a model is first requested.
+
+# Imports
+import importlib
+
+import numpy as np
+
+# Smallest log state that is evaluated (exp of smaller values underflows to 0)
+LOG_MIN = np.log(np.finfo(float).tiny)
+
+# Model name -> module that defines it as MODEL
+MODEL_MODULES = {
+    'kp': 'Model.KP_model',
+    'kp_dim': 'Model.KP_model_dim',
+    'dixon': 'Model.Dixon_model',
+}
+
+
+class ODEModel:
+    """
+    Base class of the ODE models.
+    Subclasses set the layout and implement rhs and jacobian for batches of trajectories:
+    name: model name (see get_model)
+    state_names: names of the state variables, in state order
+    param_names: names of the parameters, in parameter order
+    dose_names: parameters that are external doses (changed at control boundaries by integrate_trajectory)
+    units: parameter name -> (time exponent, state exponents), used by nondim
+    positive_states: states that stay positive from a positive start (the default log states of LogStates),
+                     check_positive raises for parameters where this does not hold
+    scaled: the model of the non-dimensional variables (None if the model is already scaled)
+    kernel: optional right-hand side of a single trajectory kernel(t, y, p, out) written in plain loops,
+            compiled by the numba backend
+    """
+    name = None
+    state_names = ()
+    param_names = ()
+    dose_names = ()
+    units = {}
+    positive_states = ()
+    scaled = None
+    kernel = None
+
+    @property
+    def num_states(self):
+        return len(self.state_names)
+
+    @property
+    def num_params(self):
+        return len(self.param_names)
+
+    @property
+    def dose_indices(self):
+        return [self.param_names.index(name) for name in self.dose_names]
+
+    def rhs(self, t, states, params):
+        """
+        Derivatives (N, n) of the states (N, n) with the parameters (N, P).
+        """
+        raise NotImplementedError
+
+    def jacobian(self, t, states, params):
+        """
+        Jacobians (N, n, n) of rhs with respect to the states.
+        """
+        raise NotImplementedError
+
+    def coupled(self, t, state, *params):
+        """
+        Right-hand side of a single trajectory, called like kp_coupled (e.g. by solve_ivp).
+        """
+        return self.rhs(t, np.asarray(state, dtype=float)[None], np.asarray(params, dtype=float)[None])[0]
+
+    def jacobian_single(self, t, state, *params):
+        """
+        Jacobian (n, n) of a single trajectory, called like kp_jacobian.
+        """
+        return self.jacobian(t, np.asarray(state, dtype=float)[None], np.asarray(params, dtype=float)[None])[0]
+
+    def check_positive(self, names, params):
+        """
+        Raise a ValueError if the states in names can cross 0 with the parameters (..., P) (see LogStates).
+        """
+
+    def parameter_vector(self, values):
+        """
+        Parameter array in parameter order from a dict of parameter values.
+        """
+        missing = [name for name in self.param_names if name not in values]
+        if missing:
+            raise ValueError(f"Missing parameters {missing} of the {self.name} model.")
+        return np.array([float(values[name]) for name in self.param_names])
+
+    def nondim(self, params, state_scales, t_s):
+        """
+        Non-dimensionalization of the parameters for the scaled states state / state_scales and time tau = t_s * t.
+        A parameter with units (a, [e_1, ..., e_n]) is multiplied by t_s**a * prod(state_scales**e_i), e.g. rates
+        have a = -1 and the saturation constants of a state have e_i = -1.
+        params: (P,) or (N, P) array in parameter order
+        Returns the parameters of the scaled model (same shape).
+        """
+        missing = [name for name in self.param_names if name not in self.units]
+        if missing:
+            raise ValueError(f"The {self.name} model has no units for the parameters {missing}.")
+
+        time_exponents = np.array([self.units[name][0] for name in self.param_names], dtype=float)
+        state_exponents = np.array([self.units[name][1] for name in self.param_names], dtype=float)
+        state_scales = np.asarray(state_scales, dtype=float)
+        factors = np.asarray(t_s, dtype=float)**time_exponents * np.prod(state_scales**state_exponents, axis=1)
+
+        return np.asarray(params, dtype=float) * factors
+
+    def scale_states(self, states, state_scales):
+        """
+        States in the non-dimensional variables of nondim.
+        """
+        return np.asarray(states, dtype=float) / np.asarray(state_scales, dtype=float)
+
+    def unscale_states(self, states, state_scales):
+        """
+        States in the dimensional variables (inverse of scale_states).
+        """
+        return np.asarray(states, dtype=float) * np.asarray(state_scales, dtype=float)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(states={list(self.state_names)})"
+
+
+class LogStates:
+    """
+    The ODE of a model in the coordinates u, where u_i = log(state_i) for the states in names and u_i = state_i
+    for the others. The relative error of a log state is then controlled down to any magnitude, so the solver
+    no longer spends steps on (or loses) populations near zero.
+    Provides the same rhs, jacobian, coupled and jacobian_single as the model, in the u coordinates.
+    tolerances(rtol, atol) gives the absolute tolerance per coordinate: rtol for the log states (an error e of u_i
+    is a relative error e of state_i) and atol for the others.
+    names: states integrated in log coordinates (True for model.positive_states)
+    """
+    def __init__(self, model, names=True):
+        names = model.positive_states if names is True else tuple(names)
+        unknown = [name for name in names if name not in model.state_names]
+        if unknown:
+            raise ValueError(f"The {model.name} model has no states {unknown}.")
+        self.model = model
+        self.names = names
+        self.mask = np.array([name in names for name in model.state_names])
+        self.index = np.flatnonzero(self.mask)
+
+    def check(self, params):
+        """
+        Check that the log states stay positive with the parameters (..., P).
+        """
+        self.model.check_positive(self.names, params)
+
+    def tolerances(self, rtol, atol):
+        return np.where(self.mask, rtol, atol)
+
+    def to_solver(self, states):
+        """
+        u coordinates of the states (the log states must be positive).
+        """
+        u = np.array(states, dtype=float)
+        values = u[..., self.mask]
+        if np.any(values <= 0):
+            raise ValueError(f"The log states {list(self.names)} must be positive, got {values}.")
+        u[..., self.mask] = np.log(values)
+        return u
+
+    def from_solver(self, u):
+        """
+        States of the u coordinates (inverse of to_solver).
+        """
+        states = np.array(u, dtype=float)
+        states[..., self.mask] = np.exp(states[..., self.mask])
+        return states
+
+    def _states(self, u):
+        # States where the right-hand side is evaluated, log states below LOG_MIN are held at exp(LOG_MIN)
+        u = np.array(u, dtype=float)
+        u[..., self.mask] = np.exp(np.maximum(u[..., self.mask], LOG_MIN))
+        return u
+
+    def rhs(self, t, u, params):
+        # du_i/dt = f_i(state) / state_i for the log states
+        states = self._states(u)
+        f = np.asarray(self.model.rhs(t, states, params), dtype=float)
+        return np.where(self.mask, f / np.where(self.mask, states, 1.0), f)
+
+    def jacobian(self, t, u, params):
+        # diag(1/s) J diag(d) - diag(mask * f/state), with s_i = d_i = state_i for the log states (1 otherwise)
+        states = self._states(u)
+        scale = np.where(self.mask, states, 1.0)
+        f = np.asarray(self.model.rhs(t, states, params), dtype=float)
+        jac = np.asarray(self.model.jacobian(t, states, params), dtype=float)
+        jac = jac * scale[..., None, :] / scale[..., :, None]
+        diagonal = np.arange(len(self.mask))
+        jac[..., diagonal, diagonal] -= np.where(self.mask, f / scale, 0.0)
+        return jac
+
+    def coupled(self, t, u, *params):
+        # Single trajectory version of rhs (called at every solver stage, so it indexes instead of masking)
+        index = self.index
+        state = np.array(u, dtype=float)
+        state[index] = np.exp(np.maximum(state[index], LOG_MIN))
+        f = np.array(self.model.coupled(t, state, *params), dtype=float)
+        f[index] /= state[index]
+        return f
+
+    def jacobian_single(self, t, u, *params):
+        return self.jacobian(t, np.asarray(u, dtype=float)[None], np.asarray(params, dtype=float)[None])[0]
+
+
+def get_model(model=None):
+    """
+    Return a model.
+    model: model name (see MODEL_MODULES), an ODEModel (returned as it is) or None for the non-dimensional KP model
+    """
+    if isinstance(model, ODEModel):
+        return model
+    name = 'kp' if model is None else model
+    if name not in MODEL_MODULES:
+        raise ValueError(f"Unknown model '{name}'. Available models: {list(MODEL_MODULES)}")
+    return importlib.import_module(MODEL_MODULES[name]).MODEL
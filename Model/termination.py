@@ -0,0 +1,186 @@
+# Early termination
+# This module detects runs that no longer need to be integrated step by step by integrate_trajectory
+# (Model.integration):
+#   clearance: the tumor falls below a threshold, located as a solver event. The tumor is then held at 0 and the
+#              dosing callback (e.g. the GA) is no longer called. The remaining steps are integrated without tumor
+#              in a few stiff solver steps (see kp_integrate._cleared_tail).
+#   fixed point: the derivatives stay below a tolerance for a window of steps while the dose is constant.
+#                The remaining steps repeat the last state.
+#   limit cycle: successive maxima of a state repeat (time and state) with a clear amplitude while the dose is
+#                constant.
+#                The remaining steps repeat the last period, interpolated on the time grid.
+# With action='stop' the run ends at the detection instead, and the trajectory is shorter than the time grid.
+# The checks never end a run while the dose schedule still changes.
+
+# Imports
+import numpy as np
+from scipy.optimize import brentq
+
+ACTIONS = ('extrapolate', 'stop')
+
+
+class Termination:
+    """
+    Early termination checks of integrate_trajectory.
+    clearance: tumor level below which the tumor counts as cleared (None to disable), in the units of the
+               state tumor (for the non-dimensional KP model y = T/T0, so 1e-5 is one cell)
+    tumor: name of the tumor state (model.state_names)
+    fixed_point: check for a fixed point, |f_i| <= atol + rtol*|state_i| for window steps in a row
+    limit_cycle: check for a limit cycle on the maxima of the state cycle_state: the last cycles periods and
+                 maxima agree within cycle_rtol (relative, plus atol for the states), and the peak-to-trough
+                 amplitude of cycle_state is above min_amplitude relative to its peak
+    action: 'extrapolate' fills the remaining steps, 'stop' ends the trajectory at the detection
+    After a run, info holds the reason ('horizon', 'clearance', 'fixed_point', 'limit_cycle'), the step and
+    time of the detection, the number of extrapolated steps and the clearance event (if any).
+    """
+    def __init__(self, clearance=None, tumor='y', fixed_point=True, rtol=1e-6, atol=1e-10, window=20,
+                 limit_cycle=True, cycle_state='x', cycle_rtol=1e-4, cycles=2, min_amplitude=1e-3,
+                 action='extrapolate'):
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid termination action '{action}'. Choose from {list(ACTIONS)}.")
+        self.clearance = clearance
+        self.tumor = tumor
+        self.fixed_point = fixed_point
+        self.rtol = rtol
+        self.atol = atol
+        self.window = window
+        self.limit_cycle = limit_cycle
+        self.cycle_state = cycle_state
+        self.cycle_rtol = cycle_rtol
+        self.cycles = cycles
+        self.min_amplitude = min_amplitude
+        self.action = action
+        self.info = {}
+
+    def to_dict(self):
+        return {'clearance': self.clearance, 'tumor': self.tumor, 'fixed_point': self.fixed_point,
+                'rtol': self.rtol, 'atol': self.atol, 'window': self.window, 'limit_cycle': self.limit_cycle,
+                'cycle_state': self.cycle_state, 'cycle_rtol': self.cycle_rtol, 'cycles': self.cycles,
+                'min_amplitude': self.min_amplitude, 'action': self.action}
+
+    def start(self, model, num_steps):
+        """
+        Reset the checks for a new trajectory of the model.
+        """
+        self.tumor_index = model.state_names.index(self.tumor) if self.clearance is not None else None
+        self._cycle = model.state_names.index(self.cycle_state) if self.limit_cycle else None
+        self._calm = 0  # steps in a row that pass the fixed point test
+        self._peaks = []  # (time, state) of the maxima of the cycle state
+        self._period = None
+        self.cleared = False
+        self.info = {'reason': 'horizon', 'step': num_steps - 1, 'extrapolated_steps': 0}
+
+    # Clearance
+
+    def check_clearance(self, solver, t_old, to_states=None):
+        """
+        Time of the clearance event in the last solver step (from t_old to solver.t), or None.
+        The crossing is located on the dense output of the step.
+        to_states: maps the solver coordinates to the states (e.g. LogStates.from_solver), None if they are the same
+        """
+        to_states = to_states or (lambda y: y)
+        if self.tumor_index is None or self.cleared or to_states(solver.y)[self.tumor_index] >= self.clearance:
+            return None
+        self.cleared = True
+
+        dense = solver.dense_output()
+        level = lambda t: to_states(dense(t))[self.tumor_index] - self.clearance
+        if level(t_old) > 0 and t_old < solver.t:
+            return brentq(level, t_old, solver.t, xtol=1e-12 * max(1.0, abs(solver.t)))
+        return t_old
+
+    def record_clearance(self, step, t):
+        self.info['clearance'] = {'step': int(step), 't': float(t)}
+        self.info.update(reason='clearance', step=int(step))
+
+    # Fixed point and limit cycle
+
+    def check(self, step, tau, states, derivative, steady_since):
+        """
+        Online check after the state of step has been sampled.
+        derivative: right-hand side at states[step]
+        steady_since: first step from which the dose schedule stays constant until the end (None if it does not)
+        Returns the reason ('fixed_point' or 'limit_cycle') if the run can end here, otherwise None.
+        """
+        state = states[step]
+        steady = steady_since is not None
+
+        if self.fixed_point:
+            small = np.all(np.abs(derivative) <= self.atol + self.rtol*np.abs(state))
+            self._calm = self._calm + 1 if (small and steady) else 0
+            if self._calm >= self.window and step - self.window >= steady_since:
+                return self._detected('fixed_point', step)
+
+        if self._cycle is not None and step >= 2:
+            values = states[step-2:step+1, self._cycle]
+            if values[1] > values[0] and values[1] >= values[2]:
+                # Maximum of the parabola through the last three samples
+                curvature = values[0] - 2*values[1] + values[2]
+                shift = 0.5*(values[0] - values[2])/curvature if curvature != 0 else 0.0
+                dt = tau[step] - tau[step-1]
+                # States on the same parabola at the peak, a raw sample would drift in phase from cycle to cycle
+                around = states[step-2:step+1]
+                peak = (around[1] + 0.5*shift*(around[2] - around[0])
+                        + 0.5*shift**2*(around[0] - 2*around[1] + around[2]))
+                self._peaks.append((tau[step-1] + shift*dt, peak, step - 1))
+                if steady and self._is_cycle(steady_since, states[:step+1, self._cycle]):
+                    return self._detected('limit_cycle', step)
+
+        return None
+
+    def _is_cycle(self, steady_since, values):
+        peaks = self._peaks[-(self.cycles + 1):]
+        if len(peaks) < self.cycles + 1 or peaks[0][2] < steady_since:
+            return False
+        # A real oscillation: peak-to-trough amplitude of the cycle state above min_amplitude (relative to the peak)
+        # since the first of the peaks, otherwise numerical wiggles near a fixed point would count as a cycle
+        highest = max(peak[1][self._cycle] for peak in peaks)
+        amplitude = highest - values[peaks[0][2]:].min()
+        if amplitude <= self.atol + self.min_amplitude*abs(highest):
+            return False
+        times = np.array([peak[0] for peak in peaks])
+        periods = np.diff(times)
+        if np.ptp(periods) > self.cycle_rtol * periods.mean():
+            return False
+        maxima = np.array([peak[1] for peak in peaks])
+        if np.any(np.abs(np.diff(maxima, axis=0)) > self.atol + self.cycle_rtol*np.abs(maxima[1:])):
+            return False
+        # The maxima of the cycle state must also repeat within cycle_rtol of the amplitude
+        if np.ptp(maxima[:, self._cycle]) > self.cycle_rtol*amplitude:
+            return False
+        self._period = float(periods.mean())
+        return True
+
+    def _detected(self, reason, step):
+        self.info.update(reason=reason, step=int(step))
+        if reason == 'limit_cycle':
+            self.info['period'] = self._period
+        return reason
+
+    def extrapolate(self, tau, states, step):
+        """
+        Fill the states after step according to the detected reason.
+        After a clearance the states are already filled by integrate_trajectory (the tail without tumor needs the
+        model), only the number of steps is recorded.
+        """
+        remaining = len(tau) - step - 1
+        self.info['extrapolated_steps'] = int(remaining)
+        if remaining <= 0 or self.info['reason'] == 'clearance':
+            return
+        if self.info['reason'] == 'fixed_point':
+            states[step+1:] = states[step]
+            return
+
+        # Limit cycle: map the future times into the last period and interpolate between the samples
+        period = self._period
+        first = np.searchsorted(tau, tau[step] - period) - 1
+        history_t, history = tau[max(first, 0):step+1], states[max(first, 0):step+1]
+        future = tau[step+1:]
+        phase = tau[step] - period + np.mod(future - tau[step], period)
+        for i in range(states.shape[1]):
+            column = history[:, i]
+            if np.all(column > 0):
+                # Interpolate positive states in log space, they span many orders of magnitude
+                states[step+1:, i] = np.exp(np.interp(phase, history_t, np.log(column)))
+            else:
+                states[step+1:, i] = np.interp(phase, history_t, column)
@@ -0,0 +1 @@
+# Simulation folder
\ No newline at end of file
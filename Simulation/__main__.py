@@ -0,0 +1,31 @@
+# Simulation command line
+# python -m Simulation config.toml [config2.json ...] [--dry-run]
+# Runs the jobs of the config files (see Simulation.runner) in order.
+
+# Imports
+import argparse
+import sys
+
+from Simulation.runner import load_config, run_job
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Simulation',
+                                     description="Run open-loop, closed-loop, policy and sweep jobs from config files.")
+    parser.add_argument('configs', nargs='+', help="config files (.json or .toml)")
+    parser.add_argument('--dry-run', action='store_true', help="check the configs and list the jobs without running")
+    args = parser.parse_args(argv)
+
+    # Check every config before the first job starts
+    jobs = [job for path in args.configs for job in load_config(path)]
+
+    for number, job in enumerate(jobs, 1):
+        target = job.get('output') or job.get('output_dir')
+        print(f"Job {number}/{len(jobs)}: {job['mode']} -> {target}")
+        if not args.dry_run:
+            run_job(job)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
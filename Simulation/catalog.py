@@ -0,0 +1,164 @@
+# Run catalog
+# This module keeps an SQLite index of simulation runs: parameters, file path, status and summary features.
+# Runs are recorded when they are written, so analysis code can query runs by parameter
+# (e.g. all GA runs with 0.02 < c < 0.03) instead of globbing output folders.
+
+# Imports
+import glob
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+CATALOG_NAME = 'catalog.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    sweep TEXT,
+    idx INTEGER,
+    mode TEXT,
+    c REAL,
+    status TEXT,
+    updated REAL,
+    parameters TEXT,
+    metadata TEXT,
+    features TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_mode_c ON runs (mode, c);
+CREATE INDEX IF NOT EXISTS runs_sweep_idx ON runs (sweep, idx);
+"""
+
+
+def run_features(columns):
+    """
+    Summary features of a stored run (dict of columns), computed with the default feature sinks.
+    """
+    from Simulation.features import default_sinks
+
+    states = np.column_stack((columns['x'], columns['y'], columns['z']))
+    return default_sinks().feed(columns['tau'], states)
+
+
+class RunCatalog:
+    """
+    SQLite catalog of simulation runs.
+    File paths are stored relative to the folder of the catalog file.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.folder = os.path.dirname(self.path)
+        os.makedirs(self.folder, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        # A long timeout lets sweep workers wait for each other's short write transactions
+        return sqlite3.connect(self.path, timeout=60)
+
+    def _relative(self, path):
+        return os.path.relpath(os.path.abspath(path), self.folder)
+
+    def record_run(self, path, metadata, status='done', features=None, sweep=None, idx=None):
+        """
+        Insert or update the entry of a run file.
+        metadata: run metadata with 'mode' and the dimensional 'parameters'
+        features: dict of summary features
+        """
+        from Simulation.trajectory_store import json_safe
+
+        parameters = metadata.get('parameters', {})
+        c = parameters.get('c')
+        row = (self._relative(path), sweep, idx, metadata.get('mode'), None if c is None else float(c), status,
+               time.time(), json.dumps(json_safe(parameters)), json.dumps(json_safe(metadata)),
+               None if features is None else json.dumps(json_safe(features)))
+
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO runs (path, sweep, idx, mode, c, status, updated, parameters, metadata, features) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET sweep=excluded.sweep, idx=excluded.idx, mode=excluded.mode, "
+                "c=excluded.c, status=excluded.status, updated=excluded.updated, parameters=excluded.parameters, "
+                "metadata=excluded.metadata, features=COALESCE(excluded.features, runs.features)", row)
+
+    def set_status(self, path, status):
+        """
+        Change the status of a run (e.g. 'running', 'done', 'failed').
+        """
+        with self._connect() as connection:
+            connection.execute("UPDATE runs SET status=?, updated=? WHERE path=?",
+                               (status, time.time(), self._relative(path)))
+
+    def query(self, mode=None, sweep=None, status='done', c_min=None, c_max=None, **parameter_ranges):
+        """
+        Find runs, ordered by sweep index and c.
+        mode: 'open_loop' or 'closed_loop'
+        c_min, c_max: exclusive bounds on c
+        parameter_ranges: other dimensional parameters as (low, high) exclusive bounds, e.g. r_2=(0.1, 0.2)
+        Returns a list of dicts with the path, parameters, metadata and features of each run.
+        """
+        conditions, values = [], []
+        for column, value in (('mode', mode), ('sweep', sweep), ('status', status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if c_min is not None:
+            conditions.append("c > ?")
+            values.append(c_min)
+        if c_max is not None:
+            conditions.append("c < ?")
+            values.append(c_max)
+        for name, (low, high) in parameter_ranges.items():
+            conditions.append("json_extract(parameters, ?) > ? AND json_extract(parameters, ?) < ?")
+            values.extend([f"$.{name}", low, f"$.{name}", high])
+
+        sql = "SELECT path, sweep, idx, mode, c, status, parameters, metadata, features FROM runs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY sweep, idx, c"
+
+        with self._connect() as connection:
+            rows = connection.execute(sql, values).fetchall()
+
+        return [{'path': os.path.join(self.folder, path), 'sweep': sweep, 'idx': idx, 'mode': mode, 'c': c,
+                 'status': status, 'parameters': json.loads(parameters), 'metadata': json.loads(metadata),
+                 'features': json.loads(features) if features else None}
+                for path, sweep, idx, mode, c, status, parameters, metadata, features in rows]
+
+    def paths(self, **query):
+        """
+        File paths of the runs matching query (see query).
+        """
+        return [run['path'] for run in self.query(**query)]
+
+    def index_folder(self, folder, sweep=None, mode=None):
+        """
+        Add existing run files of a folder (e.g. the notebook's Output_data sweeps) to the catalog.
+        c is taken from the file header (.kpt) or the legacy file name (which stores c + 1),
+        runs are ordered by c within the sweep.
+        """
+        from Simulation.output import read_features
+        from Simulation.trajectory_store import legacy_metadata, read_header
+        from Visualization.data_handling import load_columns
+
+        sweep = sweep or os.path.basename(os.path.normpath(folder))
+        entries = []
+        for path in glob.glob(os.path.join(folder, '*.csv')) + glob.glob(os.path.join(folder, '*.kpt')):
+            if path.endswith('.kpt'):
+                metadata = read_header(path)[0]['metadata']
+            else:
+                metadata = legacy_metadata(path)
+            metadata.setdefault('mode', mode or ('closed_loop' if '_ga_' in os.path.basename(path) else 'open_loop'))
+            entries.append((metadata.get('parameters', {}).get('c', np.inf), path, metadata))
+
+        entries.sort(key=lambda entry: entry[0])
+        for idx, (c, path, metadata) in enumerate(entries):
+            features = read_features(path) or run_features(load_columns(path))
+            self.record_run(path, metadata, features=features, sweep=sweep, idx=idx)
+
+        print(f"Indexed {len(entries)} runs of {folder}")
+        return len(entries)
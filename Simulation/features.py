@@ -0,0 +1,184 @@
+# Streaming features
+# This module computes summary features of a trajectory online, one time step at a time, while the simulation runs.
+# Feature sinks are updated with the state after every step and their results are saved with the run,
+# so feature tables can be built from the saved summaries without reading the trajectory files.
+
+# Imports
+import numpy as np
+
+# State columns the sinks can follow
+STATE_COLUMNS = {'x': 0, 'y': 1, 'z': 2}
+
+
+class FeatureSink:
+    """
+    Base class of the feature sinks.
+    begin(num_steps) is called before the first step, update(step, t, state) after every step
+    (including step 0, the initial state) and result() returns a dict of features.
+    """
+    def __init__(self, column='y'):
+        self.column = column
+        self.index = STATE_COLUMNS[column]
+        self.num_steps = None
+
+    def begin(self, num_steps):
+        self.num_steps = num_steps
+
+    def _resolve(self, idx, default):
+        # Negative indices count from the end of the run, like Python slices
+        if idx is None:
+            return default
+        return idx + self.num_steps if idx < 0 else idx
+
+    def update(self, step, t, state):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+
+class WindowStats(FeatureSink):
+    """
+    Running min, max and mean of a column over the step window [start, stop).
+    Results are named min<name>, max<name> and mean<name>.
+    """
+    def __init__(self, start=None, stop=None, name='', column='y'):
+        super().__init__(column)
+        self.start, self.stop, self.name = start, stop, name
+
+    def begin(self, num_steps):
+        super().begin(num_steps)
+        self._start = max(0, self._resolve(self.start, 0))
+        self._stop = min(num_steps, self._resolve(self.stop, num_steps))
+        self._min, self._max, self._sum, self._count = np.inf, -np.inf, 0.0, 0
+
+    def update(self, step, t, state):
+        if self._start <= step < self._stop:
+            value = state[self.index]
+            self._min = min(self._min, value)
+            self._max = max(self._max, value)
+            self._sum += value
+            self._count += 1
+
+    def result(self):
+        empty = self._count == 0
+        return {f'min{self.name}': None if empty else float(self._min),
+                f'max{self.name}': None if empty else float(self._max),
+                f'mean{self.name}': None if empty else float(self._sum / self._count)}
+
+
+class TailAmplitude(FeatureSink):
+    """
+    Peak-to-peak amplitude (max - min) of a column over the last length steps of the run.
+    The last value of the column is reported as <column>_final.
+    """
+    def __init__(self, length=500, name='amplitude', column='y'):
+        super().__init__(column)
+        self.length, self.name = length, name
+
+    def begin(self, num_steps):
+        super().begin(num_steps)
+        self._window = WindowStats(start=-self.length, column=self.column)
+        self._window.begin(num_steps)
+        self._last = None
+
+    def update(self, step, t, state):
+        self._window.update(step, t, state)
+        self._last = state[self.index]
+
+    def result(self):
+        window = self._window.result()
+        amplitude = None if window['max'] is None else window['max'] - window['min']
+        return {self.name: amplitude, f'{self.column}_final': None if self._last is None else float(self._last)}
+
+
+class PeriodEstimate(FeatureSink):
+    """
+    Oscillation period of a column from the times of its local maxima after step start.
+    A maximum is counted once the column has dropped below it by rel_prominence times the range seen so far,
+    and the next maximum is searched once the column has risen again by the same amount (hysteresis).
+    Results are the median time between maxima (<name>, in units of t) and the number of maxima found.
+    """
+    def __init__(self, start=None, rel_prominence=0.05, name='period', column='y'):
+        super().__init__(column)
+        self.start, self.rel_prominence, self.name = start, rel_prominence, name
+
+    def begin(self, num_steps):
+        super().begin(num_steps)
+        self._start = max(0, self._resolve(self.start, 0))
+        self._low, self._high = np.inf, -np.inf
+        self._rising = True
+        self._extreme = (None, -np.inf)  # (t, value) of the running maximum or minimum
+        self._peaks = []
+
+    def update(self, step, t, state):
+        if step < self._start:
+            return
+        value = state[self.index]
+        self._low, self._high = min(self._low, value), max(self._high, value)
+        threshold = self.rel_prominence * (self._high - self._low)
+
+        if self._rising:
+            if value >= self._extreme[1]:
+                self._extreme = (t, value)
+            elif value < self._extreme[1] - threshold:
+                self._peaks.append(self._extreme[0])
+                self._rising, self._extreme = False, (t, value)
+        else:
+            if value <= self._extreme[1]:
+                self._extreme = (t, value)
+            elif value > self._extreme[1] + threshold:
+                self._rising, self._extreme = True, (t, value)
+
+    def result(self):
+        period = float(np.median(np.diff(self._peaks))) if len(self._peaks) >= 3 else None
+        return {self.name: period, f'{self.name}_peaks': len(self._peaks)}
+
+
+class FeatureSinkSet:
+    """
+    Group of feature sinks updated together in the simulation loop.
+    """
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def begin(self, num_steps):
+        for sink in self.sinks:
+            sink.begin(num_steps)
+
+    def update(self, step, t, state):
+        for sink in self.sinks:
+            sink.update(step, t, state)
+
+    def results(self):
+        results = {}
+        for sink in self.sinks:
+            results.update(sink.result())
+        return results
+
+    def feed(self, t, states):
+        """
+        Run the sinks over a whole stored trajectory (t and (num_steps, 3) states).
+        """
+        self.begin(len(states))
+        for step, (t_step, state) in enumerate(zip(t, states)):
+            self.update(step, t_step, state)
+        return self.results()
+
+
+def default_sinks():
+    """
+    Feature sinks for the windows used by extract_features and the analysis notebook:
+    max/mean of y over steps 500-1000 (1) and 1000-1500 (2), tail amplitude over the last 500 steps,
+    max over 400-1000, mean over 500-1500, tail amplitude over the last 400 steps and the period
+    of y over the last 1000 steps.
+    """
+    return FeatureSinkSet([
+        WindowStats(500, 1000, '1'),
+        WindowStats(1000, 1500, '2'),
+        TailAmplitude(500),
+        WindowStats(400, 1000, '_400_1000'),
+        WindowStats(500, 1500, '_500_1500'),
+        TailAmplitude(400, name='amplitude_400'),
+        PeriodEstimate(start=-1000),
+    ])
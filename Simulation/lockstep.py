@@ -0,0 +1,94 @@
+# Lockstep simulation module
+# This module runs many closed-loop scenarios (e.g. the points of a GA-controlled sweep) in lockstep:
+# at every control step one vectorized GA (GA.lockstep) chooses s_1 and s_2 for all scenarios at once,
+# and all scenario states are advanced together through the batched integrator (kp_integrate.integrate_batch).
+# The runs are returned in the format of run_closed_loop (Simulation.simulation), so they can be written
+# and analyzed the same way. The integrator restarts at every control step, so trajectories agree with
+# run_closed_loop to the solver tolerances, and the GA draws differ from pygad's, so the chosen doses
+# are statistically, not exactly, the same.
+
+# Imports
+import time
+
+import numpy as np
+
+from Model.backends import get_backend
+from Model.integration import kp_integrate
+from Simulation.features import default_sinks
+from Simulation.parameters import DEFAULT_PARAMETERS, DEFAULT_SETTINGS, scaled_parameters, time_grid
+from Simulation.simulation import make_run
+
+
+def run_closed_loop_lockstep(grid, settings=None, integrator=None, ga_settings=None, sinks=None, profile=None):
+    """
+    Closed-loop simulations of a list of parameter sets, advanced in lockstep.
+    grid: list of dicts of dimensional parameters overriding DEFAULT_PARAMETERS (see Simulation.sweep.parameter_grid),
+          all with the same time grid (the same r_2)
+    settings: dict of simulation settings overriding DEFAULT_SETTINGS (termination is not supported)
+    integrator: kp_integrate instance for the batched steps (default RK45 on the fastest available backend)
+    ga_settings: keyword arguments for GA.lockstep.LockstepGA (as for RecedingHorizonGA in run_closed_loop, without
+                 the cache and custom fitness options)
+    sinks: FeatureSinkSet run over the trajectory of every scenario in turn (default_sinks() if None, False to disable)
+    profile: Profile receiving the counters and timers of the whole lockstep run (None to disable)
+    Returns the list of runs in grid order.
+    """
+    from GA.lockstep import LockstepGA
+
+    start = time.perf_counter()
+    points = [dict(DEFAULT_PARAMETERS, **point) for point in grid]
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    if settings.get('termination') is not None:
+        raise ValueError("Lockstep runs do not support early termination.")
+    integrator = integrator or kp_integrate(backend=get_backend().name)
+    sinks = default_sinks() if sinks is None else sinks or None
+    ga = LockstepGA(len(points), **(ga_settings or {}))
+    ga.profile = profile
+    if profile is not None:
+        profile.info.update({'mode': 'closed_loop_lockstep', 'scenarios': len(points)})
+
+    params = np.array([scaled_parameters(p)[0] for p in points])
+    grids = [time_grid(p, settings)[1] for p in points]
+    tau = grids[0]
+    if any(len(other) != len(tau) or np.any(other != tau) for other in grids[1:]):
+        raise ValueError("Lockstep runs need the same time grid for every scenario (equal r_2).")
+
+    num_scenarios, num_steps = len(points), len(tau)
+    states = np.zeros((num_scenarios, num_steps, 3))
+    states[:, 0] = 1.0  # initial non-dimensional x, y, z values are 1.0
+    s_1_array = np.tile(params[:, 4, None], (1, num_steps))
+    s_2_array = np.tile(params[:, 12, None], (1, num_steps))
+    fitness_history = np.full((num_scenarios, max(num_steps - 1, 0)), np.nan)
+    generations = np.zeros((num_scenarios, max(num_steps - 1, 0)), dtype=int)
+
+    for step in range(1, num_steps):
+        # One GA step for all scenarios at the state of the start of the step
+        current = states[:, step-1]
+        environment = {'t': step-1, 'states': current, 'params': params, 'dt': tau[step] - tau[step-1]}
+        solutions, fitness_history[:, step-1], generations[:, step-1] = ga.step(environment)
+
+        # Feedback law of every scenario (GA.controller.feedback_law), restricted to non-negative input
+        s_1 = np.maximum(0, np.sum(solutions[:, 0:3]*current, axis=1) + solutions[:, 3])
+        s_2 = np.maximum(0, np.sum(solutions[:, 4:7]*current, axis=1) + solutions[:, 7])
+        s_1_array[:, step], s_2_array[:, step] = s_1, s_2
+        params[:, 4], params[:, 12] = s_1, s_2
+
+        integration_start = time.perf_counter()
+        states[:, step] = integrator.integrate_batch(current, params, (tau[step-1], tau[step]))
+        if profile is not None:
+            profile.add_time('integration', time.perf_counter() - integration_start)
+
+    runs = []
+    for i, p in enumerate(points):
+        run = make_run(p, settings, 'closed_loop', tau, states[i], s_1_array[i], s_2_array[i], fitness_history[i])
+        run['metadata']['engine'] = 'lockstep'
+        run['metadata']['ga_settings'] = dict(ga_settings or {})
+        run['metadata']['generations'] = generations[i].tolist()
+        if sinks is not None:
+            run['metadata']['features'] = sinks.feed(tau, states[i])
+        runs.append(run)
+
+    if profile is not None:
+        profile.count('scenarios', num_scenarios)
+        profile.add_time('run', time.perf_counter() - start)
+
+    return runs
@@ -0,0 +1,114 @@
+# Output module
+# This module writes simulation runs to disk in the CSV format of the main notebook
+# or in the binary trajectory format of Simulation.trajectory_store (.kpt).
+# Feature summaries of CSV runs are saved as a .features.json file next to the CSV file.
+# The profile of a run (Simulation.profiling), including the write time, is saved as a .profile.json file.
+# Long runs also get a .pyramid.npz file of min/max envelopes for plotting (Visualization.downsampling).
+# Files are written to a temporary file first and then moved into place, so a crashed run never leaves a partial file.
+
+# Imports
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from Simulation.simulation import COLUMNS
+
+
+def atomic_write(path, write_func, mode='w', newline=''):
+    """
+    Write a file atomically.
+    write_func(file) writes the content to an open temporary file in the same folder,
+    which then replaces path in a single step.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+
+    try:
+        with open(tmp_path, mode, **({'newline': newline} if 'b' not in mode else {})) as file:
+            write_func(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_csv(path, run):
+    """
+    Save a simulation run to a CSV file with the columns
+    ['t', 'tau', 'x', 'y', 'z', 'E', 'T', 'IL', 's_1', 's_2', 'Fitness'].
+    Missing fitness values are written as empty cells.
+    """
+    columns = run['columns']
+
+    def write(file):
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        for i in range(len(columns['t'])):
+            row = [columns[name][i] for name in COLUMNS]
+            row[0] = int(row[0])
+            row = [float(v) if isinstance(v, np.floating) else v for v in row]
+            if np.isnan(row[-1]):
+                row[-1] = ''
+            writer.writerow(row)
+
+    atomic_write(path, write)
+
+
+def write_run(path, run):
+    """
+    Save a simulation run, choosing the format from the file extension (.csv or .kpt).
+    """
+    start = time.perf_counter()
+    if path.endswith('.kpt'):
+        # Features are stored in the file header with the rest of the metadata
+        from Simulation.trajectory_store import write_trajectory
+        write_trajectory(path, run)
+    elif path.endswith('.csv'):
+        write_csv(path, run)
+        if 'features' in run['metadata']:
+            write_features(path, run['metadata']['features'])
+    else:
+        raise ValueError(f"Unknown output format of {path}. Use .csv or .kpt.")
+
+    from Visualization.downsampling import write_pyramid
+    write_pyramid(path, run['columns'])
+
+    profile = run.get('profile')
+    if profile is not None:
+        from Simulation.profiling import write_profile
+        profile.add_time('write', time.perf_counter() - start)
+        write_profile(path, profile)
+
+
+def features_path(path):
+    """
+    Path of the feature summary saved next to a CSV run file.
+    """
+    return os.path.splitext(path)[0] + '.features.json'
+
+
+def write_features(path, features):
+    """
+    Save the feature summary of the run file path as JSON next to it.
+    """
+    from Simulation.trajectory_store import json_safe
+    atomic_write(features_path(path), lambda file: json.dump(json_safe(features), file, indent=2))
+
+
+def read_features(path):
+    """
+    Saved feature summary of a run file (.csv sidecar or .kpt header), or None if there is none.
+    """
+    if path.endswith('.kpt'):
+        from Simulation.trajectory_store import read_header
+        return read_header(path)[0]['metadata'].get('features')
+    if os.path.exists(features_path(path)):
+        with open(features_path(path)) as file:
+            return json.load(file)
+    return None
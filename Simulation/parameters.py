@@ -0,0 +1,78 @@
+# Simulation parameters
+# This module holds the dimensional KP parameters and simulation settings used in the main notebook,
+# and converts them to the non-dimensional parameter list and time grid used by the integrator.
+
+# Imports
+import numpy as np
+
+from Model.KP_model import nondim
+
+# Dimensional parameters (same values as the main notebook)
+DEFAULT_PARAMETERS = {
+    # eq.1
+    'c': 0.0297,  # antigenicity (keep between 0 and 0.05)
+    'mu_2': 0.03,  # Multiplicative inverse of the natural lifetime of effector cells (days^-1)
+    'p_1': 0.1245,  # Proliferation rate of effector cells (days^-1)
+    'g_1': 2e7,  # Threshold growth rate of effector cells (cells days^-1)
+
+    # eq.2
+    'g_2': 1e5,  # Threshold for tumor cell removal (cells)
+    'r_2': 0.18,  # tumor growth rate (days^-1)
+    'b': 1e-9,  # Multiplicative inverse of the tumor carrying capacity (cells^-1)
+    'alpha': 1,  # Immune system strength for tumor removal (days^-1)
+
+    # eq.3
+    'mu_3': 10,  # Multiplicative inverse of the natural lifetime of IL-2 (days^-1)
+    'p_2': 5.0,  # Production rate of IL-2 (units days^-1)
+    'g_3': 1e3,  # Threshold for IL-2 production via effector-tumor interaction (cells)
+
+    # External therapy parameters
+    's_1': 0,  # external T cell source
+    's_2': 0,  # external IL-2 source
+
+    # Initial conditions
+    'E0': 1e5,
+    'T0': 1e5,
+    'IL0': 1e2,
+}
+
+# Simulation settings
+DEFAULT_SETTINGS = {
+    'num_steps': 2000,  # number of time steps
+    'total_time': 4000,  # total time (days)
+    # Early termination (keyword arguments of Model.termination.Termination, e.g. {'clearance': 1e-5}),
+    # None integrates every run over the whole horizon
+    'termination': None,
+}
+
+
+def scaled_parameters(parameters=None):
+    """
+    Non-dimensionalize the dimensional parameters.
+    parameters: dict of dimensional parameters overriding DEFAULT_PARAMETERS
+    Returns the parameter list in kp_coupled order
+    [c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2] and the time scale t_s.
+    """
+    p = dict(DEFAULT_PARAMETERS, **(parameters or {}))
+    t_s = p['r_2']  # time scale (days)
+
+    [c, p_1, g_1, mu_2, g_2, b, r_2, alpha, mu_3, p_2, g_3, s_1, s_2] = nondim(
+        p['E0'], p['T0'], p['IL0'], t_s, p['c'], p['p_1'], p['g_1'], p['mu_2'], p['g_2'], p['b'],
+        p['r_2'], p['alpha'], p['mu_3'], p['p_2'], p['g_3'], p['s_1'], p['s_2'])
+
+    return [c, mu_2, p_1, g_1, s_1, r_2, b, alpha, g_2, p_2, g_3, mu_3, s_2], t_s
+
+
+def time_grid(parameters=None, settings=None):
+    """
+    Time arrays of the simulation, built the same way as in the main notebook.
+    Returns t (days) and the non-dimensional time tau, both of length num_steps.
+    """
+    p = dict(DEFAULT_PARAMETERS, **(parameters or {}))
+    s = dict(DEFAULT_SETTINGS, **(settings or {}))
+    t_s = p['r_2']  # time scale (days)
+
+    t = np.linspace(0, s['total_time'], int(s['num_steps']/p['r_2']))  # time array
+    tau = t * t_s  # dimensional time array
+
+    return t[:s['num_steps']], tau[:s['num_steps']]
@@ -0,0 +1,163 @@
+# Profiling module
+# This module collects low-overhead counters and timers of a simulation run: GA time and generations per
+# control step, fitness calls, solver function evaluations and rejected steps per interval, and write time.
+# A Profile is filled by the simulation, the controller, the GA hooks and the integrator,
+# and is saved as a .profile.json file next to the run file.
+# profile_report ranks the profiles of a sweep, to find the phases and c values that make it slow.
+
+# Imports
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Profile:
+    """
+    Counters, timers and per-step series of one run.
+    info: dict describing the run (mode, c, ...)
+    """
+    def __init__(self, info=None):
+        self.info = dict(info or {})
+        self.counters = {}
+        self.timers = {}  # name -> [total, count, max]
+        self.series = {}
+        self._marks = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [seconds, 1, seconds]
+        else:
+            timer[0] += seconds
+            timer[1] += 1
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time a block of code: with profile.timer('write'): ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def mark(self, key):
+        """
+        Start a lap clock (see lap).
+        """
+        self._marks[key] = time.perf_counter()
+
+    def lap(self, key, name):
+        """
+        Add the time since the last mark or lap of the clock key to the timer name and restart the clock.
+        Used by callbacks that only see the end of each phase (e.g. the GA hooks).
+        """
+        now = time.perf_counter()
+        start = self._marks.get(key)
+        if start is not None:
+            self.add_time(name, now - start)
+        self._marks[key] = now
+
+    def record(self, name, value):
+        """
+        Append a value to the per-step series name.
+        """
+        self.series.setdefault(name, []).append(value)
+
+    def to_dict(self):
+        timers = {name: {'total': total, 'count': count, 'mean': total / count, 'max': maximum}
+                  for name, (total, count, maximum) in self.timers.items()}
+        return {'info': self.info, 'counters': dict(self.counters), 'timers': timers,
+                'series': {name: list(values) for name, values in self.series.items()}}
+
+    def summary(self):
+        """
+        Totals of the timers (largest first), the counters and statistics of the series.
+        """
+        series = {}
+        for name, values in self.series.items():
+            values = np.asarray(values, dtype=float)
+            if len(values):
+                series[name] = {'sum': float(values.sum()), 'mean': float(values.mean()),
+                                'max': float(values.max()), 'argmax': int(values.argmax())}
+        timers = dict(sorted(((name, timer[0]) for name, timer in self.timers.items()), key=lambda item: -item[1]))
+        return {'info': self.info, 'timers': timers, 'counters': dict(self.counters), 'series': series}
+
+
+def start_profile(profile, info=None):
+    """
+    Profile of a run: a new Profile if profile is None, no profiling if it is False.
+    """
+    if profile is None:
+        profile = Profile()
+    if not profile:
+        return None
+    profile.info.update(info or {})
+    return profile
+
+
+def profile_path(path):
+    """
+    Path of the profile saved next to a run file.
+    """
+    return os.path.splitext(path)[0] + '.profile.json'
+
+
+def write_profile(path, profile):
+    """
+    Save the profile of the run file path as JSON next to it.
+    """
+    from Simulation.output import atomic_write
+    from Simulation.trajectory_store import json_safe
+    atomic_write(profile_path(path), lambda file: json.dump(json_safe(profile.to_dict()), file))
+
+
+def read_profile(path):
+    """
+    Saved profile (dict) of a run file, or None if there is none.
+    """
+    if not os.path.exists(profile_path(path)):
+        return None
+    with open(profile_path(path)) as file:
+        return json.load(file)
+
+
+def profile_report(paths, top=10, verbose=True):
+    """
+    Rank the runs of a sweep by run time.
+    paths: run files (e.g. RunCatalog.paths(sweep=...)), runs without a saved profile are skipped
+    Returns a list of dicts (slowest first) with the path, c, run time, the total of every timer,
+    the generations and fitness evaluations of the GA and the function evaluations of the solver.
+    """
+    rows = []
+    for path in paths:
+        profile = read_profile(path)
+        if profile is None:
+            continue
+        timers = {name: timer['total'] for name, timer in profile['timers'].items()}
+        counters = profile['counters']
+        rows.append({'path': path, 'c': profile['info'].get('c'), 'run': timers.get('run', 0.0), 'timers': timers,
+                     'generations': counters.get('generations', 0),
+                     'fitness_evaluations': counters.get('fitness_evaluations', 0),
+                     'nfev': counters.get('nfev', 0), 'rejected_steps': counters.get('rejected_steps', 0)})
+    rows.sort(key=lambda row: -row['run'])
+
+    if verbose:
+        phases = ['ga_step', 'fitness', 'integration', 'write']
+        print(f"{'c':>10s} {'run (s)':>9s} " + " ".join(f"{phase:>12s}" for phase in phases)
+              + f" {'generations':>12s} {'nfev':>9s} {'rejected':>9s}")
+        for row in rows[:top]:
+            c = 'nan' if row['c'] is None else f"{row['c']:.5f}"
+            print(f"{c:>10s} {row['run']:9.2f} " + " ".join(f"{row['timers'].get(phase, 0.0):12.3f}" for phase in phases)
+                  + f" {row['generations']:12d} {row['nfev']:9d} {row['rejected_steps']:9d}")
+
+    return rows
@@ -0,0 +1,136 @@
+# Headless runner
+# This module runs simulation jobs described in a config file (JSON or TOML) without a notebook:
+# single open-loop, closed-loop or policy runs written to a file, and parameter sweeps (Simulation.sweep).
+# A config is either one job or a list of jobs under the key "jobs", for example in TOML:
+#
+#   [[jobs]]
+#   mode = "closed_loop"
+#   output = "Output_data/run_ga_c_0.02.kpt"
+#   parameters = {c = 0.02}
+#   ga_settings = {random_seed = 0}
+#
+#   [[jobs]]
+#   mode = "sweep"
+#   run_mode = "open_loop"
+#   output_dir = "Output_data/0004_c_sweep"
+#   tag = "0004_c"
+#   grid = {c = {start = -0.005, stop = 0.05, num = 100}}
+#
+# Modules are imported when a job needs them, so a worker only loads numpy and scipy for the simulation
+# (plus pygad for closed-loop runs, and tomli for TOML configs before Python 3.11).
+
+# Imports
+import json
+import time
+
+import numpy as np
+
+# Job modes and the keys they accept
+JOB_KEYS = {
+    'open_loop': {'mode', 'output', 'parameters', 'settings', 'integrator', 'catalog'},
+    'closed_loop': {'mode', 'output', 'parameters', 'settings', 'integrator', 'catalog', 'ga_settings'},
+    'policy': {'mode', 'output', 'parameters', 'settings', 'integrator', 'catalog', 'policy'},
+    'sweep': {'mode', 'run_mode', 'output_dir', 'tag', 'grid', 'settings', 'ga_settings', 'seed', 'workers',
+              'file_format', 'catalog', 'policy'},
+}
+
+
+def load_config(path):
+    """
+    Read a config file (.json or .toml) and return its list of jobs.
+    """
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, 'rb') as file:
+            config = tomllib.load(file)
+    elif path.endswith('.json'):
+        with open(path) as file:
+            config = json.load(file)
+    else:
+        raise ValueError(f"Unknown config format of {path}. Use .json or .toml.")
+
+    jobs = config['jobs'] if 'jobs' in config else [config]
+    for job in jobs:
+        validate_job(job)
+    return jobs
+
+
+def validate_job(job):
+    """
+    Check the mode and keys of a job before anything is run.
+    """
+    mode = job.get('mode')
+    if mode not in JOB_KEYS:
+        raise ValueError(f"Invalid job mode '{mode}'. Choose from {list(JOB_KEYS)}.")
+    unknown = set(job) - JOB_KEYS[mode]
+    if unknown:
+        raise ValueError(f"Unknown keys {sorted(unknown)} in a '{mode}' job.")
+    required = ['output_dir', 'tag', 'grid'] if mode == 'sweep' else ['output']
+    missing = [key for key in required if key not in job]
+    if (mode == 'policy' or job.get('run_mode') == 'policy') and 'policy' not in job:
+        missing.append('policy')
+    if missing:
+        raise ValueError(f"Missing keys {missing} in a '{mode}' job.")
+
+
+def grid_values(spec):
+    """
+    Values of one sweep parameter: a list, or a dict with start, stop and num (as np.linspace).
+    """
+    if isinstance(spec, dict):
+        return np.linspace(spec['start'], spec['stop'], int(spec['num']))
+    return np.atleast_1d(np.asarray(spec, dtype=float))
+
+
+def run_job(job, verbose=True):
+    """
+    Run one job and return the written file paths.
+    """
+    validate_job(job)
+    mode = job['mode']
+
+    if mode == 'sweep':
+        from Simulation.sweep import parameter_grid, run_sweep
+
+        grid = parameter_grid(**{name: grid_values(spec) for name, spec in job['grid'].items()})
+        return run_sweep(grid, job['output_dir'], job['tag'], mode=job.get('run_mode', 'open_loop'),
+                         workers=job.get('workers'), settings=job.get('settings'),
+                         ga_settings=job.get('ga_settings'), seed=job.get('seed'),
+                         file_format=job.get('file_format', 'csv'), catalog=job.get('catalog'),
+                         policy=job.get('policy'))
+
+    from Model.integration import kp_integrate
+    from Simulation.output import write_run
+    from Simulation import simulation
+
+    options = dict(parameters=job.get('parameters'), settings=job.get('settings'),
+                   integrator=kp_integrate(**job['integrator']) if job.get('integrator') else None)
+    start = time.perf_counter()
+    if mode == 'open_loop':
+        run = simulation.run_open_loop(**options)
+    elif mode == 'closed_loop':
+        run = simulation.run_closed_loop(ga_settings=job.get('ga_settings'), **options)
+    else:
+        run = simulation.run_policy(job['policy'], **options)
+
+    write_run(job['output'], run)
+    if job.get('catalog'):
+        from Simulation.catalog import RunCatalog
+        RunCatalog(job['catalog']).record_run(job['output'], run['metadata'],
+                                              features=run['metadata'].get('features'))
+    if verbose:
+        print(f"Saved {mode} run as {job['output']} ({time.perf_counter() - start:.1f} s)")
+    return [job['output']]
+
+
+def run_config(path, verbose=True):
+    """
+    Run all jobs of a config file in order and return the written file paths.
+    """
+    paths = []
+    for job in load_config(path):
+        paths += run_job(job, verbose=verbose)
+    return paths
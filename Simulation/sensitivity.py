@@ -0,0 +1,251 @@
+# Sensitivity analysis module
+# This module estimates how the outcome of an untreated run depends on several dimensional parameters at once.
+# Parameter sets are drawn with a Saltelli (Sobol sequence) or Latin hypercube design, non-dimensionalized
+# with nondim and integrated in large batches with the ensemble integrator, split over a process pool.
+# Sobol first-order and total-order indices are computed from the Saltelli design
+# and partial rank correlation coefficients (PRCC) from any design.
+#
+# Time scaling: nondim uses t_s = r_2, so samples with different r_2 have different non-dimensional time axes.
+# The batch is integrated in days instead (every non-dimensional rate is multiplied by t_s), on the day grid
+# of the base parameters, so all samples share the same sampling times.
+
+# Imports
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.special import erfinv
+from scipy.stats import qmc, rankdata
+
+from Simulation.parameters import DEFAULT_PARAMETERS, DEFAULT_SETTINGS, scaled_parameters, time_grid
+
+# Default ranges of the dimensional parameters (low, high)
+DEFAULT_RANGES = {
+    'c': (0.0, 0.05),  # antigenicity (range of the notebook sweeps)
+    'r_2': (0.15, 0.21),  # tumor growth rate (days^-1)
+    'alpha': (0.5, 1.5),  # immune system strength for tumor removal (days^-1)
+    'p_1': (0.1, 0.15),  # proliferation rate of effector cells (days^-1)
+    'mu_2': (0.02, 0.04),  # inverse lifetime of effector cells (days^-1)
+    'g_2': (5e4, 2e5),  # threshold for tumor cell removal (cells)
+}
+
+# Output features of evaluate
+FEATURES = ['y_final', 'y_max', 'tail_mean', 'amplitude']
+
+# Positions of the rate parameters in the kp_coupled parameter list (multiplied by t_s for integration in days)
+_RATE_INDEX = [0, 1, 2, 4, 5, 7, 9, 11, 12]  # c, mu_2, p_1, s_1, r_2, alpha, p_2, mu_3, s_2
+
+
+# Sampling
+
+def _scale(unit, ranges):
+    low = np.array([ranges[name][0] for name in ranges], dtype=float)
+    high = np.array([ranges[name][1] for name in ranges], dtype=float)
+    return low + unit*(high - low)
+
+
+def saltelli_sample(ranges=DEFAULT_RANGES, n=1024, seed=None):
+    """
+    Saltelli design for Sobol indices.
+    Two independent blocks A and B of n points are taken from a scrambled Sobol sequence of dimension 2d,
+    and for every parameter i the block AB_i is A with column i taken from B.
+    n should be a power of 2 (balance property of the Sobol sequence).
+    Returns the parameter names and an (n*(d+2), d) array of samples ordered [A, B, AB_1, ..., AB_d].
+    """
+    names = list(ranges)
+    d = len(names)
+    base = qmc.Sobol(2*d, scramble=True, seed=seed).random(n)
+    a, b = base[:, :d], base[:, d:]
+
+    blocks = [a, b]
+    for i in range(d):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        blocks.append(ab)
+
+    return names, _scale(np.vstack(blocks), ranges)
+
+
+def lhs_sample(ranges=DEFAULT_RANGES, n=1000, seed=None):
+    """
+    Latin hypercube design of n points.
+    Returns the parameter names and an (n, d) array of samples.
+    """
+    names = list(ranges)
+    return names, _scale(qmc.LatinHypercube(len(names), seed=seed).random(n), ranges)
+
+
+# Evaluation
+
+def _batch_parameters(names, samples, parameters):
+    """
+    kp_coupled parameter arrays (N, 13) of the samples, with the rates scaled to days.
+    """
+    rows = []
+    for values in samples:
+        p = dict(parameters, **dict(zip(names, values)))
+        params, t_s = scaled_parameters(p)
+        params = np.array(params)
+        params[_RATE_INDEX] *= t_s
+        rows.append(params)
+    return np.array(rows)
+
+
+def _evaluate_chunk(task):
+    """
+    Integrate one chunk of samples and return its features (executed in a worker process).
+    """
+    params, t, tail, backend, rtol, atol = task
+
+    from Model.integration import kp_integrate
+
+    integrator = kp_integrate(rtol=rtol, atol=atol, max_step=np.inf, backend=backend)
+    num_steps = len(t)
+    n = len(params)
+
+    # Initial non-dimensional x, y, z values are 1.0
+    states = np.ones((n, 3))
+    y_max = states[:, 1].copy()
+    tail_min, tail_max = np.full(n, np.inf), np.full(n, -np.inf)
+    tail_sum = np.zeros(n)
+
+    for step in range(1, num_steps):
+        states = integrator.integrate_batch(states, params, (t[step-1], t[step]))
+        y = states[:, 1]
+        np.maximum(y_max, y, out=y_max)
+        if step >= num_steps - tail:
+            np.minimum(tail_min, y, out=tail_min)
+            np.maximum(tail_max, y, out=tail_max)
+            tail_sum += y
+
+    return {'y_final': states[:, 1].copy(), 'y_max': y_max, 'tail_mean': tail_sum / tail,
+            'amplitude': tail_max - tail_min}
+
+
+def evaluate(names, samples, parameters=None, settings=None, tail=500, workers=None, chunk_size=256,
+             backend=None, rtol=1e-7, atol=1e-9):
+    """
+    Run the untreated model for every sample and compute the output features.
+    names, samples: parameter names and (N, d) array of dimensional values (see saltelli_sample, lhs_sample)
+    parameters: dict of dimensional parameters overriding DEFAULT_PARAMETERS for the parameters not sampled
+    settings: dict of simulation settings overriding DEFAULT_SETTINGS
+    tail: number of final steps for tail_mean and amplitude (as in extract_features)
+    workers: number of worker processes (default os.cpu_count())
+    backend: integration backend name (default the fastest available, see Model.backends)
+    Returns a dict of feature name -> (N,) array: y_final (final tumor burden), y_max (peak tumor burden),
+    tail_mean (mean of y over the tail) and amplitude (max - min of y over the tail).
+    """
+    from Model.backends import get_backend
+
+    parameters = dict(DEFAULT_PARAMETERS, **(parameters or {}))
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    backend = backend or get_backend().name
+
+    # Common sampling times in days (day grid of the given parameters)
+    t, _ = time_grid(parameters, settings)
+    tail = min(tail, len(t))
+
+    params = _batch_parameters(names, np.atleast_2d(samples), parameters)
+    tasks = [(params[start:start + chunk_size], t, tail, backend, rtol, atol)
+             for start in range(0, len(params), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        results = [_evaluate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            results = list(executor.map(_evaluate_chunk, tasks))
+
+    return {name: np.concatenate([result[name] for result in results]) for name in FEATURES}
+
+
+# Sensitivity indices
+
+def _sobol_estimates(f_a, f_b, f_ab):
+    # First order (Saltelli 2010) and total order (Jansen 1999) estimators
+    variance = np.var(np.concatenate((f_a, f_b)))
+    if variance == 0:
+        nan = np.full(f_ab.shape[0], np.nan)
+        return nan, nan
+    first = np.mean(f_b*(f_ab - f_a), axis=1) / variance
+    total = 0.5*np.mean((f_a - f_ab)**2, axis=1) / variance
+    return first, total
+
+
+def sobol_indices(output, d, num_resamples=100, conf_level=0.95, seed=None):
+    """
+    Sobol first-order (S1) and total-order (ST) indices from the outputs of a Saltelli design.
+    output: (n*(d+2),) array of one feature, in the order of saltelli_sample
+    d: number of parameters
+    Confidence intervals (S1_conf, ST_conf, half-widths at conf_level) are estimated by bootstrap.
+    Returns a dict of (d,) arrays.
+    """
+    output = np.asarray(output, dtype=float)
+    n = len(output) // (d + 2)
+    if n*(d + 2) != len(output):
+        raise ValueError(f"Output length {len(output)} does not match a Saltelli design with {d} parameters.")
+
+    f_a, f_b = output[:n], output[n:2*n]
+    f_ab = output[2*n:].reshape(d, n)
+    first, total = _sobol_estimates(f_a, f_b, f_ab)
+
+    rng = np.random.default_rng(seed)
+    resamples = [_sobol_estimates(f_a[idx], f_b[idx], f_ab[:, idx])
+                 for idx in rng.integers(0, n, size=(num_resamples, n))]
+    first_samples = np.array([r[0] for r in resamples])
+    total_samples = np.array([r[1] for r in resamples])
+    # Half-width of the normal interval with the bootstrap spread
+    z = np.sqrt(2)*erfinv(conf_level)
+
+    return {'S1': first, 'ST': total,
+            'S1_conf': z*np.std(first_samples, axis=0), 'ST_conf': z*np.std(total_samples, axis=0)}
+
+
+def prcc(samples, output):
+    """
+    Partial rank correlation coefficients of an output with each parameter (for Latin hypercube designs).
+    The ranks of the parameter and the output are both corrected for the other parameters by linear
+    regression, and the coefficient is the correlation of the residuals.
+    Returns a (d,) array.
+    """
+    ranks = np.column_stack([rankdata(column) for column in np.asarray(samples, dtype=float).T])
+    output_ranks = rankdata(output)
+    n, d = ranks.shape
+
+    coefficients = np.empty(d)
+    for i in range(d):
+        others = np.column_stack((np.ones(n), np.delete(ranks, i, axis=1)))
+        residual_x = ranks[:, i] - others @ np.linalg.lstsq(others, ranks[:, i], rcond=None)[0]
+        residual_y = output_ranks - others @ np.linalg.lstsq(others, output_ranks, rcond=None)[0]
+        denominator = np.sqrt(np.sum(residual_x**2)*np.sum(residual_y**2))
+        coefficients[i] = np.sum(residual_x*residual_y)/denominator if denominator > 0 else np.nan
+    return coefficients
+
+
+def run_sensitivity(ranges=DEFAULT_RANGES, n=1024, method='saltelli', seed=None, features=FEATURES,
+                    log_outputs=False, **options):
+    """
+    Sample, evaluate and analyse in one call.
+    method: 'saltelli' (Sobol indices and PRCC) or 'lhs' (PRCC only)
+    log_outputs: compute the indices of log10 of the features (floored at 1e-12); y spans many orders of
+                 magnitude at low c, and a few large values can dominate variance-based indices
+    options: keyword arguments for evaluate (parameters, settings, workers, ...)
+    Returns a dict with the parameter names, samples, outputs and, per feature, the indices.
+    """
+    if method == 'saltelli':
+        names, samples = saltelli_sample(ranges, n, seed=seed)
+    elif method == 'lhs':
+        names, samples = lhs_sample(ranges, n, seed=seed)
+    else:
+        raise ValueError(f"Invalid sampling method '{method}'. Choose 'saltelli' or 'lhs'.")
+
+    outputs = evaluate(names, samples, **options)
+
+    indices = {}
+    for feature in features:
+        values = np.log10(np.maximum(outputs[feature], 1e-12)) if log_outputs else outputs[feature]
+        indices[feature] = {'prcc': prcc(samples, values)}
+        if method == 'saltelli':
+            indices[feature].update(sobol_indices(values, len(names), seed=seed))
+
+    return {'names': names, 'samples': samples, 'outputs': outputs, 'indices': indices}
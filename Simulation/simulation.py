@@ -0,0 +1,219 @@
+# Simulation module
+# This module runs the KP model over the whole simulation horizon, without treatment (open loop)
+# or with the GA choosing s_1 and s_2 at every time step (closed loop),
+# or with a fixed feedback policy optimized offline (GA.policy).
+# A run is returned as a dict with the output columns of the main notebook and the run metadata.
+# Feature sinks (Simulation.features) are updated after every step and their results are stored in the metadata.
+# Counters and timers of the run are collected in a Profile (Simulation.profiling), returned as run['profile'].
+# With settings['termination'], runs end early on tumor clearance, a fixed point or a limit cycle (Model.termination).
+
+# Imports
+import time
+
+import numpy as np
+
+from Model.integration import kp_integrate
+from Model.termination import Termination
+from Simulation.features import default_sinks
+from Simulation.parameters import DEFAULT_PARAMETERS, DEFAULT_SETTINGS, scaled_parameters, time_grid
+from Simulation.profiling import start_profile
+
+# Output columns (same order as the CSV files of the main notebook)
+COLUMNS = ['t', 'tau', 'x', 'y', 'z', 'E', 'T', 'IL', 's_1', 's_2', 'Fitness']
+
+
+def make_run(p, settings, mode, tau, states, s_1_array, s_2_array, fitness_history, termination=None):
+    """
+    Collect the output columns and metadata of a run.
+    The run ends with the last state (before the end of tau if the termination action is 'stop').
+    """
+    num_steps = len(states)
+    tau = tau[:num_steps]
+    t_s = p['r_2']  # time scale (days)
+    x, y, z = states.T
+
+    # The GA of control step i (which sets the doses of row i) is the (i-1)-th entry of fitness_history and is
+    # stored at index i-1, as in the notebook files; the last row and rows without a GA run are nan
+    fitness = np.full(num_steps, np.nan)
+    fitness[:len(fitness_history)] = fitness_history
+
+    columns = {
+        't': np.arange(num_steps),
+        'tau': tau,
+        'x': x,
+        'y': y,
+        'z': z,
+        'E': x * p['E0'],  # dimensionalize back to E
+        'T': y * p['T0'],  # dimensionalize back to T
+        'IL': z * p['IL0'],  # dimensionalize back to IL
+        's_1': s_1_array / (t_s*p['E0']),
+        's_2': s_2_array / (t_s*p['IL0']),
+        'Fitness': fitness,
+    }
+    metadata = {'mode': mode, 'parameters': p, 'settings': settings}
+    if termination is not None:
+        metadata['termination'] = dict(termination.info)
+
+    return {'columns': columns, 'metadata': metadata}
+
+
+def _finish_profile(run, profile, start):
+    """
+    Add the run time to the profile and attach it to the run.
+    """
+    if profile is not None:
+        profile.add_time('run', time.perf_counter() - start)
+        run['profile'] = profile
+
+
+def _termination(settings):
+    """
+    Termination checks of the settings (keyword arguments of Model.termination.Termination), or None.
+    """
+    options = settings.get('termination')
+    return Termination(**options) if options is not None else None
+
+
+def _start_sinks(sinks, num_steps):
+    """
+    Prepare the feature sinks and return the per-step callback of the integrator.
+    """
+    if sinks is None:
+        return None
+    sinks.begin(num_steps)
+    return sinks.update
+
+
+def run_open_loop(parameters=None, settings=None, integrator=None, sinks=None, profile=None):
+    """
+    Simulation without treatment input (s_1, s_2 from the parameters, 0 by default).
+    parameters: dict of dimensional parameters overriding DEFAULT_PARAMETERS
+    settings: dict of simulation settings overriding DEFAULT_SETTINGS
+    integrator: kp_integrate instance (default RK45)
+    sinks: FeatureSinkSet updated after every step (default_sinks() if None, False to disable)
+    profile: Profile receiving the counters and timers of the run (a new one if None, False to disable)
+    """
+    start = time.perf_counter()
+    p = dict(DEFAULT_PARAMETERS, **(parameters or {}))
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    integrator = integrator or kp_integrate()
+    sinks = default_sinks() if sinks is None else sinks or None
+    profile = start_profile(profile, {'mode': 'open_loop', 'c': p['c']})
+
+    params, t_s = scaled_parameters(p)
+    _, tau = time_grid(p, settings)
+    termination = _termination(settings)
+
+    # Initial non-dimensional x, y, z values are 1.0
+    states, s_1_array, s_2_array = integrator.integrate_trajectory([1.0, 1.0, 1.0], params, tau,
+                                                                   on_step=_start_sinks(sinks, len(tau)),
+                                                                   profile=profile, termination=termination)
+
+    run = make_run(p, settings, 'open_loop', tau, states, s_1_array, s_2_array, [], termination)
+    if sinks is not None:
+        run['metadata']['features'] = sinks.results()
+    _finish_profile(run, profile, start)
+
+    return run
+
+
+def run_closed_loop(parameters=None, settings=None, integrator=None, controller=None, ga_settings=None, sinks=None,
+                    profile=None):
+    """
+    Simulation with the GA choosing s_1 and s_2 at every time step.
+    parameters: dict of dimensional parameters overriding DEFAULT_PARAMETERS
+    settings: dict of simulation settings overriding DEFAULT_SETTINGS
+    integrator: kp_integrate instance (default RK45)
+    controller: RecedingHorizonGA instance (default built from ga_settings)
+    ga_settings: keyword arguments for RecedingHorizonGA (e.g. 'cache', a GA.policy_cache.PolicyCache or its
+                 settings; a cache with a path is saved after the run)
+    sinks: FeatureSinkSet updated after every step (default_sinks() if None, False to disable)
+    profile: Profile receiving the counters and timers of the run (a new one if None, False to disable)
+    """
+    from GA.controller import RecedingHorizonGA, feedback_law
+
+    start = time.perf_counter()
+    p = dict(DEFAULT_PARAMETERS, **(parameters or {}))
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    integrator = integrator or kp_integrate()
+    controller = controller or RecedingHorizonGA(**(ga_settings or {}))
+    sinks = default_sinks() if sinks is None else sinks or None
+    profile = start_profile(profile, {'mode': 'closed_loop', 'c': p['c']})
+    controller.profile = profile
+
+    params, t_s = scaled_parameters(p)
+    _, tau = time_grid(p, settings)
+    termination = _termination(settings)
+
+    fitness_history = []
+
+    def dosing(step, t, state):
+        # Step of Genetic Algorithm for time step
+        x, y, z = state
+        environment = {'t': step-1, 'x': x, 'y': y, 'z': z, 'params': params, 'dt': tau[step] - tau[step-1]}
+        best_solution, best_solution_fitness, _ = controller.step(environment)
+        fitness_history.append(best_solution_fitness)
+
+        # Calculate s_1 and s_2 based on genes and current state
+        return feedback_law(best_solution, x, y, z)
+
+    states, s_1_array, s_2_array = integrator.integrate_trajectory([1.0, 1.0, 1.0], params, tau, dosing=dosing,
+                                                                   on_step=_start_sinks(sinks, len(tau)),
+                                                                   profile=profile, termination=termination)
+
+    run = make_run(p, settings, 'closed_loop', tau, states, s_1_array, s_2_array, fitness_history,
+                    termination)
+    run['metadata']['ga_settings'] = {k: (v.to_dict() if k == 'cache' and hasattr(v, 'to_dict') else v)
+                                      for k, v in (ga_settings or {}).items()}
+    run['metadata']['generations'] = list(controller.generations_history)
+    if controller.cache is not None:
+        # Hits and misses of the cache over its lifetime (it can be shared by several runs)
+        run['metadata']['policy_cache'] = controller.cache.stats()
+        if controller.cache.path is not None:
+            controller.cache.save()
+    if sinks is not None:
+        run['metadata']['features'] = sinks.results()
+    _finish_profile(run, profile, start)
+
+    return run
+
+
+def run_policy(policy, parameters=None, settings=None, integrator=None, sinks=None, profile=None):
+    """
+    Simulation with a fixed feedback policy choosing s_1 and s_2 at every time step (see GA.policy).
+    policy: GA.policy.Policy or the path of a saved policy
+    parameters: dict of dimensional parameters overriding DEFAULT_PARAMETERS
+    settings: dict of simulation settings overriding DEFAULT_SETTINGS
+    integrator: kp_integrate instance (default RK45)
+    sinks: FeatureSinkSet updated after every step (default_sinks() if None, False to disable)
+    profile: Profile receiving the counters and timers of the run (a new one if None, False to disable)
+    """
+    from GA.policy import Policy
+
+    start = time.perf_counter()
+    policy = Policy.load(policy) if isinstance(policy, str) else policy
+    p = dict(DEFAULT_PARAMETERS, **(parameters or {}))
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    integrator = integrator or kp_integrate()
+    sinks = default_sinks() if sinks is None else sinks or None
+    profile = start_profile(profile, {'mode': 'policy', 'c': p['c']})
+
+    params, t_s = scaled_parameters(p)
+    t, tau = time_grid(p, settings)
+    termination = _termination(settings)
+
+    def dosing(step, _, state):
+        # Gene vector of the schedule at the start of the step (days)
+        return policy.dose(t[step-1], *state)
+
+    states, s_1_array, s_2_array = integrator.integrate_trajectory([1.0, 1.0, 1.0], params, tau, dosing=dosing,
+                                                                   on_step=_start_sinks(sinks, len(tau)),
+                                                                   profile=profile, termination=termination)
+
+    run = make_run(p, settings, 'policy', tau, states, s_1_array, s_2_array, [], termination)
+    run['metadata']['policy'] = policy.to_dict()
+    if sinks is not None:
+        run['metadata']['features'] = sinks.results()
+    _finish_profile(run, profile, start)
+
+    return run
@@ -0,0 +1,165 @@
+# Parameter sweep module
+# This module runs a grid of parameter sets (e.g. an antigenicity sweep) on a process pool.
+# Every grid point is written to its own file, named by its index, and points whose file already exists
+# are skipped, so an interrupted sweep resumes where it stopped.
+# Each run is recorded in the run catalog (Simulation.catalog) with its parameters, status and summary features.
+# Mode 'lockstep' runs the closed-loop points together in the main process (Simulation.lockstep) instead of the pool.
+
+# Imports
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from Simulation.catalog import CATALOG_NAME, RunCatalog
+from Simulation.output import atomic_write, write_run
+
+
+def parameter_grid(**values):
+    """
+    Cartesian product of parameter values.
+    Example: parameter_grid(c=np.linspace(-0.005, 0.05, 100), r_2=[0.18])
+    Returns a list of dicts of dimensional parameter overrides.
+    """
+    names = list(values)
+    return [dict(zip(names, [float(v) for v in combination]))
+            for combination in itertools.product(*(values[name] for name in names))]
+
+
+def sweep_path(output_dir, tag, idx, point, file_format='csv'):
+    """
+    File path of a grid point. The zero-padded index keeps the file order equal to the grid order.
+    """
+    name = f"simu_data_{tag}_{idx:04d}"
+    if 'c' in point:
+        name += f"_c_{point['c']}"
+    return os.path.join(output_dir, f"{name}_.{file_format}")
+
+
+def _run_point(task):
+    """
+    Run and save a single grid point (executed in a worker process).
+    """
+    idx, path, mode, point, options = task
+
+    from Simulation.catalog import RunCatalog
+    from Simulation.simulation import run_open_loop, run_closed_loop, run_policy
+
+    if mode not in ('open_loop', 'closed_loop', 'policy'):
+        raise ValueError(f"Invalid sweep mode '{mode}'. Choose 'open_loop', 'closed_loop' or 'policy'.")
+
+    catalog = RunCatalog(options['catalog']) if options.get('catalog') else None
+    if catalog is not None:
+        catalog.record_run(path, {'mode': mode, 'parameters': point}, status='running', sweep=options['tag'], idx=idx)
+
+    try:
+        if mode == 'open_loop':
+            run = run_open_loop(point, settings=options.get('settings'))
+        elif mode == 'policy':
+            run = run_policy(options['policy'], point, settings=options.get('settings'))
+        else:
+            ga_settings = dict(options.get('ga_settings') or {})
+            if options.get('seed') is not None:
+                ga_settings['random_seed'] = options['seed'] + idx
+            run = run_closed_loop(point, settings=options.get('settings'), ga_settings=ga_settings)
+
+        run['metadata']['index'] = idx
+        write_run(path, run)
+    except Exception:
+        if catalog is not None:
+            catalog.set_status(path, 'failed')
+        raise
+
+    if catalog is not None:
+        catalog.record_run(path, run['metadata'], status='done', features=run['metadata'].get('features'),
+                           sweep=options['tag'], idx=idx)
+
+    return idx, path
+
+
+def _run_lockstep(tasks, options):
+    """
+    Run and save the pending grid points of a closed-loop sweep in lockstep.
+    """
+    from Simulation.lockstep import run_closed_loop_lockstep
+
+    catalog = RunCatalog(options['catalog']) if options.get('catalog') else None
+    if catalog is not None:
+        for idx, path, _, point, _ in tasks:
+            catalog.record_run(path, {'mode': 'closed_loop', 'parameters': point}, status='running',
+                               sweep=options['tag'], idx=idx)
+
+    ga_settings = dict(options.get('ga_settings') or {})
+    if options.get('seed') is not None:
+        ga_settings['random_seed'] = options['seed']
+    try:
+        runs = run_closed_loop_lockstep([task[3] for task in tasks], settings=options.get('settings'),
+                                        ga_settings=ga_settings)
+    except Exception:
+        if catalog is not None:
+            for task in tasks:
+                catalog.set_status(task[1], 'failed')
+        raise
+
+    for (idx, path, _, _, _), run in zip(tasks, runs):
+        run['metadata']['index'] = idx
+        write_run(path, run)
+        if catalog is not None:
+            catalog.record_run(path, run['metadata'], status='done', features=run['metadata'].get('features'),
+                               sweep=options['tag'], idx=idx)
+        print("Saved as", path)
+
+
+def run_sweep(grid, output_dir, tag, mode='open_loop', workers=None, settings=None, ga_settings=None, seed=None,
+              file_format='csv', catalog=None, policy=None):
+    """
+    Run a parameter sweep on a process pool.
+    grid: list of dicts of dimensional parameter overrides (see parameter_grid)
+    output_dir: folder for the run files
+    tag: name of the sweep used in the file names, e.g. '0001_c'
+    mode: 'open_loop', 'closed_loop', 'policy' or 'lockstep' (closed loop, all pending points advanced together
+          by Simulation.lockstep in this process; the GA is seeded once with seed)
+    workers: number of worker processes (default: number of CPUs)
+    settings: simulation settings for all runs
+    ga_settings: RecedingHorizonGA settings for closed-loop runs
+    seed: base random seed, run idx uses seed + idx
+    file_format: 'csv' or 'kpt' (binary trajectory store)
+    catalog: path of the run catalog (default: catalog.sqlite in the parent folder of output_dir, False to disable)
+    policy: path of the saved policy of 'policy' runs (see GA.policy)
+    Returns the list of file paths in grid order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [sweep_path(output_dir, tag, idx, point, file_format) for idx, point in enumerate(grid)]
+
+    # Manifest of the sweep mapping each index to its parameters and file
+    manifest = {'tag': tag, 'mode': mode, 'settings': settings, 'ga_settings': ga_settings, 'seed': seed,
+                'policy': policy,
+                'runs': [{'index': idx, 'parameters': point, 'path': os.path.basename(path)}
+                         for idx, (point, path) in enumerate(zip(grid, paths))]}
+    atomic_write(os.path.join(output_dir, f"sweep_{tag}.json"), lambda file: json.dump(manifest, file, indent=2))
+
+    if catalog is None:
+        catalog = os.path.join(os.path.dirname(os.path.abspath(output_dir)), CATALOG_NAME)
+    if catalog:
+        RunCatalog(catalog) # create the tables before the workers start
+
+    # Skip points that have already been written
+    options = {'settings': settings, 'ga_settings': ga_settings, 'seed': seed, 'tag': tag, 'catalog': catalog,
+               'policy': policy}
+    tasks = [(idx, path, mode, point, options)
+             for idx, (point, path) in enumerate(zip(grid, paths)) if not os.path.exists(path)]
+    print(f"{len(grid) - len(tasks)} of {len(grid)} runs already done.")
+
+    if tasks and mode == 'lockstep':
+        _run_lockstep(tasks, options)
+    elif tasks:
+        workers = workers or os.cpu_count()
+        if workers == 1:
+            for task in tasks:
+                _run_point(task)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                for idx, path in executor.map(_run_point, tasks):
+                    print("Saved as", path)
+
+    return paths
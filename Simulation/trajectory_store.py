@@ -0,0 +1,170 @@
+# Trajectory store
+# This module reads and writes simulation runs in a compact binary columnar format (.kpt).
+# File layout:
+#   8 bytes   magic b'KPTRAJ01'
+#   8 bytes   header length (little-endian uint64)
+#   header    JSON with the number of rows, the column names/dtypes/offsets and the run metadata
+#   data      one contiguous little-endian block per column, each aligned to 64 bytes
+# Columns are read with numpy memory maps, so a single column (e.g. y) can be read without loading the rest.
+
+# Imports
+import glob
+import json
+import os
+import re
+import struct
+
+import numpy as np
+
+from Simulation.output import atomic_write
+
+MAGIC = b'KPTRAJ01'
+ALIGNMENT = 64
+EXTENSION = '.kpt'
+
+# Column types of a simulation run
+COLUMN_DTYPES = {'t': '<i8'}
+DEFAULT_DTYPE = '<f8'
+
+
+def json_safe(value):
+    """
+    Convert numpy values in the metadata to plain Python types.
+    """
+    if isinstance(value, dict):
+        return {str(k): json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return json_safe(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _aligned(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_trajectory(path, run):
+    """
+    Save a simulation run ({'columns': {...}, 'metadata': {...}}) to a .kpt file.
+    """
+    columns = {name: np.ascontiguousarray(values, dtype=COLUMN_DTYPES.get(name, DEFAULT_DTYPE))
+               for name, values in run['columns'].items()}
+    num_rows = len(next(iter(columns.values()))) if columns else 0
+
+    # Column offsets relative to the start of the data block
+    layout = []
+    offset = 0
+    for name, values in columns.items():
+        if len(values) != num_rows:
+            raise ValueError(f"Column '{name}' has {len(values)} rows, expected {num_rows}.")
+        layout.append({'name': name, 'dtype': values.dtype.str, 'offset': offset})
+        offset = _aligned(offset + values.nbytes)
+
+    header = json.dumps({'version': 1, 'num_rows': num_rows, 'columns': layout,
+                         'metadata': json_safe(run.get('metadata', {}))}).encode('utf-8')
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    def write(file):
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(header)))
+        file.write(header)
+        file.write(b'\0' * (data_start - len(MAGIC) - 8 - len(header)))
+        position = 0
+        for column, values in zip(layout, columns.values()):
+            file.write(b'\0' * (column['offset'] - position))
+            file.write(values.tobytes())
+            position = column['offset'] + values.nbytes
+
+    atomic_write(path, write, mode='wb')
+
+
+def read_header(path):
+    """
+    Read the header of a .kpt file.
+    Returns the header dict and the byte offset of the data block.
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a KP trajectory file.")
+        (header_length,) = struct.unpack('<Q', file.read(8))
+        header = json.loads(file.read(header_length).decode('utf-8'))
+
+    return header, _aligned(len(MAGIC) + 8 + header_length)
+
+
+def read_trajectory(path, columns=None, mmap=True):
+    """
+    Read a .kpt file.
+    columns: list of column names to read (default all)
+    mmap: return read-only memory maps instead of loading the columns into memory
+    Returns a dict of column arrays and the run metadata.
+    """
+    header, data_start = read_header(path)
+    layout = {column['name']: column for column in header['columns']}
+    names = list(layout) if columns is None else list(columns)
+
+    data = {}
+    for name in names:
+        if name not in layout:
+            raise KeyError(f"Column '{name}' not found in {path}.")
+        column = layout[name]
+        if header['num_rows'] == 0:
+            data[name] = np.zeros(0, dtype=column['dtype'])
+        elif mmap:
+            data[name] = np.memmap(path, dtype=column['dtype'], mode='r',
+                                   offset=data_start + column['offset'], shape=(header['num_rows'],))
+        else:
+            with open(path, 'rb') as file:
+                file.seek(data_start + column['offset'])
+                data[name] = np.fromfile(file, dtype=column['dtype'], count=header['num_rows'])
+
+    return data, header['metadata']
+
+
+def legacy_metadata(csv_path):
+    """
+    Metadata of a CSV file written by the main notebook.
+    The sweep file names store c + 1, e.g. simu_data_0001_c_1.0294444444444444_.csv.
+    """
+    metadata = {'source': os.path.basename(csv_path)}
+    match = re.search(r'_c_(?:ga_)?(-?[0-9.]+(?:e-?[0-9]+)?)_\.csv$', csv_path)
+    if match:
+        metadata['parameters'] = {'c': float(match.group(1)) - 1}
+    return metadata
+
+
+def convert_csv(csv_path, kpt_path=None):
+    """
+    Convert a CSV file of the main notebook to a .kpt file next to it.
+    Returns the path of the new file.
+    """
+    kpt_path = kpt_path or os.path.splitext(csv_path)[0] + EXTENSION
+
+    table = np.genfromtxt(csv_path, delimiter=',', names=True, dtype=float, filling_values=np.nan)
+    columns = {name: table[name] for name in table.dtype.names}
+    columns['t'] = columns['t'].astype(np.int64)
+
+    write_trajectory(kpt_path, {'columns': columns, 'metadata': legacy_metadata(csv_path)})
+    return kpt_path
+
+
+def convert_folder(folder, remove_csv=False):
+    """
+    Convert every CSV file in an Output_data folder to .kpt.
+    Files that already have an up-to-date .kpt file are skipped.
+    Returns the list of .kpt paths.
+    """
+    paths = []
+    for csv_path in sorted(glob.glob(os.path.join(folder, '*.csv'))):
+        kpt_path = os.path.splitext(csv_path)[0] + EXTENSION
+        if not (os.path.exists(kpt_path) and os.path.getmtime(kpt_path) >= os.path.getmtime(csv_path)):
+            convert_csv(csv_path, kpt_path)
+        if remove_csv:
+            os.remove(csv_path)
+        paths.append(kpt_path)
+
+    print(f"Converted {len(paths)} files in {folder}")
+    return paths
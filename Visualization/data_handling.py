@@ -1,63 +1,105 @@
 # This module comtains a data handling functions for reading CSV files saved from the main notebook.
 # It is called in the visualization and slider modules to load data for plotting.
 # It also contains a function to extract features from multiple data files for analysis.
+# CSV files are parsed into NumPy columns in one pass and cached by path and modification time.
+# Binary trajectory files (.kpt, see Simulation.trajectory_store) can be read in place of the CSV files.
+# Runs and their summary features can also be found through the run catalog (Simulation.catalog).
+# extract_features uses the feature summaries saved with the runs (Simulation.features) when they exist.
 
 # Imports
-import csv
+import io
 import os
+import re
+from collections import OrderedDict
+
 import numpy as np
 
+# Column order returned by load_data
+COLUMNS = ['t', 'tau', 'x', 'y', 'z', 'E', 'T', 'IL', 's_1', 's_2', 'Fitness']
+
+# Cache of loaded files: absolute path -> ((mtime, size), columns)
+CACHE_SIZE = 256
+_cache = OrderedDict()
+
+def _parse_csv(file_path):
+    """
+    Parse a CSV file into typed NumPy columns in one pass.
+    Empty cells (e.g. the blank Fitness of rows without a GA run) are read as nan,
+    so all columns keep the same length.
+    """
+    with open(file_path, 'r', newline='') as csvfile:
+        header = csvfile.readline()
+        body = csvfile.read()
+
+    names = [name.strip() for name in header.split(',')]
+
+    # Fill empty cells with nan (the common case is an empty last cell)
+    body = body.replace('\r\n', '\n').rstrip('\n') + '\n'
+    body = body.replace(',\n', ',nan\n')
+    if ',,' in body or body.startswith(',') or '\n,' in body:
+        body = re.sub(r'(?<![^,\n])(?=[,\n])', 'nan', body)
+
+    if body.strip():
+        values = np.loadtxt(io.StringIO(body), delimiter=',', ndmin=2)
+    else:
+        values = np.zeros((0, len(names)))
+
+    # Skip rows with empty t
+    if 't' in names:
+        values = values[~np.isnan(values[:, names.index('t')])]
+
+    columns = {name: values[:, i].copy() for i, name in enumerate(names)}
+    if 't' in columns:
+        columns['t'] = columns['t'].astype(np.int64)
+    return columns
+
+def load_columns(filepath):
+    """
+    Load a CSV or .kpt file as a dict of NumPy columns.
+    Results are cached by path and modification time, so repeated loads of an unchanged file are instant.
+    The returned arrays are read-only.
+    """
+    file_path = os.path.abspath(filepath)
+    stat = os.stat(file_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _cache.get(file_path)
+    if cached is not None and cached[0] == stamp:
+        _cache.move_to_end(file_path)
+        return cached[1]
+
+    if file_path.endswith('.kpt'):
+        from Simulation.trajectory_store import read_trajectory
+        columns, _ = read_trajectory(file_path)
+    else:
+        columns = _parse_csv(file_path)
+        for values in columns.values():
+            values.flags.writeable = False
+
+    _cache[file_path] = (stamp, columns)
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+    return columns
+
+def clear_cache():
+    """
+    Empty the cache of loaded files.
+    """
+    _cache.clear()
+
 # Function to load data from a CSV file
 def load_data(filepath):
-    file_path = filepath
-    print(f"Reading data from {file_path}")
-    with open(file_path, 'r', newline='') as csvfile:
-        # Create a DictReader object
-        csv_dict_reader = csv.DictReader(csvfile)
-        
-        t, tau, x, y, z, E, T, IL, s_1_array, s_2_array, Fitness = [], [], [], [], [], [], [], [], [], [], []
-        
-        for row in csv_dict_reader:
-            if row['t'] == '':
-                continue  # Skip rows with empty t
-            t.append(int(row['t']))
-            if row['tau'] == '':
-                continue  # Skip rows with empty tau
-            tau.append(row['tau'])
-            if row['x'] == '':
-                continue  # Skip rows with empty x
-            x.append(float(row['x']))
-            if row['y'] == '':
-                continue  # Skip rows with empty y
-            y.append(float(row['y']))
-            if row['z'] == '':
-                continue  # Skip rows with empty z
-            z.append(float(row['z']))
-            if row['E'] == '':
-                continue  # Skip rows with empty E
-            E.append(float(row['E']))
-            if row['T'] == '':
-                continue  # Skip rows with empty T
-            T.append(float(row['T']))
-            if row['IL'] == '':
-                continue  # Skip rows with empty IL
-            IL.append(float(row['IL']))
-            if row['s_1'] == '':
-                continue  # Skip rows with empty s_1
-            s_1_array.append(float(row['s_1']))
-            if row['s_2'] == '':
-                continue  # Skip rows with empty s_2
-            s_2_array.append(float(row['s_2']))
-            if row['Fitness'] == '':
-                continue  # Skip rows with empty Fitness
-            Fitness.append(float(row['Fitness']))
-    
-    return t, tau, x, y, z, E, T, IL, s_1_array, s_2_array, Fitness
+    """
+    Outputs like: ['t', 'tau', 'x', 'y', 'z', 'E', 'T', 'IL', 's_1', 's_2', 'Fitness']
+    as NumPy arrays of equal length (Fitness is nan where no GA was run).
+    """
+    columns = load_columns(filepath)
+    return tuple(columns[name] for name in COLUMNS)
 
 
 # function to extract features from data files
 def extract_features(filepath, antigenicity_values):
-    import pandas as pd
 
     amplitudes = []
     c_vals = []
@@ -68,21 +110,29 @@ def extract_features(filepath, antigenicity_values):
     bifur_c0 = []
     bifur_y0 = []
 
+    from Simulation.output import read_features
+
     # find amplitudes for each file
     for idx, f in enumerate(filepath):
-        df = pd.read_csv(f)
-        
-        y = df["y"].values
-        tail = y[-500:]
-        center1 = y[500:1000]
-        center2 = y[1000:1500]
+        # use the feature summary saved with the run if there is one
+        saved = read_features(f)
+        if saved is not None:
+            amp = saved['amplitude']
+            max_val1, max_val2 = saved['max1'], saved['max2']
+            ave_val1, ave_val2 = saved['mean1'], saved['mean2']
+        else:
+            y = load_columns(f)["y"]
+
+            tail = y[-500:]
+            center1 = y[500:1000]
+            center2 = y[1000:1500]
 
-        amp = tail.max() - tail.min()
+            amp = tail.max() - tail.min()
 
-        max_val1 = center1.max()
-        max_val2 = center2.max()
-        ave_val1 = center1.mean()
-        ave_val2 = center2.mean()
+            max_val1 = center1.max()
+            max_val2 = center2.max()
+            ave_val1 = center1.mean()
+            ave_val2 = center2.mean()
 
         # store per run data
         amplitudes.append(amp)
@@ -103,3 +153,29 @@ def extract_features(filepath, antigenicity_values):
     features = np.vstack((c_vals, amplitudes_0, max1_non, max2_non, ave1_non, ave2_non)).T
     return features, c_vals, amplitudes_0
 
+
+# function to find run files in the run catalog
+def catalog_paths(catalog_path, **query):
+    """
+    File paths of the runs in the catalog matching query,
+    e.g. catalog_paths('Output_data/catalog.sqlite', mode='closed_loop', c_min=0.02, c_max=0.03).
+    """
+    from Simulation.catalog import RunCatalog
+
+    return RunCatalog(catalog_path).paths(**query)
+
+
+# function to get the features of extract_features from the run catalog
+def catalog_features(catalog_path, **query):
+    """
+    Same output as extract_features, read from the summary features stored in the catalog
+    instead of the trajectory files. Runs are ordered by sweep index.
+    """
+    from Simulation.catalog import RunCatalog
+
+    runs = RunCatalog(catalog_path).query(**query)
+    rows = [[run['c'], run['features']['amplitude'], run['features']['max1'], run['features']['max2'],
+             run['features']['mean1'], run['features']['mean2']] for run in runs]
+
+    features = np.array(rows, dtype=float).reshape(-1, 6)
+    return features, features[:, 0], features[:, 1]
@@ -0,0 +1,183 @@
+# Downsampling module
+# This module builds a multi-resolution pyramid of a run, so long trajectories can be plotted with a few thousand
+# points per line. Level k of a column splits the rows into buckets of 4 * 2**k rows and keeps the rows
+# of the minimum and maximum of every bucket (a min/max envelope), so oscillation peaks and troughs are never lost.
+# Levels are stored as row indices, which select the points of both the x and the y data of a line.
+# The pyramid is built when a run is saved (Simulation.output.write_run) and saved as a .pyramid.npz file
+# next to the run file; read_pyramid builds it from the run file when there is none.
+
+# Imports
+import os
+
+import numpy as np
+
+# Largest number of points per line served for plotting
+MAX_POINTS = 2000
+
+# Runs with at most this many rows are plotted at full resolution and get no pyramid file
+MIN_ROWS = MAX_POINTS
+
+
+def pyramid_path(path):
+    """
+    Path of the pyramid saved next to a run file.
+    """
+    return os.path.splitext(path)[0] + '.pyramid.npz'
+
+
+def envelope(values, size):
+    """
+    Row indices (sorted) of the minimum and maximum of values in every bucket of size rows.
+    nan values are skipped unless a bucket has nothing else. The first and last row are always kept.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    m = -(-n // size)
+    nan = np.isnan(values)
+
+    low = np.full(m * size, np.inf)
+    low[:n] = np.where(nan, np.inf, values)
+    high = np.full(m * size, -np.inf)
+    high[:n] = np.where(nan, -np.inf, values)
+
+    start = np.arange(m) * size
+    index = np.stack([low.reshape(m, size).argmin(axis=1), high.reshape(m, size).argmax(axis=1)], axis=1)
+    index = np.minimum(np.sort(index, axis=1) + start[:, None], n - 1).ravel()
+    return np.unique(np.concatenate(([0], index, [n - 1])))
+
+
+class Pyramid:
+    """
+    Min/max envelopes of the columns of a run at bucket sizes 4, 8, 16, ... rows.
+    indices: column name -> list of row index arrays, finest level first
+    """
+    def __init__(self, num_rows, bucket_sizes, indices):
+        self.num_rows = int(num_rows)
+        self.bucket_sizes = list(bucket_sizes)
+        self.indices = indices
+
+    @classmethod
+    def build(cls, columns, min_points=MAX_POINTS // 4):
+        """
+        Build the pyramid of a dict of columns (all of the same length).
+        Levels are added until a level has fewer than min_points points.
+        """
+        num_rows = len(next(iter(columns.values()))) if columns else 0
+        sizes = []
+        size = 4
+        while 2 * num_rows / size >= min_points:
+            sizes.append(size)
+            size *= 2
+
+        indices = {name: [envelope(values, size).astype(np.int32) for size in sizes]
+                   for name, values in columns.items()}
+        return cls(num_rows, sizes, indices)
+
+    def select(self, name, start=0, stop=None, max_points=MAX_POINTS, values=None):
+        """
+        Row indices of column name to plot the rows start:stop with at most about max_points points.
+        Uses the finest level that fits (the full rows if they fit), plus one point on each side of the range
+        so the line runs to the edges of the axis.
+        values: the column itself, to add the extremes of the buckets cut by the edges of the range
+        (otherwise these come from the whole buckets, which can lie just outside the range)
+        """
+        stop = self.num_rows if stop is None else min(int(stop), self.num_rows)
+        start = max(int(start), 0)
+        if stop - start <= max_points:
+            return np.arange(max(start - 1, 0), min(stop + 1, self.num_rows))
+
+        levels = self.indices.get(name)
+        if levels is None:
+            raise KeyError(f"Column '{name}' has no pyramid.")
+        for size, index in zip(self.bucket_sizes, levels):
+            first, last = np.searchsorted(index, [start, stop])
+            if last - first <= max_points or index is levels[-1]:
+                break
+        index = index[max(first - 1, 0):last + 1]
+        if values is None:
+            return index
+
+        edges = []
+        for low, high in ((start, min(-(-start // size) * size, stop)), (max(stop // size * size, start), stop)):
+            if high > low:
+                window = np.asarray(values[low:high], dtype=float)
+                if not np.isnan(window).all():
+                    edges += [low + np.nanargmin(window), low + np.nanargmax(window)]
+        return np.union1d(index, edges).astype(index.dtype)
+
+    def save(self, path):
+        """
+        Save the pyramid as .npz (the arrays are stored as '<column>/<level>').
+        """
+        from Simulation.output import atomic_write
+
+        arrays = {f"{name}/{level}": index for name, levels in self.indices.items()
+                  for level, index in enumerate(levels)}
+        atomic_write(path, lambda file: np.savez(file, num_rows=self.num_rows,
+                                                 bucket_sizes=np.array(self.bucket_sizes, dtype=np.int64),
+                                                 **arrays), mode='wb')
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            sizes = data['bucket_sizes'].tolist()
+            indices = {}
+            for key in data.files:
+                if '/' in key:
+                    name, level = key.rsplit('/', 1)
+                    indices.setdefault(name, [None] * len(sizes))[int(level)] = data[key]
+            return cls(int(data['num_rows']), sizes, indices)
+
+
+def write_pyramid(path, columns):
+    """
+    Build and save the pyramid of the run file path from its columns.
+    Short runs (at most MIN_ROWS rows) are skipped. Returns the pyramid, or None if it was skipped.
+    """
+    num_rows = len(next(iter(columns.values()))) if columns else 0
+    if num_rows <= MIN_ROWS:
+        return None
+    pyramid = Pyramid.build({name: values for name, values in columns.items() if name != 't'})
+    pyramid.save(pyramid_path(path))
+    return pyramid
+
+
+def read_pyramid(path):
+    """
+    Pyramid of a run file: the saved one if it is up to date, otherwise built from the run file (not saved).
+    """
+    saved = pyramid_path(path)
+    if os.path.exists(saved) and os.path.getmtime(saved) >= os.path.getmtime(path):
+        return Pyramid.load(saved)
+
+    from Visualization.data_handling import load_columns
+    columns = load_columns(path)
+    return Pyramid.build({name: values for name, values in columns.items() if name != 't'})
+
+
+def window_indices(values, start=0, stop=None, max_points=MAX_POINTS):
+    """
+    Row indices to plot the rows start:stop of values with at most about max_points points,
+    from a min/max envelope of the window (no pyramid needed), plus one point on each side of the window.
+    """
+    n = len(values)
+    stop = n if stop is None else min(int(stop), n)
+    start = max(int(start), 0)
+    if stop - start <= max_points:
+        return np.arange(max(start - 1, 0), min(stop + 1, n))
+    size = 2 * (-(-(stop - start) // max_points))
+    index = envelope(values[start:stop], size) + start
+    return np.concatenate(([start - 1] if start > 0 else [], index, [stop] if stop < n else [])).astype(np.int64)
+
+
+def downsample(x, y, max_points=MAX_POINTS):
+    """
+    x and y of a line reduced to at most about max_points points with a min/max envelope of y.
+    Lines that already fit are returned as they are.
+    """
+    if len(y) <= max_points:
+        return x, y
+    index = window_indices(y, max_points=max_points)
+    return np.asarray(x)[index], np.asarray(y)[index]
@@ -1,10 +1,14 @@
 # Population plotting function
 # This module contains functions for plotting population dynamics and fitness over generations.
+# QuadDashboard and DoubDashboard keep their artists between slider updates instead of redrawing from scratch.
+# Long time series are drawn with at most MAX_POINTS points per line (min/max envelopes, see Visualization.downsampling).
+# matplotlib is imported inside the functions, so the module loads without the plotting libraries
+# (the notebooks import plotly themselves for their interactive plots).
 
-# import plotly
-import plotly.express as px
-import plotly.io as pio
-pio.renderers.default = "plotly_mimetype"
+# Imports
+import numpy as np
+
+from Visualization.downsampling import MAX_POINTS, downsample, window_indices
 
 def plot_pop(population1, population2, population3, title="Population Dynamics over Generations", xlabel="Generation", ylabel="Population", xrange=None, yrange=None):
     """
@@ -24,9 +28,9 @@ def plot_pop(population1, population2, population3, title="Population Dynamics o
     generations = list(range(len(population1)))
     
     plt.figure(figsize=(6, 4))
-    plt.plot(generations, population1, color='blue', label='Effector Cells')
-    plt.plot(generations, population2, color='red', label='Tumor Cells')
-    plt.plot(generations, population3, color='green', label='IL-2 Levels')
+    plt.plot(*downsample(generations, population1), color='blue', label='Effector Cells')
+    plt.plot(*downsample(generations, population2), color='red', label='Tumor Cells')
+    plt.plot(*downsample(generations, population3), color='green', label='IL-2 Levels')
     plt.title(title)
     plt.xlabel(xlabel)
     plt.ylabel(ylabel)
@@ -56,9 +60,9 @@ def pop_fit_plot(fitness_history, population1, population2, population3, title="
 
     generations_pop = list(range(len(population1)))
     
-    plt.plot(generations_pop, population1,  color='blue', label='Effector Cells')
-    plt.plot(generations_pop, population2,  color='red', label='Tumor Cells')
-    plt.plot(generations_pop, population3,  color='green', label='IL-2 Levels')
+    plt.plot(*downsample(generations_pop, population1),  color='blue', label='Effector Cells')
+    plt.plot(*downsample(generations_pop, population2),  color='red', label='Tumor Cells')
+    plt.plot(*downsample(generations_pop, population3),  color='green', label='IL-2 Levels')
     plt.title("Populations over Generations")
     plt.xlabel('Generation')
     plt.ylabel('Population')
@@ -72,7 +76,7 @@ def pop_fit_plot(fitness_history, population1, population2, population3, title="
 
     plt.subplot(1, 2, 2)
     generations_fit = list(range(len(fitness_history)))
-    plt.plot(generations_fit, fitness_history, marker='o', color='purple', label='Fitness')
+    plt.plot(*downsample(generations_fit, fitness_history), marker='o', color='purple', label='Fitness')
     plt.title("Fitness over Generations")
     plt.xlabel('Generation')
     plt.ylabel('Fitness')
@@ -105,9 +109,9 @@ def plot_quad(t, tau, fitness_history, x, y, z, population1, population2, popula
 
     plt.subplot(2, 2, 1)
     
-    plt.plot(t, x, color='blue', label='x(t)')
-    plt.plot(t, y, color='red', label='y(t)')
-    plt.plot(t, z, color='green', label='z(t)')
+    plt.plot(*downsample(t, x), color='blue', label='x(t)')
+    plt.plot(*downsample(t, y), color='red', label='y(t)')
+    plt.plot(*downsample(t, z), color='green', label='z(t)')
     plt.title("Populations over Time")
     plt.xlabel('Time')
     plt.ylabel('Population')
@@ -122,9 +126,9 @@ def plot_quad(t, tau, fitness_history, x, y, z, population1, population2, popula
     
     plt.subplot(2, 2, 2)
     generations_pop = list(range(len(population1)))
-    plt.plot(time, population1, color='blue', label='Effector Cells')
-    plt.plot(time, population2, color='red', label='Tumor Cells')
-    plt.plot(time, population3, color='green', label='IL-2 Levels')
+    plt.plot(*downsample(time, population1), color='blue', label='Effector Cells')
+    plt.plot(*downsample(time, population2), color='red', label='Tumor Cells')
+    plt.plot(*downsample(time, population3), color='green', label='IL-2 Levels')
     plt.title("Populations over Time")
     plt.xlabel('Time')
     plt.ylabel('Population')
@@ -138,8 +142,8 @@ def plot_quad(t, tau, fitness_history, x, y, z, population1, population2, popula
 
     plt.subplot(2, 2, 3)
     generations_treatment = list(range(len(s_1)))
-    plt.plot(time, s_1, color='orange', label=' Ext. Immune cells  s_1')
-    plt.plot(time, s_2, color='cyan', label='Ext. IL-2 dosing s_2')
+    plt.plot(*downsample(time, s_1), color='orange', label=' Ext. Immune cells  s_1')
+    plt.plot(*downsample(time, s_2), color='cyan', label='Ext. IL-2 dosing s_2')
     plt.title("Treatment over Time")
     plt.xlabel('Time')
     plt.ylabel('Dose')
@@ -153,7 +157,7 @@ def plot_quad(t, tau, fitness_history, x, y, z, population1, population2, popula
 
     plt.subplot(2, 2, 4)
     generations_fit = list(range(len(fitness_history)))
-    plt.plot(generations_fit, fitness_history, color='purple', label='Fitness')
+    plt.plot(*downsample(generations_fit, fitness_history), color='purple', label='Fitness')
     plt.title("Fitness over Generations")
     plt.xlabel('Generation')
     plt.ylabel('Fitness')
@@ -200,9 +204,9 @@ def plot_quad_update(axes, t, tau, fitness_history, x, y, z, population1, popula
     time = t
 
     # create subplots
-    ax1.plot(t, x, color='blue', label='x(t)')
-    ax1.plot(t, y, color='red', label='y(t)')
-    ax1.plot(t, z, color='green', label='z(t)')
+    ax1.plot(*downsample(t, x), color='blue', label='x(t)')
+    ax1.plot(*downsample(t, y), color='red', label='y(t)')
+    ax1.plot(*downsample(t, z), color='green', label='z(t)')
     ax1.set_title("Populations over Time")
     ax1.set_xlabel('Time')
     ax1.set_ylabel('Population')
@@ -215,9 +219,9 @@ def plot_quad_update(axes, t, tau, fitness_history, x, y, z, population1, popula
     
     
     generations_pop = list(range(len(population1)))
-    ax2.plot(time, population1, color='blue', label='Effector Cells')
-    ax2.plot(time, population2, color='red', label='Tumor Cells')
-    ax2.plot(time, population3, color='green', label='IL-2 Levels')
+    ax2.plot(*downsample(time, population1), color='blue', label='Effector Cells')
+    ax2.plot(*downsample(time, population2), color='red', label='Tumor Cells')
+    ax2.plot(*downsample(time, population3), color='green', label='IL-2 Levels')
     ax2.set_title("Populations over Time")
     ax2.set_xlabel('Time')
     ax2.set_ylabel('Population')
@@ -230,8 +234,8 @@ def plot_quad_update(axes, t, tau, fitness_history, x, y, z, population1, popula
 
 
     generations_treatment = list(range(len(s_1)))
-    ax3.plot(time, s_1, color='orange', label=' Ext. Immune cells  s_1')
-    ax3.plot(time, s_2, color='cyan', label='Ext. IL-2 dosing s_2')
+    ax3.plot(*downsample(time, s_1), color='orange', label=' Ext. Immune cells  s_1')
+    ax3.plot(*downsample(time, s_2), color='cyan', label='Ext. IL-2 dosing s_2')
     ax3.set_title("Treatment over Time")
     ax3.set_xlabel('Time')
     ax3.set_ylabel('Dose')
@@ -244,7 +248,7 @@ def plot_quad_update(axes, t, tau, fitness_history, x, y, z, population1, popula
 
 
     generations_fit = list(range(len(fitness_history)))
-    ax4.plot(generations_fit, fitness_history, color='purple', label='Fitness')
+    ax4.plot(*downsample(generations_fit, fitness_history), color='purple', label='Fitness')
     ax4.set_title("Fitness over Generations")
     ax4.set_xlabel('Generation')
     ax4.set_ylabel('Fitness')
@@ -291,9 +295,9 @@ def plot_doub_update(axes, t, tau, x, y, z, population1, population2, population
 
     # create subplots
     
-    ax1.plot(t, x, color='blue', label='x(t)')
-    ax1.plot(t, y, color='red', label='y(t)')
-    ax1.plot(t, z, color='green', label='z(t)')
+    ax1.plot(*downsample(t, x), color='blue', label='x(t)')
+    ax1.plot(*downsample(t, y), color='red', label='y(t)')
+    ax1.plot(*downsample(t, z), color='green', label='z(t)')
     ax1.set_title("Populations over Time")
     ax1.set_xlabel('Time')
     ax1.set_ylabel('Population')
@@ -304,9 +308,9 @@ def plot_doub_update(axes, t, tau, x, y, z, population1, population2, population
     ax1.grid(True)
     ax1.legend(loc='upper right')
     
-    ax2.plot(time, population1, color='blue', label='Effector Cells')
-    ax2.plot(time, population2, color='red', label='Tumor Cells')
-    ax2.plot(time, population3, color='green', label='IL-2 Levels')
+    ax2.plot(*downsample(time, population1), color='blue', label='Effector Cells')
+    ax2.plot(*downsample(time, population2), color='red', label='Tumor Cells')
+    ax2.plot(*downsample(time, population3), color='green', label='IL-2 Levels')
     ax2.set_title("Populations over Time")
     ax2.set_xlabel('Time')
     ax2.set_ylabel('Population')
@@ -317,4 +321,230 @@ def plot_doub_update(axes, t, tau, x, y, z, population1, population2, population
     ax2.grid(True)
     ax2.legend(loc='upper right')
 
-    axes[0].figure.suptitle(title)
\ No newline at end of file
+    axes[0].figure.suptitle(title)
+
+# Persistent dashboards for the slider notebook
+# The artists are created once and updated with set_data; an axis is only rescaled when the limits of its data
+# change, otherwise the new lines are blitted onto the saved background (when the canvas supports blitting).
+
+# Layout of the dashboards: per axis the title, x label, y label and the (key, color, label) of its lines
+QUAD_LAYOUT = [
+    ("Populations over Time", 'Time', 'Population',
+     [('x', 'blue', 'x(t)'), ('y', 'red', 'y(t)'), ('z', 'green', 'z(t)')]),
+    ("Populations over Time", 'Time', 'Population',
+     [('E', 'blue', 'Effector Cells'), ('T', 'red', 'Tumor Cells'), ('IL', 'green', 'IL-2 Levels')]),
+    ("Treatment over Time", 'Time', 'Dose',
+     [('s_1', 'orange', ' Ext. Immune cells  s_1'), ('s_2', 'cyan', 'Ext. IL-2 dosing s_2')]),
+    ("Fitness over Generations", 'Generation', 'Fitness', [('Fitness', 'purple', 'Fitness')]),
+]
+DOUB_LAYOUT = QUAD_LAYOUT[:2]
+
+
+def _data_limits(series):
+    """
+    (xmin, xmax, ymin, ymax) of the finite data of a list of (xdata, ydata), None if there is none.
+    """
+    limits = []
+    for xdata, ydata in series:
+        xdata, ydata = np.asarray(xdata, dtype=float), np.asarray(ydata, dtype=float)
+        finite = np.isfinite(xdata) & np.isfinite(ydata)
+        if finite.any():
+            limits.append((xdata[finite].min(), xdata[finite].max(), ydata[finite].min(), ydata[finite].max()))
+    if not limits:
+        return None
+    limits = np.array(limits)
+    return (limits[:, 0].min(), limits[:, 1].max(), limits[:, 2].min(), limits[:, 3].max())
+
+
+class _Dashboard:
+    """
+    Slider dashboard built from a layout (see QUAD_LAYOUT).
+    blit: redraw by blitting when the canvas supports it (None decides from the canvas).
+    max_points: largest number of points drawn per line; longer lines are reduced to min/max envelopes of the
+    visible x range, which are selected again when the x range changes (zoom and pan).
+    Lines and the title are animated artists when blitting, so use the savefig method of the dashboard
+    (not fig.savefig) to save the figure.
+    """
+    def __init__(self, fig, axes, layout, title="Populations and Fitness", blit=None, max_points=MAX_POINTS):
+        self.fig = fig
+        self.axes = axes
+        self.canvas = fig.canvas
+        self.blit = getattr(self.canvas, 'supports_blit', False) if blit is None else blit
+        self.max_points = max_points
+        self._data = {}
+        self._pyramid = None
+        self._rescaling = False
+
+        # Create every artist once
+        self.lines = {}
+        self._axis_lines = []
+        legends = []
+        for ax, (ax_title, xlabel, ylabel, series) in zip(np.ravel(axes), layout):
+            lines = []
+            for key, color, label in series:
+                (line,) = ax.plot([], [], color=color, label=label, animated=self.blit)
+                self.lines[key] = line
+                lines.append(line)
+            ax.set_title(ax_title)
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
+            ax.grid(True)
+            legends.append(ax.legend(loc='upper right'))
+            self._axis_lines.append((ax, [key for key, _, _ in series], None))
+            ax.callbacks.connect('xlim_changed', self._on_xlim)
+        self.title = fig.suptitle(title, animated=self.blit)
+
+        # Legends are redrawn after the lines so they stay on top
+        for legend in legends:
+            legend.set_animated(self.blit)
+        self._artists = list(self.lines.values()) + legends + [self.title]
+        self._background = None
+        if self.blit:
+            self._draw_cid = self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add_artist(self, artist):
+        """
+        Redraw an extra artist on every update (e.g. the axes of the slider widget, created with drawon=False).
+        """
+        artist.set_animated(self.blit)
+        self._artists.append(artist)
+
+    def _on_draw(self, event):
+        # A full draw (resize, rescale) renders everything except the animated artists: save it as background
+        if event is not None and event.canvas is not self.canvas:
+            return
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self._artists:
+            self.fig.draw_artist(artist)
+
+    def _show(self, key, xlim=None):
+        """
+        Set the points of line key for the x range xlim (default all): all points if they fit in max_points,
+        otherwise a level of the pyramid of the run (if given) or the min/max envelope of the visible rows.
+        """
+        xdata, ydata = self._data[key]
+        if len(ydata) <= self.max_points:
+            self.lines[key].set_data(xdata, ydata)
+            return
+        start, stop = (0, len(ydata)) if xlim is None else \
+            (np.searchsorted(xdata, min(xlim), 'left'), np.searchsorted(xdata, max(xlim), 'right'))
+        pyramid = self._pyramid
+        if pyramid is not None and key in pyramid.indices and pyramid.num_rows == len(ydata):
+            index = pyramid.select(key, start, stop, self.max_points, values=ydata)
+        else:
+            index = window_indices(ydata, start, stop, self.max_points)
+        self.lines[key].set_data(xdata[index], ydata[index])
+
+    def _on_xlim(self, ax):
+        # Zoom or pan: select the points of the new x range (a rescale of _set shows the full range already)
+        if self._rescaling:
+            return
+        for axis, keys, _ in self._axis_lines:
+            if axis is ax:
+                for key in keys:
+                    if key in self._data:
+                        self._show(key, ax.get_xlim())
+
+    def _set(self, data, title, pyramid=None):
+        """
+        Set the line data (key -> (xdata, ydata)), rescale the axes whose data limits changed and redraw.
+        pyramid: Visualization.downsampling.Pyramid of the run, used to reduce long lines
+        """
+        self._pyramid = pyramid
+        for key, (xdata, ydata) in data.items():
+            self._data[key] = (np.asarray(xdata), np.asarray(ydata))
+        if title is not None:
+            self.title.set_text(title)
+
+        rescaled = False
+        for i, (ax, keys, limits) in enumerate(self._axis_lines):
+            new_limits = _data_limits([self._data[key] for key in keys if key in self._data])
+            if new_limits != limits:
+                # The envelopes keep the extremes, so the limits of the reduced lines are those of the data
+                for key in keys:
+                    if key in self._data:
+                        self._show(key)
+                self._rescaling = True
+                try:
+                    ax.relim()
+                    ax.autoscale_view()
+                finally:
+                    self._rescaling = False
+                self._axis_lines[i] = (ax, keys, new_limits)
+                rescaled = True
+            else:
+                for key in keys:
+                    if key in data:
+                        self._show(key, ax.get_xlim())
+
+        self.draw(full=rescaled)
+
+    def draw(self, full=False):
+        """
+        Redraw the dashboard: blit the animated artists, or draw the whole figure if full or blitting is off.
+        """
+        if not self.blit or full or self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+    def savefig(self, *args, **kwargs):
+        """
+        Save the figure with all artists (animated artists are skipped by fig.savefig).
+        """
+        for artist in self._artists:
+            artist.set_animated(False)
+        try:
+            self.fig.savefig(*args, **kwargs)
+        finally:
+            for artist in self._artists:
+                artist.set_animated(self.blit)
+
+
+class QuadDashboard(_Dashboard):
+    """
+    Persistent version of plot_quad_init/plot_quad_update for the slider notebook.
+    Example:
+    dashboard = QuadDashboard()
+    dashboard.update(t, tau, Fitness, x, y, z, E, T, IL, s_1_array, s_2_array, title=f'c = {c_val:.4f}',
+                     pyramid=read_pyramid(path))
+    """
+    def __init__(self, fig=None, axes=None, title="Populations and Fitness", blit=None, max_points=MAX_POINTS):
+        if fig is None:
+            fig, axes = plot_quad_init()
+        super().__init__(fig, axes, QUAD_LAYOUT, title=title, blit=blit, max_points=max_points)
+
+    def update(self, t, tau, fitness_history, x, y, z, population1, population2, population3, s_1, s_2, title=None,
+               pyramid=None):
+        """
+        Show a new run (same arguments as plot_quad_update).
+        pyramid: optional Visualization.downsampling.Pyramid of the run file (read_pyramid)
+        """
+        self._set({'x': (t, x), 'y': (t, y), 'z': (t, z),
+                   'E': (t, population1), 'T': (t, population2), 'IL': (t, population3),
+                   's_1': (t, s_1), 's_2': (t, s_2),
+                   'Fitness': (np.arange(len(fitness_history)), fitness_history)}, title, pyramid)
+
+
+class DoubDashboard(_Dashboard):
+    """
+    Persistent version of plot_doub_init/plot_doub_update for the slider notebook.
+    """
+    def __init__(self, fig=None, axes=None, title="Populations and Fitness", blit=None, max_points=MAX_POINTS):
+        if fig is None:
+            fig, axes = plot_doub_init()
+        super().__init__(fig, axes, DOUB_LAYOUT, title=title, blit=blit, max_points=max_points)
+
+    def update(self, t, tau, x, y, z, population1, population2, population3, s_1, s_2, title=None, pyramid=None):
+        """
+        Show a new run (same arguments as plot_doub_update).
+        pyramid: optional Visualization.downsampling.Pyramid of the run file (read_pyramid)
+        """
+        self._set({'x': (t, x), 'y': (t, y), 'z': (t, z),
+                   'E': (t, population1), 'T': (t, population2), 'IL': (t, population3)}, title, pyramid)
@@ -0,0 +1,56 @@
+# Benchmark command line
+# python -m benchmarks [--quick] [--cases ...] [--output results.json] [--baseline baseline.json]
+# Runs the benchmark suite, saves the results and compares them with the baseline if it exists.
+# The exit status is 1 if a case is slower than the baseline by more than the threshold, fails in the current run,
+# or is in the baseline but was not run (when all cases are run).
+
+# Imports
+import argparse
+import os
+import sys
+
+from benchmarks.suite import CASES, DEFAULT_SWEEP, compare, load_results, run_benchmarks, save_results
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Run the benchmark suite.")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), help="cases to run (default all)")
+    parser.add_argument('--quick', action='store_true', help="one measurement per case, short closed-loop run")
+    parser.add_argument('--sweep', default=DEFAULT_SWEEP, help="folder of CSV runs for the I/O and slider cases")
+    parser.add_argument('--output', default=os.path.join(FOLDER, 'results.json'), help="results file")
+    parser.add_argument('--baseline', default=os.path.join(FOLDER, 'baseline.json'), help="baseline file")
+    parser.add_argument('--threshold', type=float, default=0.2, help="relative slowdown counted as a regression")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.cases, quick=args.quick, sweep=args.sweep)
+    save_results(args.output, results)
+    print("Saved results to", args.output)
+
+    if args.save_baseline:
+        save_results(args.baseline, results)
+        print("Saved baseline to", args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at", args.baseline, "(run with --save-baseline to store one)")
+        return 0
+
+    comparison = compare(results, load_results(args.baseline), threshold=args.threshold)
+    # With --cases the other baseline cases are skipped on purpose
+    kinds = [("Regressions:", 'regression'), ("Failed cases:", 'error')]
+    if not args.cases:
+        kinds.append(("Baseline cases not run:", 'missing'))
+    status = 0
+    for label, kind in kinds:
+        names = [name for name, entry in comparison.items() if entry['status'] == kind]
+        if names:
+            print(label, ", ".join(names))
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,341 @@
+# Benchmark suite
+# This module times the main code paths of the project: integration, open-loop and closed-loop runs
+# (one at a time and in lockstep),
+# a single GA control step, CSV loading and feature extraction on a sweep folder, and the slider redraws
+# (rebuilt with plot_quad_update/plot_doub_update and updated in place by the dashboards).
+# Every case has a setup that is not timed and returns the function to time; seeds are fixed so runs
+# are repeatable. Results are saved as JSON and can be compared against a stored baseline,
+# where a case counts as a regression when its median time grows by more than the threshold.
+
+# Imports
+import os
+import platform
+import statistics
+import time
+
+import numpy as np
+
+SEED = 0
+
+# Sweep folder used by the I/O cases (100 open-loop runs of the main notebook)
+DEFAULT_SWEEP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'Output_data', '0001_c_sweep_0')
+
+# Registered cases: name -> (setup, repeat, number)
+CASES = {}
+
+
+def case(name, repeat=5, number=1):
+    """
+    Register a benchmark case.
+    The decorated setup(config) prepares the case and returns the function to time, which is called
+    number times per measurement, for repeat measurements (config['quick'] runs a single measurement).
+    """
+    def register(setup):
+        CASES[name] = (setup, repeat, number)
+        return setup
+    return register
+
+
+# Cases
+
+def _default_state():
+    from Simulation.parameters import scaled_parameters, time_grid
+
+    params, _ = scaled_parameters()
+    _, tau = time_grid()
+    return params, tau
+
+
+@case('integrate_interval', repeat=5, number=50)
+def _integrate_interval(config):
+    from Model.integration import kp_integrate
+
+    params, tau = _default_state()
+    integrator = kp_integrate()
+    return lambda: integrator.integrate([1.0, 1.0, 1.0], params, (tau[0], tau[1]))
+
+
+@case('integrate_interval_backend', repeat=5, number=50)
+def _integrate_interval_backend(config):
+    from Model.backends import get_backend
+    from Model.integration import kp_integrate
+
+    params, tau = _default_state()
+    integrator = kp_integrate(backend=get_backend().name)
+    integrator.integrate([1.0, 1.0, 1.0], params, (tau[0], tau[1])) # compile before timing
+    return lambda: integrator.integrate([1.0, 1.0, 1.0], params, (tau[0], tau[1]))
+
+
+@case('open_loop', repeat=3)
+def _open_loop(config):
+    from Simulation.simulation import run_open_loop
+    return lambda: run_open_loop()
+
+
+@case('ga_step', repeat=5, number=5)
+def _ga_step(config):
+    from GA.controller import RecedingHorizonGA
+
+    controller = RecedingHorizonGA(random_seed=SEED)
+    environment = {'t': 0, 'x': 1.0, 'y': 1.0, 'z': 1.0}
+    return lambda: controller.step(environment)
+
+
+@case('closed_loop', repeat=1)
+def _closed_loop(config):
+    from Simulation.simulation import run_closed_loop
+
+    # The full run takes minutes, quick mode runs the first 200 steps
+    settings = {'num_steps': 200} if config['quick'] else None
+    return lambda: run_closed_loop(settings=settings, ga_settings={'random_seed': SEED})
+
+
+@case('closed_loop_lockstep', repeat=1)
+def _closed_loop_lockstep(config):
+    from Simulation.lockstep import run_closed_loop_lockstep
+
+    # 10 points of the GA sweep, 200 steps (the per-run closed_loop case gives the sequential cost)
+    grid = [{'c': c} for c in np.linspace(-0.005, 0.05, 10)]
+    run_closed_loop_lockstep(grid[:2], settings={'num_steps': 3}, ga_settings={'random_seed': SEED}) # compile
+    return lambda: run_closed_loop_lockstep(grid, settings={'num_steps': 200}, ga_settings={'random_seed': SEED})
+
+
+def _sweep_files(config):
+    import glob
+
+    files = sorted(glob.glob(os.path.join(config['sweep'], '*.csv')))
+    if not files:
+        raise FileNotFoundError(f"No CSV files in the sweep folder {config['sweep']}.")
+    return files
+
+
+@case('load_sweep', repeat=3)
+def _load_sweep(config):
+    from Visualization.data_handling import clear_cache, load_data
+
+    files = _sweep_files(config)
+
+    def run():
+        clear_cache()
+        for path in files:
+            load_data(path)
+    return run
+
+
+@case('load_sweep_cached', repeat=5)
+def _load_sweep_cached(config):
+    from Visualization.data_handling import load_data
+
+    files = _sweep_files(config)
+    for path in files:
+        load_data(path)
+    return lambda: [load_data(path) for path in files]
+
+
+@case('extract_features', repeat=3)
+def _extract_features(config):
+    from Visualization.data_handling import clear_cache, extract_features
+
+    files = _sweep_files(config)
+    antigenicity_values = np.linspace(-0.005, 0.05, len(files))
+
+    def run():
+        clear_cache()
+        extract_features(files, antigenicity_values)
+    return run
+
+
+def _slider_setup(config, quad, dashboard=False):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    from Visualization.data_handling import load_data
+    from Visualization import pop_plotting
+
+    files = _sweep_files(config)
+    data = [load_data(path) for path in files[:10]]
+    state = {'idx': 0}
+
+    if dashboard:
+        board = pop_plotting.QuadDashboard() if quad else pop_plotting.DoubDashboard()
+        board.canvas.draw()
+
+        def run():
+            t, tau, x, y, z, E, T, IL, s_1, s_2, fitness = data[state['idx'] % len(data)]
+            state['idx'] += 1
+            if quad:
+                board.update(t, tau, fitness, x, y, z, E, T, IL, s_1, s_2, title=f"run {state['idx']}")
+            else:
+                board.update(t, tau, x, y, z, E, T, IL, s_1, s_2, title=f"run {state['idx']}")
+
+        run.close = lambda: plt.close(board.fig)
+        return run
+
+    fig, axes = pop_plotting.plot_quad_init() if quad else pop_plotting.plot_doub_init()
+
+    def run():
+        # Same steps as the update function of the slider notebook
+        t, tau, x, y, z, E, T, IL, s_1, s_2, fitness = data[state['idx'] % len(data)]
+        state['idx'] += 1
+        for ax in axes.ravel():
+            ax.cla()
+        if quad:
+            pop_plotting.plot_quad_update(axes, t, tau, fitness, x, y, z, E, T, IL, s_1, s_2)
+        else:
+            pop_plotting.plot_doub_update(axes, t, tau, x, y, z, E, T, IL, s_1, s_2)
+        fig.canvas.draw()
+
+    run.close = lambda: plt.close(fig)
+    return run
+
+
+@case('slider_redraw_quad', repeat=5, number=3)
+def _slider_redraw_quad(config):
+    return _slider_setup(config, quad=True)
+
+
+@case('slider_redraw_doub', repeat=5, number=3)
+def _slider_redraw_doub(config):
+    return _slider_setup(config, quad=False)
+
+
+@case('slider_dashboard_quad', repeat=5, number=3)
+def _slider_dashboard_quad(config):
+    return _slider_setup(config, quad=True, dashboard=True)
+
+
+@case('slider_dashboard_doub', repeat=5, number=3)
+def _slider_dashboard_doub(config):
+    return _slider_setup(config, quad=False, dashboard=True)
+
+
+# Runner
+
+def environment_info():
+    """
+    Description of the machine and library versions the benchmarks ran on.
+    """
+    import scipy
+
+    info = {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count(), 'numpy': np.__version__, 'scipy': scipy.__version__}
+    try:
+        import numba
+        info['numba'] = numba.__version__
+    except ImportError:
+        info['numba'] = None
+    return info
+
+
+def time_case(name, config):
+    """
+    Run one case and return its timings in seconds per call (min, median, mean, stdev over the measurements).
+    """
+    setup, repeat, number = CASES[name]
+    np.random.seed(SEED)
+    func = setup(config)
+    repeat = 1 if config['quick'] else repeat
+
+    times = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            times.append((time.perf_counter() - start) / number)
+    finally:
+        if hasattr(func, 'close'):
+            func.close()
+
+    return {'min': min(times), 'median': statistics.median(times), 'mean': statistics.mean(times),
+            'stdev': statistics.stdev(times) if len(times) > 1 else 0.0, 'repeat': repeat, 'number': number}
+
+
+def run_benchmarks(names=None, quick=False, sweep=DEFAULT_SWEEP, verbose=True):
+    """
+    Run the benchmark cases (all of them by default).
+    quick: one measurement per case and a shortened closed-loop run
+    sweep: folder of CSV runs for the I/O and slider cases
+    A case that fails (e.g. a missing optional dependency or sweep folder) is recorded with its error.
+    Returns a dict with the environment, the configuration and the results by case name.
+    """
+    config = {'quick': quick, 'sweep': sweep, 'seed': SEED}
+    names = names or list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases {unknown}. Available cases: {list(CASES)}")
+
+    results = {}
+    for name in names:
+        try:
+            results[name] = time_case(name, config)
+            if verbose:
+                print(f"{name:28s} median {results[name]['median']*1e3:10.3f} ms")
+        except Exception as error:
+            results[name] = {'error': f"{type(error).__name__}: {error}"}
+            if verbose:
+                print(f"{name:28s} failed: {results[name]['error']}")
+
+    return {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'environment': environment_info(), 'config': config,
+            'results': results}
+
+
+def save_results(path, results):
+    """
+    Save benchmark results as JSON.
+    """
+    import json
+    from Simulation.output import atomic_write
+    atomic_write(path, lambda file: json.dump(results, file, indent=2))
+
+
+def load_results(path):
+    import json
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(results, baseline, threshold=0.2, verbose=True):
+    """
+    Compare the median times of results with a baseline.
+    threshold: relative slowdown above which a case is a regression (0.2 is 20 % slower)
+    Returns a dict of case name -> {'ratio', 'status'}, status is 'regression', 'improvement', 'ok',
+    'new' (not in the baseline), 'error' (the case failed in the current run), 'baseline_error' (the case only
+    failed in the baseline) or 'missing' (in the baseline but not in the current results).
+    """
+    if verbose and results['config'].get('quick') != baseline['config'].get('quick'):
+        print("Warning: comparing a quick run with a full run, the closed_loop timings are not comparable.")
+
+    comparison = {}
+    for name, current in results['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            comparison[name] = {'ratio': None, 'status': 'new'}
+        elif 'median' not in current:
+            comparison[name] = {'ratio': None, 'status': 'error'}
+        elif 'median' not in reference:
+            comparison[name] = {'ratio': None, 'status': 'baseline_error'}
+        else:
+            ratio = current['median'] / reference['median']
+            if ratio > 1 + threshold:
+                status = 'regression'
+            elif ratio < 1/(1 + threshold):
+                status = 'improvement'
+            else:
+                status = 'ok'
+            comparison[name] = {'ratio': ratio, 'status': status}
+
+        if verbose:
+            ratio = comparison[name]['ratio']
+            ratio = '' if ratio is None else f"{ratio:6.2f}x"
+            print(f"{name:28s} {ratio:>8s}  {comparison[name]['status']}")
+
+    for name in baseline['results']:
+        if name not in results['results']:
+            comparison[name] = {'ratio': None, 'status': 'missing'}
+            if verbose:
+                print(f"{name:28s} {'':>8s}  missing")
+
+    return comparison
@@ -0,0 +1,31 @@
+# Test configuration
+# The packages (Model, GA, Simulation, Visualization, benchmarks) are imported from the repository root,
+# as in the notebooks, so the root is put on the import path. sample_run builds small runs for the file tests.
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sample_run():
+    """
+    Factory of small closed-loop runs with random states, doses and fitness, and saved features.
+    """
+    from Simulation.parameters import DEFAULT_PARAMETERS, DEFAULT_SETTINGS
+    from Simulation.simulation import make_run
+
+    def build(c=0.02, num_steps=50):
+        rng = np.random.default_rng(4)
+        tau = np.linspace(0.0, 10.0, num_steps)
+        states = rng.uniform(0.0, 2.0, size=(num_steps, 3))
+        s_1, s_2 = rng.uniform(0.0, 0.1, size=(2, num_steps))
+        run = make_run(dict(DEFAULT_PARAMETERS, c=c), dict(DEFAULT_SETTINGS), 'closed_loop', tau, states, s_1, s_2,
+                       rng.normal(size=num_steps // 2))
+        run['metadata']['features'] = {'amplitude': np.float64(0.5), 'max1': 1.0}
+        return run
+    return build
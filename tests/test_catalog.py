@@ -0,0 +1,43 @@
+# Tests of the run catalog (Simulation.catalog)
+
+from Simulation.catalog import RunCatalog
+from Simulation.output import write_run
+from Simulation.parameters import DEFAULT_PARAMETERS
+
+
+def test_catalog_queries(tmp_path):
+    catalog = RunCatalog(str(tmp_path / 'catalog.sqlite'))
+    for idx, c in enumerate((0.0, 0.01, 0.02, 0.03)):
+        for mode in ('open_loop', 'closed_loop'):
+            path = str(tmp_path / mode / f'run_{idx}.kpt')
+            metadata = {'mode': mode, 'parameters': dict(DEFAULT_PARAMETERS, c=c, r_2=0.1 + 0.05*idx)}
+            catalog.record_run(path, metadata, features={'amplitude': c}, sweep=mode, idx=idx)
+
+    runs = catalog.query(mode='closed_loop', c_min=0.005, c_max=0.025)
+    assert [run['c'] for run in runs] == [0.01, 0.02]
+    assert [run['features']['amplitude'] for run in runs] == [0.01, 0.02]
+    assert runs[0]['path'] == str(tmp_path / 'closed_loop' / 'run_1.kpt')
+
+    assert len(catalog.query(r_2=(0.12, 0.22))) == 4
+    assert catalog.paths(sweep='open_loop', r_2=(0.12, 0.22)) == [str(tmp_path / 'open_loop' / f'run_{idx}.kpt')
+                                                                  for idx in (1, 2)]
+
+    # Status changes and updates keep the features of the run
+    path = str(tmp_path / 'open_loop' / 'run_0.kpt')
+    catalog.set_status(path, 'failed')
+    assert catalog.paths(mode='open_loop', c_max=0.005) == []
+    assert catalog.query(mode='open_loop', status='failed')[0]['path'] == path
+    catalog.record_run(path, {'mode': 'open_loop', 'parameters': {'c': 0.0}}, sweep='open_loop', idx=0)
+    assert catalog.query(mode='open_loop', c_max=0.005)[0]['features'] == {'amplitude': 0.0}
+
+
+def test_catalog_indexes_run_files(tmp_path, sample_run):
+    folder = tmp_path / 'sweep'
+    for c in (0.03, 0.01):
+        write_run(str(folder / f'run_{c}.kpt'), sample_run(c))
+    catalog = RunCatalog(str(tmp_path / 'catalog.sqlite'))
+
+    assert catalog.index_folder(str(folder), mode='closed_loop') == 2
+    runs = catalog.query(sweep='sweep')
+    assert [(run['idx'], run['c']) for run in runs] == [(0, 0.01), (1, 0.03)]
+    assert runs[0]['features']['amplitude'] == 0.5
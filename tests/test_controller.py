@@ -0,0 +1,37 @@
+# Tests of the receding-horizon GA controller (GA.controller)
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pygad')
+
+from GA.controller import RecedingHorizonGA
+
+SETTINGS = {'num_generations': 3, 'sol_per_pop': 20, 'num_parents_mating': 4}
+ENVIRONMENT = {'t': 0, 'x': 1.0, 'y': 1.0, 'z': 1.0}
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_warm_start_keeps_the_gene_space():
+    controller = RecedingHorizonGA(random_seed=0, **SETTINGS)
+    for step in range(3):
+        solution, fitness, generations = controller.step(dict(ENVIRONMENT, t=step))
+        # The default gene space is the discrete set {-10, 10} of pygad, also for the warm-started steps
+        assert set(np.unique(controller.ga_instance.population)) <= {-10.0, 10.0}
+        assert set(solution) <= {-10.0, 10.0}
+    assert len(controller.generations_history) == 3
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_warm_start_samples_other_gene_spaces():
+    controller = RecedingHorizonGA(random_seed=0, gene_space=[{'low': -1.0, 'high': 1.0}]*4 + [[0.0, 0.5]]*4,
+                                   **SETTINGS)
+    controller.step(ENVIRONMENT)
+    fresh = controller._seed_population()[2:]
+    assert np.all(np.abs(fresh[:, :4]) <= 1.0)
+    assert set(np.unique(fresh[:, 4:])) <= {0.0, 0.5}
+
+    controller = RecedingHorizonGA(random_seed=0, gene_space=None, **SETTINGS)
+    controller.step(ENVIRONMENT)
+    fresh = controller._seed_population()[2:]
+    assert np.all((fresh >= 0.0) & (fresh <= 1.0))
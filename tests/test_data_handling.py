@@ -0,0 +1,43 @@
+# Tests of the run file loader and its cache (Visualization.data_handling)
+
+import numpy as np
+import pytest
+
+from Simulation.output import read_features, write_run
+from Visualization.data_handling import COLUMNS, clear_cache, load_columns, load_data
+
+
+def test_csv_and_kpt_load_the_same_columns(tmp_path, sample_run):
+    run = sample_run()
+    clear_cache()
+    loaded = {}
+    for extension in ('csv', 'kpt'):
+        path = str(tmp_path / f'run.{extension}')
+        write_run(path, run)
+        loaded[extension] = load_data(path)
+        assert read_features(path) == {'amplitude': 0.5, 'max1': 1.0}
+
+    for name, csv_values, kpt_values in zip(COLUMNS, loaded['csv'], loaded['kpt']):
+        np.testing.assert_array_equal(csv_values, run['columns'][name])
+        np.testing.assert_array_equal(kpt_values, run['columns'][name])
+    # Steps without a GA run are written as empty cells and read as nan
+    assert np.isnan(loaded['csv'][-1][-1])
+
+
+def test_csv_loader_fills_empty_cells_and_caches(tmp_path):
+    path = tmp_path / 'run.csv'
+    path.write_text("t,tau,x,y\n0,0.0,1.0,\n1,,2.0,3.0\n,2.0,,\n3,3.0,,4.0\n")
+    clear_cache()
+
+    columns = load_columns(str(path))
+    np.testing.assert_array_equal(columns['t'], [0, 1, 3])
+    np.testing.assert_array_equal(columns['tau'], [0.0, np.nan, 3.0])
+    np.testing.assert_array_equal(columns['x'], [1.0, 2.0, np.nan])
+    np.testing.assert_array_equal(columns['y'], [np.nan, 3.0, 4.0])
+    assert load_columns(str(path)) is columns
+    with pytest.raises(ValueError):
+        columns['x'][0] = 0.0
+
+    # A changed file is read again
+    path.write_text("t,tau,x,y\n0,0.0,5.0,6.0\n")
+    np.testing.assert_array_equal(load_columns(str(path))['x'], [5.0])
@@ -0,0 +1,69 @@
+# Tests of the plotting pyramid (Visualization.downsampling)
+
+import numpy as np
+import pytest
+
+from Visualization.downsampling import MAX_POINTS, Pyramid, envelope, read_pyramid, window_indices, write_pyramid
+
+
+def _signal(n=50000, seed=5):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)
+    return np.sin(2*np.pi*t/997.0) + 0.1*rng.normal(size=n)
+
+
+def test_envelope_keeps_bucket_extremes():
+    values = _signal(1000)
+    index = envelope(values, 8)
+    assert index[0] == 0 and index[-1] == 999
+    for start in range(0, 1000, 8):
+        bucket = values[start:start+8]
+        assert start + np.argmin(bucket) in index and start + np.argmax(bucket) in index
+
+
+def test_select_keeps_the_window_extremes():
+    values = _signal()
+    pyramid = Pyramid.build({'y': values})
+    rng = np.random.default_rng(6)
+    for start, length in zip(rng.integers(0, 40000, 50), rng.integers(MAX_POINTS + 1, 20000, 50)):
+        stop = min(start + length, len(values))
+        index = pyramid.select('y', start, stop, values=values)
+        inside = index[(index >= start) & (index < stop)]
+        assert len(index) <= 2*MAX_POINTS + 8
+        assert values[inside].max() == values[start:stop].max()
+        assert values[inside].min() == values[start:stop].min()
+        # One point on each side of the window
+        assert index[0] < start and index[-1] >= stop - 1
+
+
+def test_select_returns_all_rows_of_short_windows():
+    values = _signal(5000)
+    pyramid = Pyramid.build({'y': values})
+    np.testing.assert_array_equal(pyramid.select('y', 100, 200), np.arange(99, 201))
+    with pytest.raises(KeyError):
+        pyramid.select('x', 0, 5000)
+
+
+def test_window_indices_keep_the_extremes():
+    values = _signal(20000)
+    index = window_indices(values, 1234, 17000)
+    inside = index[(index >= 1234) & (index < 17000)]
+    assert values[inside].max() == values[1234:17000].max()
+    assert values[inside].min() == values[1234:17000].min()
+
+
+def test_pyramid_file_round_trip(tmp_path):
+    from Simulation.output import write_run
+
+    values = _signal(10000)
+    path = str(tmp_path / 'run.kpt')
+    columns = {'t': np.arange(len(values)), 'y': values}
+    write_run(path, {'columns': columns, 'metadata': {}})
+    pyramid = write_pyramid(path, columns)
+
+    loaded = read_pyramid(path)
+    assert loaded.num_rows == pyramid.num_rows and loaded.bucket_sizes == pyramid.bucket_sizes
+    for level, index in enumerate(pyramid.indices['y']):
+        np.testing.assert_array_equal(loaded.indices['y'][level], index)
+    assert 't' not in loaded.indices
+    assert write_pyramid(path, {'y': values[:100]}) is None
@@ -0,0 +1,30 @@
+# Tests of the GA fitness functions (GA.fitness_function)
+
+import types
+
+import numpy as np
+
+from GA.fitness_function import GeneticAlgorithm, predicted_fitness
+
+
+def test_batch_fitness_matches_scalar_fitness():
+    # fitness_func is the reference Euler-step objective of the notebook controller
+    rng = np.random.default_rng(7)
+    ga_instance = types.SimpleNamespace(environment={'t': 3, 'x': 0.8, 'y': 0.05, 'z': 1.5})
+    solutions = rng.uniform(-10, 10, size=(50, 8))
+
+    scalar = [GeneticAlgorithm.fitness_func(ga_instance, solution, i) for i, solution in enumerate(solutions)]
+    batch = GeneticAlgorithm.fitness_func_batch(ga_instance, solutions, list(range(50)))
+    np.testing.assert_allclose(batch, scalar, rtol=1e-13)
+
+
+def test_predicted_fitness_broadcasts_over_scenarios():
+    rng = np.random.default_rng(8)
+    states = rng.uniform(0.01, 2.0, size=(3, 3))
+    populations = rng.uniform(-10, 10, size=(3, 20, 8))
+
+    fitness = predicted_fitness(populations, 0, *(states[:, i, None] for i in range(3)))
+    for population, (x, y, z), row in zip(populations, states, fitness):
+        ga_instance = types.SimpleNamespace(environment={'t': 0, 'x': x, 'y': y, 'z': z})
+        np.testing.assert_allclose(row, [GeneticAlgorithm.fitness_func(ga_instance, solution, 0)
+                                         for solution in population], rtol=1e-13)
@@ -0,0 +1,115 @@
+# Tests of the integrators (Model.integration) and backends (Model.backends)
+
+import numpy as np
+import pytest
+
+from Model.backends import available_backends, get_backend
+from Model.integration import kp_integrate
+from Model.KP_model import kp_coupled, kp_jacobian, kp_jacobian_batch
+from Simulation.parameters import scaled_parameters, time_grid
+
+
+def _params(**parameters):
+    return scaled_parameters(parameters)[0]
+
+
+def test_batch_matches_scalar_integrate():
+    integrator = kp_integrate()
+    states = np.array([[1.0, 1.0, 1.0], [0.5, 2.0, 0.1], [2.0, 0.01, 3.0]])
+    params = np.array([_params(c=c) for c in (0.0, 0.02, 0.04)])
+
+    batch = integrator.integrate_batch(states, params, (0.0, 2.0))
+    for state, p, result in zip(states, params, batch):
+        np.testing.assert_allclose(result, integrator.integrate(state, p, (0.0, 2.0)), rtol=1e-5, atol=1e-8)
+
+
+def test_trajectory_matches_step_loop():
+    params = _params(c=0.02)
+    _, tau = time_grid(None, {'num_steps': 60, 'total_time': 120})
+    s_1 = np.where(np.arange(len(tau)) % 7 < 3, 0.05, 0.0)
+    integrator = kp_integrate()
+
+    states, s_1_array, _ = integrator.integrate_trajectory([1.0, 1.0, 1.0], params, tau, s_1=s_1)
+
+    # One solver restart per control step, as in the notebook loop
+    expected = [np.array([1.0, 1.0, 1.0])]
+    for step in range(1, len(tau)):
+        p = list(params)
+        p[4] = s_1[step]
+        expected.append(np.array(integrator.integrate(expected[-1], p, (tau[step-1], tau[step]))))
+    np.testing.assert_allclose(states, np.array(expected), rtol=1e-5, atol=1e-8)
+    np.testing.assert_array_equal(s_1_array, s_1)
+
+
+def test_trajectory_dosing_callback_matches_schedule():
+    params = _params(c=0.02)
+    _, tau = time_grid(None, {'num_steps': 40, 'total_time': 80})
+    s_1 = np.where(np.arange(len(tau)) % 5 == 0, 0.1, 0.0)
+    integrator = kp_integrate()
+
+    scheduled = integrator.integrate_trajectory([1.0, 1.0, 1.0], params, tau, s_1=s_1)[0]
+    called = integrator.integrate_trajectory([1.0, 1.0, 1.0], params, tau,
+                                             dosing=lambda step, t, state: (s_1[step], 0.0))[0]
+    np.testing.assert_allclose(called, scheduled, rtol=1e-6, atol=1e-10)
+
+
+@pytest.mark.parametrize('method', ['Radau', 'BDF', 'LSODA'])
+def test_stiff_methods_match_rk45(method):
+    params = _params(c=0.02)
+    _, tau = time_grid(None, {'num_steps': 60, 'total_time': 120})
+    s_1 = np.where(np.arange(len(tau)) % 7 < 3, 0.05, 0.0)
+
+    reference = kp_integrate().integrate_trajectory([1.0, 1.0, 1.0], params, tau, s_1=s_1)[0]
+    states = kp_integrate(method=method).integrate_trajectory([1.0, 1.0, 1.0], params, tau, s_1=s_1)[0]
+    np.testing.assert_allclose(states, reference, rtol=1e-3, atol=1e-6)
+
+
+def test_jacobian_matches_finite_differences():
+    rng = np.random.default_rng(0)
+    params = _params(c=0.02, s_1=0.01, s_2=0.01)
+    for state in rng.uniform(0.1, 3.0, size=(5, 3)):
+        numeric = np.empty((3, 3))
+        for j in range(3):
+            h = 1e-6 * max(1.0, abs(state[j]))
+            up, down = state.copy(), state.copy()
+            up[j] += h
+            down[j] -= h
+            numeric[:, j] = (np.array(kp_coupled(0.0, up, *params)) - np.array(kp_coupled(0.0, down, *params))) / (2*h)
+        analytic = kp_jacobian(0.0, state, *params)
+        np.testing.assert_allclose(analytic, numeric, rtol=1e-5, atol=1e-8)
+        np.testing.assert_allclose(kp_jacobian_batch(0.0, state[None], np.array([params]))[0], analytic)
+
+
+def test_solver_stats_are_reset_on_backend_paths():
+    params = _params()
+    integrator = kp_integrate()
+    integrator.integrate([1.0, 1.0, 1.0], params, (0.0, 1.0))
+    assert integrator.stats['nfev'] > 0
+
+    integrator.integrate_batch([[1.0, 1.0, 1.0]], params, (0.0, 1.0))
+    assert integrator.stats == {}
+
+    backend = kp_integrate(backend='numpy')
+    backend.stats = {'nfev': 1}
+    backend.integrate([1.0, 1.0, 1.0], params, (0.0, 1.0))
+    assert backend.stats == {}
+
+
+@pytest.mark.parametrize('name', available_backends())
+def test_backends_agree(name):
+    rng = np.random.default_rng(1)
+    states = rng.uniform(0.1, 2.0, size=(8, 3))
+    params = np.array([_params(c=c) for c in rng.uniform(0.0, 0.05, size=8)])
+    backend = get_backend(name)
+    reference = get_backend('numpy')
+
+    np.testing.assert_allclose(backend.rhs(0.0, states, params), reference.rhs(0.0, states, params), rtol=1e-12)
+    np.testing.assert_allclose(backend.rk4(states, params, 0.0, 1.0, 20),
+                               reference.rk4(states, params, 0.0, 1.0, 20), rtol=1e-10)
+    np.testing.assert_allclose(backend.dopri(states, params, 0.0, 1.0, 1e-8, 1e-10, np.inf),
+                               reference.dopri(states, params, 0.0, 1.0, 1e-8, 1e-10, np.inf), rtol=1e-6, atol=1e-10)
+
+    # The backend path of the integrator agrees with scipy
+    scipy_result = kp_integrate().integrate(states[0], params[0], (0.0, 1.0))
+    np.testing.assert_allclose(kp_integrate(backend=name).integrate(states[0], params[0], (0.0, 1.0)), scipy_result,
+                               rtol=1e-5, atol=1e-8)
@@ -0,0 +1,75 @@
+# Tests of the lockstep closed-loop simulation (GA.lockstep, Simulation.lockstep)
+
+import numpy as np
+import pytest
+
+from GA.fitness_function import predicted_fitness
+from GA.lockstep import LockstepGA
+from Model.integration import kp_integrate
+from Simulation.features import FeatureSinkSet, TailAmplitude
+from Simulation.lockstep import run_closed_loop_lockstep
+from Simulation.parameters import DEFAULT_PARAMETERS, scaled_parameters, time_grid
+
+GA_SETTINGS = {'random_seed': 0, 'num_generations': 3, 'sol_per_pop': 20, 'num_parents_mating': 4}
+SETTINGS = {'num_steps': 20, 'total_time': 40}
+
+
+def test_lockstep_matches_per_run_integration():
+    grid = [{'c': 0.01}, {'c': 0.02}, {'c': 0.03}]
+    runs = run_closed_loop_lockstep(grid, SETTINGS, ga_settings=GA_SETTINGS)
+    assert len(runs) == 3
+
+    # Every run agrees with a single-trajectory integration of its own dose schedule
+    for point, run in zip(grid, runs):
+        p = dict(DEFAULT_PARAMETERS, **point)
+        params, t_s = scaled_parameters(p)
+        _, tau = time_grid(p, SETTINGS)
+        columns = run['columns']
+        s_1, s_2 = columns['s_1']*t_s*p['E0'], columns['s_2']*t_s*p['IL0']
+        states = kp_integrate().integrate_trajectory([1.0, 1.0, 1.0], params, tau, s_1=s_1, s_2=s_2)[0]
+
+        np.testing.assert_allclose(np.column_stack((columns['x'], columns['y'], columns['z'])), states,
+                                   rtol=1e-4, atol=1e-8)
+        assert run['metadata']['engine'] == 'lockstep' and run['metadata']['parameters']['c'] == point['c']
+        assert np.all(np.isfinite(columns['Fitness'][:-1]))
+        assert 'amplitude' in run['metadata']['features']
+
+
+def test_lockstep_ga_improves_the_fitness():
+    ga = LockstepGA(2, patience=None, random_seed=1, num_generations=10, sol_per_pop=30, num_parents_mating=6)
+    states = np.array([[1.0, 1.0, 1.0], [0.5, 2.0, 0.2]])
+    environment = {'t': 0, 'states': states}
+    initial = predicted_fitness(ga.population, 0, *(states[:, i, None] for i in range(3))).max(axis=1)
+
+    solutions, fitness, generations = ga.step(environment)
+    assert solutions.shape == (2, 8) and np.all(generations == 10)
+    assert np.all(fitness >= initial)
+    np.testing.assert_allclose(fitness, [predicted_fitness(solution, 0, *state)
+                                         for solution, state in zip(solutions, states)])
+    # The first population, crossover and mutation all take genes from the discrete gene space
+    assert set(np.unique(ga.population)) <= {-10.0, 10.0}
+
+    # and so does the warm-started population of the next step
+    ga.step(environment)
+    assert set(np.unique(ga.population)) <= {-10.0, 10.0}
+
+
+def test_lockstep_rejects_unsupported_settings():
+    with pytest.raises(ValueError, match='cache'):
+        LockstepGA(2, cache={})
+    with pytest.raises(ValueError, match='fitness_func'):
+        run_closed_loop_lockstep([{'c': 0.02}], SETTINGS, ga_settings={'fitness_func': None})
+    with pytest.raises(ValueError):
+        run_closed_loop_lockstep([{'c': 0.02}, {'c': 0.02, 'r_2': 0.2}], SETTINGS)
+
+
+def test_lockstep_sinks():
+    grid = [{'c': 0.01}, {'c': 0.03}]
+    sinks = FeatureSinkSet([TailAmplitude(5)])
+    runs = run_closed_loop_lockstep(grid, SETTINGS, ga_settings=GA_SETTINGS, sinks=sinks)
+    for run in runs:
+        y = run['columns']['y']
+        assert run['metadata']['features']['amplitude'] == pytest.approx(y[-5:].max() - y[-5:].min())
+
+    runs = run_closed_loop_lockstep(grid, SETTINGS, ga_settings=GA_SETTINGS, sinks=False)
+    assert all('features' not in run['metadata'] for run in runs)
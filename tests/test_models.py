@@ -0,0 +1,90 @@
+# Tests of the model layer (Model.models) and the log-coordinate integration
+
+import numpy as np
+import pytest
+
+from Model.integration import kp_integrate
+from Model.models import LogStates, get_model
+from Simulation.parameters import scaled_parameters, time_grid
+
+
+def _finite_difference_jacobian(rhs, t, state, params, h=1e-6):
+    jac = np.empty((len(state), len(state)))
+    for j in range(len(state)):
+        step = h * max(1.0, abs(state[j]))
+        up, down = state.copy(), state.copy()
+        up[j] += step
+        down[j] -= step
+        jac[:, j] = (rhs(t, up[None], params[None])[0] - rhs(t, down[None], params[None])[0]) / (2*step)
+    return jac
+
+
+@pytest.mark.parametrize('name', ['kp', 'kp_dim', 'dixon'])
+def test_model_jacobian_matches_finite_differences(name):
+    model = get_model(name)
+    rng = np.random.default_rng(2)
+    states = rng.uniform(0.5, 2.0, size=(4, model.num_states))
+    params = rng.uniform(0.1, 1.0, size=(4, model.num_params))
+
+    jacobians = model.jacobian(0.0, states, params)
+    assert jacobians.shape == (4, model.num_states, model.num_states)
+    for state, p, jac in zip(states, params, jacobians):
+        np.testing.assert_allclose(jac, _finite_difference_jacobian(model.rhs, 0.0, state, p), rtol=1e-5, atol=1e-8)
+        np.testing.assert_allclose(model.coupled(0.0, state, *p), model.rhs(0.0, state[None], p[None])[0])
+
+
+@pytest.mark.parametrize('name', ['kp', 'dixon'])
+def test_log_states_jacobian_matches_finite_differences(name):
+    model = get_model(name)
+    log_states = LogStates(model)
+    rng = np.random.default_rng(3)
+    u = log_states.to_solver(rng.uniform(0.5, 2.0, size=model.num_states))
+    params = rng.uniform(0.1, 1.0, size=model.num_params)
+
+    np.testing.assert_allclose(log_states.jacobian_single(0.0, u, *params),
+                               _finite_difference_jacobian(log_states.rhs, 0.0, u, params), rtol=1e-5, atol=1e-8)
+    np.testing.assert_allclose(log_states.coupled(0.0, u, *params), log_states.rhs(0.0, u[None], params[None])[0])
+
+
+def test_log_states_round_trip():
+    log_states = LogStates(get_model('kp'))
+    states = np.array([[1e-12, 3.0, 0.0], [2.0, 1e-30, -1.0]])
+    u = log_states.to_solver(states)
+    np.testing.assert_array_equal(u[:, 2], states[:, 2])
+    np.testing.assert_allclose(log_states.from_solver(u), states, rtol=1e-14)
+    np.testing.assert_array_equal(log_states.tolerances(1e-7, 1e-9), [1e-7, 1e-7, 1e-9])
+
+    with pytest.raises(ValueError):
+        log_states.to_solver([0.0, 1.0, 1.0])
+    with pytest.raises(ValueError):
+        LogStates(get_model('kp'), ('w',))
+
+
+def test_log_integration_matches_linear():
+    params = scaled_parameters({'c': 0.02})[0]
+    _, tau = time_grid(None, {'num_steps': 200, 'total_time': 400})
+
+    linear = kp_integrate().integrate_trajectory([1.0, 1.0, 1.0], params, tau)[0]
+    log = kp_integrate(log_states=True).integrate_trajectory([1.0, 1.0, 1.0], params, tau)[0]
+    np.testing.assert_allclose(log, linear, rtol=1e-4, atol=1e-8)
+
+    end = kp_integrate(log_states=True).integrate([1.0, 1.0, 1.0], params, (0.0, 5.0))
+    np.testing.assert_allclose(end, kp_integrate().integrate([1.0, 1.0, 1.0], params, (0.0, 5.0)), rtol=1e-5)
+
+
+def test_log_states_reject_negative_sources():
+    params = scaled_parameters({'c': -0.005})[0]
+    _, tau = time_grid(None, {'num_steps': 20, 'total_time': 40})
+
+    with pytest.raises(ValueError, match='log_states'):
+        kp_integrate(log_states=True).integrate_trajectory([1.0, 1.0, 1.0], params, tau)
+
+    # x is integrated linearly and y in log coordinates
+    states = kp_integrate(log_states=('y',)).integrate_trajectory([1.0, 1.0, 1.0], params, tau)[0]
+    np.testing.assert_allclose(states, kp_integrate().integrate_trajectory([1.0, 1.0, 1.0], params, tau)[0],
+                               rtol=1e-4, atol=1e-8)
+
+    negative_dose = np.full(len(tau), -0.01)
+    with pytest.raises(ValueError):
+        kp_integrate(log_states=True).integrate_trajectory([1.0, 1.0, 1.0], scaled_parameters({'c': 0.02})[0], tau,
+                                                           s_1=negative_dose)
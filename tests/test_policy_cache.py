@@ -0,0 +1,80 @@
+# Tests of the policy cache (GA.policy_cache) and its use by the receding-horizon controller
+
+import numpy as np
+import pytest
+
+from GA.policy_cache import PolicyCache
+
+
+def test_keys_quantize_the_log_state():
+    cache = PolicyCache(resolution=0.5, floor=1e-6)
+    assert cache.key([1.0, 10.0, 0.5]) == (0, 2, -1)
+    assert cache.key([1.0, 1.2, 1.0]) == cache.key([1.0, 1.0, 1.0])
+    assert cache.key([0.0, -1.0, 1e-9]) == cache.key([1e-6, 1e-6, 1e-6])
+    assert cache.key([1.0, 1.0, 1.0], context=(0.5, 2)) == (0, 0, 0, 0.5, 2.0)
+    with pytest.raises(ValueError):
+        PolicyCache(mode='other')
+
+
+def test_lru_eviction_and_stats():
+    cache = PolicyCache(max_size=2)
+    cache.put('a', np.zeros(8), 1.0)
+    cache.put('b', np.ones(8), 2.0)
+    assert cache.get('a')[1] == 1.0  # a is now the most recently used entry
+    cache.put('c', np.ones(8), 3.0)
+
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.get('b') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 2, 'evictions': 1}
+    cache.clear_stats()
+    assert cache.stats()['hits'] == 0 and cache.stats()['size'] == 2
+
+
+def test_merge_keeps_own_entries_first():
+    cache, other = PolicyCache(max_size=3), PolicyCache()
+    cache.put('a', np.zeros(8), 1.0)
+    cache.put('b', np.zeros(8), 1.0)
+    other.put('b', np.ones(8), 5.0)
+    other.put('c', np.ones(8), 5.0)
+    other.put('d', np.ones(8), 5.0)
+
+    cache.merge(other)
+    # New entries come in as least recently used, so they are evicted first
+    assert list(cache.entries) == ['d', 'a', 'b']
+    assert cache.entries['b'][1] == 1.0
+    assert cache.evictions == 1
+    with pytest.raises(ValueError):
+        cache.merge(PolicyCache(resolution=0.1))
+
+
+def test_save_merges_the_file(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    first, second = PolicyCache(path=path), PolicyCache(path=path)
+    first.put(first.key([1.0, 1.0, 1.0]), np.arange(8), 1.0)
+    first.save()
+    second.put(second.key([2.0, 1.0, 1.0], context=(0.5,)), np.ones(8), 2.0)
+    second.save()
+
+    loaded = PolicyCache(path=path)
+    assert set(loaded.entries) == {(0, 0, 0), (6, 0, 0, 0.5)}
+    np.testing.assert_array_equal(loaded.entries[(0, 0, 0)][0], np.arange(8))
+    with pytest.raises(ValueError):
+        PolicyCache().save()
+
+
+def test_controller_reuses_cached_genes():
+    pytest.importorskip('pygad')
+    from GA.controller import RecedingHorizonGA
+
+    cache = PolicyCache()
+    controller = RecedingHorizonGA(random_seed=0, cache=cache, num_generations=3, sol_per_pop=20,
+                                   num_parents_mating=4)
+    environment = {'t': 0, 'x': 1.0, 'y': 1.0, 'z': 1.0}
+    genes, fitness, generations = controller.step(environment)
+    assert generations > 0 and cache.stats()['misses'] == 1
+
+    # A state in the same bin reuses the genes, with their fitness at that state
+    reused, reused_fitness, reused_generations = controller.step(dict(environment, y=1.01))
+    np.testing.assert_array_equal(reused, genes)
+    assert reused_generations == 0 and cache.stats()['hits'] == 1
+    assert reused_fitness == controller._fitness(genes)
@@ -0,0 +1,53 @@
+# Tests of the sensitivity estimators (Simulation.sensitivity)
+
+import numpy as np
+import pytest
+
+from Simulation.sensitivity import lhs_sample, prcc, saltelli_sample, sobol_indices
+
+RANGES = {'a': (0.0, 1.0), 'b': (0.0, 1.0), 'c': (0.0, 1.0)}
+
+
+def test_saltelli_design_layout():
+    names, samples = saltelli_sample(RANGES, n=64, seed=0)
+    assert names == ['a', 'b', 'c']
+    assert samples.shape == (64*5, 3)
+    a, b = samples[:64], samples[64:128]
+    for i in range(3):
+        ab = samples[128 + 64*i:128 + 64*(i + 1)]
+        np.testing.assert_array_equal(ab[:, i], b[:, i])
+        np.testing.assert_array_equal(np.delete(ab, i, axis=1), np.delete(a, i, axis=1))
+
+
+def test_sobol_indices_of_an_additive_function():
+    # f = sum w_i x_i with independent uniform x_i: S1_i = ST_i = w_i^2 / sum w^2
+    weights = np.array([1.0, 2.0, 3.0])
+    _, samples = saltelli_sample(RANGES, n=4096, seed=0)
+    indices = sobol_indices(samples @ weights, 3, num_resamples=50, seed=0)
+
+    expected = weights**2 / np.sum(weights**2)
+    np.testing.assert_allclose(indices['S1'], expected, atol=0.02)
+    np.testing.assert_allclose(indices['ST'], expected, atol=0.02)
+    assert np.all(indices['S1_conf'] > 0) and np.all(indices['S1_conf'] < 0.2)
+
+
+def test_sobol_indices_of_an_interaction():
+    # f = x_a * x_b: the total-order indices of a and b include the interaction, c has no effect
+    _, samples = saltelli_sample(RANGES, n=4096, seed=1)
+    indices = sobol_indices(samples[:, 0]*samples[:, 1], 3, num_resamples=10, seed=0)
+
+    assert np.all(indices['ST'][:2] > indices['S1'][:2] + 0.05)
+    assert abs(indices['S1'][2]) < 0.01 and abs(indices['ST'][2]) < 0.01
+
+
+def test_sobol_indices_check_the_design_size():
+    with pytest.raises(ValueError):
+        sobol_indices(np.zeros(11), 3)
+    assert np.all(np.isnan(sobol_indices(np.ones(50), 3, num_resamples=2)['S1']))
+
+
+def test_prcc_signs():
+    _, samples = lhs_sample(RANGES, n=500, seed=0)
+    output = samples[:, 0] - 2*samples[:, 1]**3
+    coefficients = prcc(samples, output)
+    assert coefficients[0] > 0.8 and coefficients[1] < -0.8 and abs(coefficients[2]) < 0.2
@@ -0,0 +1,113 @@
+# Tests of the early termination checks (Model.termination)
+
+import numpy as np
+import pytest
+
+from Model.integration import kp_integrate
+from Model.models import get_model
+from Model.termination import Termination
+from Simulation.parameters import scaled_parameters, time_grid
+
+
+def _run(c, num_steps, termination=None, **options):
+    params = scaled_parameters({'c': c})[0]
+    _, tau = time_grid(None, {'num_steps': num_steps, 'total_time': 2*num_steps})
+    return tau, kp_integrate().integrate_trajectory([1.0, 1.0, 1.0], params, tau, termination=termination,
+                                                    **options)
+
+
+def _check_all(termination, tau, states, derivatives):
+    termination.start(get_model('kp'), len(tau))
+    for step in range(1, len(tau)):
+        reason = termination.check(step, tau, states, derivatives[step], 1)
+        if reason is not None:
+            return reason, step
+    return None, None
+
+
+def test_horizon_without_detection():
+    termination = Termination()
+    _run(0.02, 200, termination)
+    assert termination.info == {'reason': 'horizon', 'step': 199, 'extrapolated_steps': 0}
+
+
+def test_clearance():
+    termination = Termination(clearance=1e-5)
+    _, (states, _, _) = _run(0.01, 200, termination)
+    info = termination.info
+    assert info['reason'] == 'clearance'
+    assert np.all(states[info['step']:, 1] == 0.0)
+    assert np.all(states[:info['step'], 1] >= 1e-5)
+
+
+def test_clearance_keeps_the_dose_of_the_event_step():
+    termination = Termination(clearance=1e-5)
+    _, (states, s_1, s_2) = _run(0.01, 200, termination, dosing=lambda step, t, state: (0.01, 0.0))
+    step = termination.info['clearance']['step']
+    assert np.all(s_1[1:step+1] == 0.01)
+    assert np.all(s_1[step+1:] == 0.0)
+
+
+def test_clearance_stop_ends_at_the_event_step():
+    termination = Termination(clearance=1e-5, action='stop')
+    _, (states, s_1, _) = _run(0.01, 200, termination)
+    step = termination.info['step']
+    assert termination.info['reason'] == 'clearance'
+    assert len(states) == len(s_1) == step + 1
+    assert states[-1, 1] == 0.0 and states[-2, 1] >= 1e-5
+
+
+def test_clearance_tail_matches_the_integration_without_tumor():
+    termination = Termination(clearance=1e-5)
+    tau, (states, _, _) = _run(0.01, 200, termination)
+    step = termination.info['step']
+    assert termination.info['extrapolated_steps'] == len(tau) - 1 - step
+    # With the tumor at exactly 0 the explicit solver keeps it there
+    params = scaled_parameters({'c': 0.01})[0]
+    tail, _, _ = kp_integrate().integrate_trajectory(states[step], params, tau[step:])
+    np.testing.assert_allclose(states[step:], tail, rtol=1e-4, atol=1e-8)
+
+
+def test_fixed_point():
+    termination = Termination(rtol=1e-4, atol=1e-8)
+    tau, (states, _, _) = _run(-0.005, 2000, termination)
+    _, (full, _, _) = _run(-0.005, 2000)
+    assert termination.info['reason'] == 'fixed_point'
+    assert termination.info['extrapolated_steps'] == len(tau) - 1 - termination.info['step']
+    np.testing.assert_allclose(states, full, rtol=1e-3, atol=1e-6)
+
+
+def test_slow_decay_is_not_a_limit_cycle():
+    termination = Termination()
+    _run(-0.005, 2000, termination)
+    assert termination.info['reason'] == 'horizon'
+
+
+def test_limit_cycle():
+    termination = Termination()
+    tau, (states, _, _) = _run(0.02, 4000, termination)
+    _, (full, _, _) = _run(0.02, 4000)
+    assert termination.info['reason'] == 'limit_cycle'
+    assert termination.info['period'] == pytest.approx(43.61, rel=1e-3)
+    np.testing.assert_allclose(states, full, rtol=2e-2, atol=1e-3)
+
+
+def test_stop_action_shortens_the_run():
+    termination = Termination(rtol=1e-4, atol=1e-8, action='stop')
+    _, (states, s_1, s_2) = _run(-0.005, 2000, termination)
+    assert len(states) == len(s_1) == len(s_2) == termination.info['step'] + 1
+    assert termination.info['extrapolated_steps'] == 0
+
+
+def test_cycle_checks_on_synthetic_oscillations():
+    # A sine wave is a cycle, a wave with a relative amplitude of 1e-6 is not
+    tau = np.linspace(0.0, 100.0, 2001)
+    for amplitude, expected in ((0.5, 'limit_cycle'), (1e-6, None)):
+        x = 1.0 + amplitude*np.sin(2*np.pi*tau/10.0)
+        states = np.column_stack((x, np.ones_like(x), np.ones_like(x)))
+        derivatives = np.column_stack((np.gradient(x, tau), np.zeros_like(x), np.zeros_like(x)))
+        termination = Termination(fixed_point=False)
+        reason, _ = _check_all(termination, tau, states, derivatives)
+        assert reason == expected
+        if expected is not None:
+            assert termination.info['period'] == pytest.approx(10.0, rel=1e-4)
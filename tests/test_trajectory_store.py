@@ -0,0 +1,33 @@
+# Tests of the binary trajectory store (Simulation.trajectory_store)
+
+import numpy as np
+import pytest
+
+from Simulation.trajectory_store import read_header, read_trajectory, write_trajectory
+
+
+def test_kpt_round_trip(tmp_path, sample_run):
+    run = sample_run()
+    path = str(tmp_path / 'run.kpt')
+    write_trajectory(path, run)
+
+    columns, metadata = read_trajectory(path)
+    assert list(columns) == list(run['columns'])
+    for name, values in run['columns'].items():
+        np.testing.assert_array_equal(columns[name], values)
+    assert columns['t'].dtype == np.int64
+    assert metadata['parameters']['c'] == 0.02
+    assert metadata['features'] == {'amplitude': 0.5, 'max1': 1.0}
+
+    y, = read_trajectory(path, columns=['y'], mmap=False)[0].values()
+    np.testing.assert_array_equal(y, run['columns']['y'])
+    with pytest.raises(KeyError):
+        read_trajectory(path, columns=['w'])
+    assert read_header(path)[0]['num_rows'] == 50
+
+
+def test_kpt_rejects_other_files(tmp_path):
+    path = tmp_path / 'run.kpt'
+    path.write_bytes(b'not a trajectory')
+    with pytest.raises(ValueError):
+        read_header(str(path))